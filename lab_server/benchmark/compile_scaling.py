@@ -0,0 +1,51 @@
+"""
+Protocol compilation scaling benchmark.
+
+    cd lab_server && python -m benchmark.compile_scaling --shape chain --sizes 1000 5000 10000 20000
+
+Prints one JSON object per protocol size. `seconds_per_node` should stay flat as the size grows.
+"""
+from pathlib import Path
+from time import perf_counter
+import argparse
+import json
+from lab_server import compile_protocol
+from registry import MachineRegistry
+from run_graph import RunGraph
+from scheduler import create_schedule
+from benchmark.generator import SHAPES
+
+MACHINES_YAML = Path(__file__).resolve().parents[1] / "machines.yaml"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000, 20000])
+    parser.add_argument("--shape", choices=list(SHAPES), default="chain")
+    args = parser.parse_args()
+
+    machines = MachineRegistry(MACHINES_YAML).snapshot.machines
+    for size in args.sizes:
+        protocol = SHAPES[args.shape](size)
+        started = perf_counter()
+        _, operation_list, edge_list = compile_protocol(0, protocol, machines)
+        compiled = perf_counter()
+        graph = RunGraph(operation_list, [(edge["from"], edge["to"]) for edge in edge_list])
+        graphed = perf_counter()
+        create_schedule(graph)
+        finished = perf_counter()
+        print(json.dumps({
+            "shape": args.shape,
+            "operations": size,
+            "connections": len(protocol["connections"]),
+            "nodes": len(graph),
+            "edges": len(edge_list),
+            "compile_seconds": compiled - started,
+            "graph_seconds": graphed - compiled,
+            "plan_seconds": finished - graphed,
+            "seconds_per_node": (finished - started) / len(graph)
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Synthetic protocol.yaml / manipulate.yaml pairs for the benchmarks.
+
+    cd lab_server && python -m benchmark.generator --shape random --operations 2000 --out /tmp/random2000
+
+Every shape uses the operation types of the machines in machines.yaml, so the generated protocols compile as they are.
+"""
+from typing import Dict, List
+from pathlib import Path
+import argparse
+import random
+import yaml
+
+STEP_TYPES = ["ServePlate96", "DispenseLiquid96Wells", "ReadAbsorbance3Colors", "StoreLabware"]
+
+
+def _operations(num_operations):
+    return [{"id": f"step{index}", "type": STEP_TYPES[index % len(STEP_TYPES)]} for index in range(num_operations)]
+
+
+def _transport(source, destination):
+    return {"input": [source, "out1"], "output": [destination, "in1"], "is_data": False}
+
+
+def _data(destination):
+    return {"input": ["input", "volume"], "output": [destination, "volume"], "is_data": True}
+
+
+def chained_protocol(num_operations) -> Dict:
+    """Protocol made of num_operations steps, each one connected to the next one and fed with data from input"""
+    connections = []
+    for index in range(num_operations - 1):
+        connections.append(_transport(f"step{index}", f"step{index + 1}"))
+        connections.append(_data(f"step{index + 1}"))
+    return {"operations": _operations(num_operations), "connections": connections}
+
+
+def fan_protocol(num_operations) -> Dict:
+    """step0 fans out to num_operations - 2 parallel steps which all fan in to the last step"""
+    last = f"step{num_operations - 1}"
+    connections = []
+    for index in range(1, num_operations - 1):
+        connections.append(_transport("step0", f"step{index}"))
+        connections.append(_transport(f"step{index}", last))
+        connections.append(_data(f"step{index}"))
+    return {"operations": _operations(num_operations), "connections": connections}
+
+
+def random_protocol(num_operations, edges_per_operation=2.0, seed=0) -> Dict:
+    """Random DAG: every step gets on average edges_per_operation connections from earlier steps"""
+    rng = random.Random(seed)
+    connections = []
+    for index in range(1, num_operations):
+        num_parents = min(index, max(1, round(rng.expovariate(1 / edges_per_operation))))
+        for parent in rng.sample(range(index), num_parents):
+            connections.append(_transport(f"step{parent}", f"step{index}"))
+        if rng.random() < 0.5:
+            connections.append(_data(f"step{index}"))
+    return {"operations": _operations(num_operations), "connections": connections}
+
+
+SHAPES = {
+    "chain": chained_protocol,
+    "fan": fan_protocol,
+    "random": random_protocol,
+}
+
+
+def manipulates() -> List[Dict]:
+    return [
+        {
+            "name": step_type,
+            "ref": "Operation",
+            "input": [{"id": "in1", "type": "Labware"}, {"id": "volume", "type": "Array[Float]"}],
+            "output": [{"id": "out1", "type": "Labware"}]
+        } for step_type in STEP_TYPES
+    ]
+
+
+def generate(shape: str, num_operations: int) -> Dict:
+    protocol = SHAPES[shape](num_operations)
+    return {
+        "input": [{"id": "volume", "type": "Array[Float]"}],
+        "output": [{"id": "data", "type": "Spread[Array[Float]]"}],
+        **protocol
+    }
+
+
+def dump(protocol: Dict) -> bytes:
+    return yaml.safe_dump(protocol, sort_keys=False).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", choices=list(SHAPES), default="chain")
+    parser.add_argument("--operations", type=int, default=1000)
+    parser.add_argument("--out", type=Path, required=True)
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    (args.out / "protocol.yaml").write_bytes(dump(generate(args.shape, args.operations)))
+    (args.out / "manipulate.yaml").write_bytes(dump(manipulates()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Phase-by-phase benchmark of the lab server on synthetic protocols.
+
+    cd lab_server && python -m benchmark.harness --shapes chain fan random --sizes 100 1000 5000
+
+Prints one JSON object per shape and size with the seconds spent in each phase:
+YAML parsing, connection_to_operation, template compilation, create_process_and_operation_and_edge (journaling),
+shipping the journal to the log store, create_plan and dispatching the operations (no-op tasks).
+With the default http backend the journal is shipped to an in-process MockLogServer whose request counts
+and latencies are reported under "log_server".
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import argparse
+import json
+import os
+from benchmark.generator import SHAPES, dump, generate, manipulates
+from benchmark.mock_log_server import MockLogServer
+
+MACHINES_YAML = Path(__file__).resolve().parents[1] / "machines.yaml"
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.seconds = {}
+
+    def __call__(self, phase, function, *args, **kwargs):
+        started = perf_counter()
+        result = function(*args, **kwargs)
+        self.seconds[phase] = perf_counter() - started
+        return result
+
+
+def run_case(lab_server, shipper, shape, size, max_workers):
+    from executor import execute_dag
+    from machine_pool import MachinePool
+    from registry import MachineRegistry
+    from util import load_yaml
+
+    timer = PhaseTimer()
+    protocol_yaml = dump(generate(shape, size))
+    manipulate_yaml = dump(manipulates())
+    protocol = timer("yaml_parse", load_yaml, protocol_yaml, max_nodes=lab_server.MAX_YAML_NODES)
+    load_yaml(manipulate_yaml, max_nodes=lab_server.MAX_YAML_NODES)
+
+    process_list = lab_server.protocol_processes(protocol)
+    operation_list = [process.operation_mapping() for process in process_list]
+    timer("connection_to_operation", lab_server.connection_to_operation, protocol["connections"], process_list, operation_list)
+    template = timer("compile_template", lab_server.compile_template, protocol)
+
+    machines = MachineRegistry(MACHINES_YAML).snapshot.machines
+    graph = timer(
+        "create_process_and_operation_and_edge",
+        lab_server.create_process_and_operation_and_edge,
+        # 操作は実行しないので共有のmachine_poolには予約を残さない
+        run_id=0, protocol_dict=protocol, machines=machines, template=template, pool=MachinePool()
+    )
+    lab_server.log_journal.sync()
+    timer("log_shipping", shipper.ship)
+
+    edges = [{"from": source, "to": destination} for source, destination in graph.edges()]
+    order = timer("create_plan", lab_server.create_plan, edges)
+    timer(
+        "dispatch",
+        execute_dag,
+        tasks={node: lambda: None for node in order},
+        edges=graph,
+        max_workers=max_workers,
+        order=graph.schedule.priority_order()
+    )
+    return {
+        "shape": shape,
+        "operations": size,
+        "yaml_bytes": len(protocol_yaml),
+        "nodes": len(graph),
+        "edges": len(edges),
+        "seconds": timer.seconds,
+        "total_seconds": sum(timer.seconds.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shapes", choices=list(SHAPES), nargs="+", default=list(SHAPES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--log-backend", choices=["http", "sqlite"], default="http")
+    parser.add_argument("--log-latency", type=float, default=0.0, help="seconds added to every mock log-server request")
+    parser.add_argument("--max-workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        # lab_server reads its configuration when it is imported
+        os.environ["LOG_JOURNAL_DIR"] = str(Path(directory) / "journal")
+        import lab_server
+        from journal import JournalShipper
+        from log_batch import LogWriteBuffer
+        from log_client import LogServerClient
+        from log_store import HttpLogStore, SqliteLogStore
+
+        log_server = None
+        if args.log_backend == "http":
+            log_server = MockLogServer(latency=args.log_latency).start()
+            store = HttpLogStore(LogServerClient(log_server.url))
+        else:
+            store = SqliteLogStore(Path(directory) / "log.sqlite3")
+        lab_server.log_journal.open()
+        # 自動では送らず、ship()を明示的に呼んで計測する
+        shipper = JournalShipper(lab_server.log_journal, LogWriteBuffer(store), poll_interval=3600)
+        shipper.start()
+        try:
+            for shape in args.shapes:
+                for size in args.sizes:
+                    if log_server:
+                        log_server.reset_stats()
+                    result = run_case(lab_server, shipper, shape, size, args.max_workers)
+                    if log_server:
+                        result["log_server"] = log_server.stats()
+                    print(json.dumps(result), flush=True)
+        finally:
+            shipper.stop()
+            lab_server.log_journal.close()
+            store.close()
+            if log_server:
+                log_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+In-process stand-in for the log server: implements the record and bulk endpoints and counts every request.
+"""
+from typing import Dict, List
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from urllib.parse import parse_qs
+import json
+
+
+class MockLogServer:
+    """
+    :param latency: seconds added to every request, to see how the lab server copes with a remote log server
+    :param bulk: serve POST/PATCH /{resource}/bulk, otherwise answer them like a log server without bulk routes
+    """
+
+    def __init__(self, latency=0.0, bulk=True):
+        self.latency = latency
+        self.bulk = bulk
+        self.records: Dict[str, Dict[int, Dict]] = {}
+        self.requests: Dict[str, int] = {}
+        self.durations: List[float] = []
+        self._ids = count(1)
+        self._keys: Dict[str, int] = {}
+        self._lock = Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread: Thread | None = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, name="mock-log-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = {}
+            self.durations = []
+
+    def stats(self):
+        with self._lock:
+            durations = sorted(self.durations)
+        return {
+            "requests": dict(self.requests),
+            "total_requests": len(durations),
+            "mean_seconds": sum(durations) / len(durations) if durations else 0.0,
+            "p99_seconds": durations[int(len(durations) * 0.99)] if durations else 0.0,
+        }
+
+    def _create(self, resource, record):
+        key = record.get("idempotency_key")
+        if key in self._keys:
+            return self._keys[key]
+        db_id = next(self._ids)
+        self.records.setdefault(resource, {})[db_id] = dict(record)
+        if key:
+            self._keys[key] = db_id
+        return db_id
+
+    def _update(self, resource, db_id, attributes):
+        self.records.setdefault(resource, {}).setdefault(db_id, {}).update(attributes)
+
+    def handle(self, method, path, body):
+        """:return: status code and response body"""
+        parts = path.strip("/").split("/")
+        resource = parts[0]
+        with self._lock:
+            if len(parts) == 2 and parts[1] == "bulk":
+                if not self.bulk:
+                    return 405, {"detail": "Method Not Allowed"}
+                if method == "POST":
+                    return 200, {"ids": [self._create(resource, record) for record in body["records"]]}
+                for update in body["updates"]:
+                    self._update(resource, update["id"], update["attributes"])
+                return 200, {}
+            if method == "POST":
+                return 200, {"id": self._create(resource, body)}
+            self._update(resource, int(parts[1]), {body["attribute"]: body["new_value"]})
+            return 200, {}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _body(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    return json.loads(raw)
+                return {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+
+            def _serve(self, method):
+                started = perf_counter()
+                if server.latency:
+                    sleep(server.latency)
+                status, response = server.handle(method, self.path, self._body())
+                data = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                route = f"{method} /{self.path.strip('/').split('/')[0]}/{'bulk' if self.path.rstrip('/').endswith('/bulk') else ''}"
+                with server._lock:
+                    server.requests[route] = server.requests.get(route, 0) + 1
+                    server.durations.append(perf_counter() - started)
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def do_PATCH(self):
+                self._serve("PATCH")
+
+        return Handler
@@ -0,0 +1,92 @@
+from typing import Dict, List
+from pathlib import Path
+from threading import Lock
+import json
+import os
+import pickle
+import shutil
+
+
+class RunCheckpoint:
+    """
+    Local checkpoint of a run under `<directory>/<run_id>/`:
+    run.pickle holds what is needed to rebuild the graph of the run and is written once before it starts,
+    completed.ndjson gets one line per operation, with the names of its artifacts, once they are on disk.
+    Removed when the run completes, so every checkpoint left behind belongs to a run that can be resumed.
+    """
+    directory: Path
+    run_id: int
+
+    def __init__(self, directory, run_id):
+        self.directory = Path(directory) / str(run_id)
+        self.run_id = run_id
+        self._lock = Lock()
+        self._file = None
+        self._removed = False
+
+    @property
+    def state_path(self) -> Path:
+        return self.directory / "run.pickle"
+
+    @property
+    def completed_path(self) -> Path:
+        return self.directory / "completed.ndjson"
+
+    def exists(self) -> bool:
+        return self.state_path.exists()
+
+    def save(self, state: Dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.state_path.with_suffix(".tmp")
+        with open(temporary_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.state_path)
+        self.completed_path.unlink(missing_ok=True)
+
+    def load(self) -> Dict:
+        with open(self.state_path, "rb") as f:
+            return pickle.load(f)
+
+    def completed(self) -> Dict[int, List[str]]:
+        """Completed nodes and the names of the artifacts they left in their storage_address"""
+        if not self.completed_path.exists():
+            return {}
+        with open(self.completed_path, encoding="utf-8") as f:
+            # 書きかけの最後の行は完了していないものとして扱う
+            entries = [json.loads(line) for line in f if line.endswith("\n")]
+        # artifactsのない行は出力がディスクにあるか分からないので実行し直す
+        return {entry["node"]: entry["artifacts"] for entry in entries if "artifacts" in entry}
+
+    def mark_completed(self, node: int, artifacts: List[str]):
+        """Call once the artifacts of node are on disk (StorageWriter.after_written)"""
+        with self._lock:
+            # runが終わって消した後に書き込みが追いついてきても何もしない
+            if self._removed:
+                return
+            if self._file is None:
+                self._file = open(self.completed_path, "a", encoding="utf-8")
+            self._file.write(json.dumps({"node": node, "artifacts": artifacts}) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        with self._lock:
+            self._removed = True
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def run_ids(directory) -> List[str]:
+        """Runs with a checkpoint, i.e. that were interrupted or failed"""
+        directory = Path(directory)
+        if not directory.exists():
+            return []
+        return sorted(path.parent.name for path in directory.glob("*/run.pickle"))
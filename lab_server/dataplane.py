@@ -0,0 +1,144 @@
+from typing import Any, Callable, Dict, List, Tuple
+from io import BytesIO
+from pathlib import Path
+import json
+import numpy as np
+from storage import StorageWriter
+
+PLATE_WELLS = 96
+ABSORBANCE_COLORS = 3
+# 3色それぞれの液量あたりの吸光度と測定ノイズ
+ABSORBANCE_PER_MICROLITER = np.array([0.012, 0.008, 0.004])
+ABSORBANCE_NOISE = 0.01
+
+# (source node, source port, destination node, destination port)
+Flow = Tuple[int, str, int, str]
+OperationModel = Callable[[Dict[str, Any], np.random.Generator], Dict[str, Any]]
+
+
+def serve_plate(inputs, rng):
+    return {"value": np.zeros(PLATE_WELLS)}
+
+
+def dispense_liquid(inputs, rng):
+    """Add `volume` to the wells of the plate, repeated over the plate when it is shorter than 96 wells"""
+    plate = inputs.get("in1")
+    plate = np.zeros(PLATE_WELLS) if plate is None else plate
+    volume = np.asarray(inputs.get("volume", []), dtype=np.float64)
+    if volume.size:
+        plate = plate + np.resize(volume, PLATE_WELLS)
+    return {"out1": plate}
+
+
+def read_absorbance(inputs, rng):
+    """96x3 absorbance of the plate from the liquid volume of every well"""
+    plate = inputs.get("in1")
+    plate = np.zeros(PLATE_WELLS) if plate is None else plate
+    absorbance = np.outer(plate, ABSORBANCE_PER_MICROLITER)
+    absorbance += rng.normal(0.0, ABSORBANCE_NOISE, size=absorbance.shape)
+    return {"out1": plate, "value": np.clip(absorbance, 0.0, None)}
+
+
+def store_labware(inputs, rng):
+    return {}
+
+
+OPERATION_MODELS: Dict[str, OperationModel] = {
+    "ServePlate96": serve_plate,
+    "DispenseLiquid96Wells": dispense_liquid,
+    "ReadAbsorbance3Colors": read_absorbance,
+    "StoreLabware": store_labware,
+}
+
+
+def as_buffer(value):
+    """Numeric lists become float arrays, everything else is passed as it is"""
+    if isinstance(value, list) and all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in value):
+        return np.asarray(value, dtype=np.float64)
+    return value
+
+
+class DataPlane:
+    """
+    Values flowing along the connections of one run.
+    Outputs of an operation are kept as they are and handed to the downstream operations by reference.
+    """
+    flows: List[Flow]
+
+    def __init__(self, flows: List[Flow], inputs: Dict | None = None, seed=None):
+        self.flows = flows
+        self.inputs = {port: as_buffer(value) for port, value in (inputs or {}).items()}
+        self.seed = seed
+        self.outputs: Dict[int, Dict[str, Any]] = {}
+        self._sources: Dict[int, List[Tuple[str, int, str]]] = {}
+        for source, source_port, destination, destination_port in flows:
+            self._sources.setdefault(destination, []).append((destination_port, source, source_port))
+
+    def inputs_of(self, node) -> Dict[str, Any]:
+        return {
+            port: self.outputs[source][source_port]
+            for port, source, source_port in self._sources.get(node, [])
+            if source_port in self.outputs.get(source, {})
+        }
+
+    def run(self, node: int, operation_type: str) -> Dict[str, Any]:
+        """Compute and keep the outputs of node, its upstream operations must have run"""
+        if operation_type == "input":
+            outputs = dict(self.inputs)
+        elif operation_type == "output":
+            outputs = self.inputs_of(node)
+        else:
+            model = OPERATION_MODELS.get(operation_type, store_labware)
+            # ノードごとに独立した乱数列にしてスレッド間で共有しない
+            rng = np.random.default_rng(None if self.seed is None else [self.seed, node])
+            outputs = model(self.inputs_of(node), rng)
+        self.outputs[node] = outputs
+        return outputs
+
+    def restore(self, node: int, directory, artifacts: List[str]):
+        """
+        Outputs of node saved by save_outputs before the run was interrupted
+        :param artifacts: names of the files save_outputs wrote, FileNotFoundError when one of them is missing
+        """
+        directory = Path(directory)
+        outputs = {}
+        for name in artifacts:
+            path = directory / name
+            if name == "data.json":
+                outputs.update(json.loads(path.read_text()))
+            elif path.suffix == ".npy":
+                outputs[path.stem] = load_array(path)
+            elif not path.exists():
+                raise FileNotFoundError(path)
+        self.outputs[node] = outputs
+
+
+def save_outputs(outputs: Dict[str, Any], directory, storage_writer: StorageWriter) -> List[Path]:
+    """
+    Arrays as <port>.npy (see load_array), the other values together in data.json
+    :return: the paths queued on storage_writer
+    """
+    directory = Path(directory)
+    values = {}
+    paths = []
+    for port, value in outputs.items():
+        if isinstance(value, np.ndarray):
+            buffer = BytesIO()
+            np.lib.format.write_array(buffer, value, allow_pickle=False)
+            paths.append(directory / f"{port}.npy")
+            storage_writer.write(paths[-1], buffer.getbuffer())
+        else:
+            values[port] = value
+    if values:
+        paths.append(directory / "data.json")
+        storage_writer.write(paths[-1], json.dumps(values, default=str))
+    return paths
+
+
+def load_array(path, storage_writer: StorageWriter | None = None) -> np.ndarray:
+    """A saved output memory-mapped read-only, or from memory while it is still waiting to be written"""
+    if storage_writer is not None:
+        pending = storage_writer.pending(path)
+        if pending is not None:
+            return np.load(BytesIO(pending), allow_pickle=False)
+    return np.load(path, mmap_mode="r", allow_pickle=False)
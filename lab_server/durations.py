@@ -0,0 +1,165 @@
+from typing import Dict, List
+from datetime import datetime
+from pathlib import Path
+import json
+import numpy as np
+
+
+class DurationModel:
+    """Distribution of the time an operation runs, in seconds"""
+    name: str
+
+    def sample(self, rng: np.random.Generator, size=None):
+        """One duration, or an array of `size` durations"""
+        raise NotImplementedError
+
+    def mean(self) -> float:
+        raise NotImplementedError
+
+    def to_dict(self) -> Dict:
+        raise NotImplementedError
+
+
+class FixedDuration(DurationModel):
+    name = "fixed"
+
+    def __init__(self, seconds):
+        self.seconds = float(seconds)
+
+    def sample(self, rng, size=None):
+        return self.seconds if size is None else np.full(size, self.seconds)
+
+    def mean(self):
+        return self.seconds
+
+    def to_dict(self):
+        return {"distribution": self.name, "seconds": self.seconds}
+
+
+class UniformDuration(DurationModel):
+    name = "uniform"
+
+    def __init__(self, low, high):
+        if not 0 <= low <= high:
+            raise ValueError(f"A uniform duration needs 0 <= low <= high, not {low} and {high}")
+        self.low = float(low)
+        self.high = float(high)
+
+    def sample(self, rng, size=None):
+        return rng.uniform(self.low, self.high, size)
+
+    def mean(self):
+        return (self.low + self.high) / 2
+
+    def to_dict(self):
+        return {"distribution": self.name, "low": self.low, "high": self.high}
+
+
+class NormalDuration(DurationModel):
+    """Normal distribution cut at `minimum` so that durations are never negative"""
+    name = "normal"
+
+    def __init__(self, mean, std, minimum=0.0):
+        self._mean = float(mean)
+        self.std = float(std)
+        self.minimum = float(minimum)
+
+    def sample(self, rng, size=None):
+        return np.maximum(rng.normal(self._mean, self.std, size), self.minimum)
+
+    def mean(self):
+        return max(self._mean, self.minimum)
+
+    def to_dict(self):
+        return {"distribution": self.name, "mean": self._mean, "std": self.std, "minimum": self.minimum}
+
+
+class LogNormalDuration(DurationModel):
+    """Log-normal distribution given by the mean and standard deviation of the durations themselves"""
+    name = "lognormal"
+
+    def __init__(self, mean, std):
+        if mean <= 0 or std < 0:
+            raise ValueError(f"A lognormal duration needs mean > 0 and std >= 0, not {mean} and {std}")
+        self._mean = float(mean)
+        self.std = float(std)
+        self.sigma = float(np.sqrt(np.log1p((self.std / self._mean) ** 2)))
+        self.mu = float(np.log(self._mean) - self.sigma ** 2 / 2)
+
+    def sample(self, rng, size=None):
+        return rng.lognormal(self.mu, self.sigma, size)
+
+    def mean(self):
+        return self._mean
+
+    def to_dict(self):
+        return {"distribution": self.name, "mean": self._mean, "std": self.std}
+
+
+class EmpiricalDuration(DurationModel):
+    """Durations drawn from the ones observed in the past"""
+    name = "empirical"
+
+    def __init__(self, samples: List[float]):
+        self.samples = np.asarray(samples, dtype=np.float64)
+        if not self.samples.size or (self.samples < 0).any():
+            raise ValueError("An empirical duration needs at least one sample and no negative one")
+
+    def sample(self, rng, size=None):
+        return rng.choice(self.samples, size)
+
+    def mean(self):
+        return float(self.samples.mean())
+
+    def to_dict(self):
+        return {"distribution": self.name, "samples": len(self.samples), "mean": self.mean()}
+
+
+# Operation.run の既定の所要時間
+DEFAULT_DURATION = UniformDuration(1, 3)
+
+
+def logged_durations(path, operator_id: str | None = None) -> List[float]:
+    """
+    Durations of the completed operations in a log export (see log.export_ndjson), of one machine when operator_id is given
+    """
+    durations = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            log = json.loads(line)
+            if log.get("status") != "completed" or not log.get("end_time"):
+                continue
+            if operator_id is not None and log.get("operator_id") != operator_id:
+                continue
+            durations.append((datetime.fromisoformat(log["end_time"]) - datetime.fromisoformat(log["start_time"])).total_seconds())
+    return durations
+
+
+def parse_duration(config, base_dir=None, operator_id: str | None = None, allow_logs=True) -> DurationModel:
+    """
+    Duration model of a machine config (see machines.yaml): a number of seconds, or a mapping such as
+    {distribution: normal, mean: 90, std: 10}, {distribution: lognormal, mean: 90, std: 30},
+    {distribution: uniform, low: 1, high: 3}, {distribution: empirical, samples: [...]}
+    or {distribution: empirical, log: exported_logs.ndjson} (relative to base_dir, filtered by operator_id)
+    :param allow_logs: False for configs that must not read local files, a log is then a ValueError
+    """
+    if isinstance(config, (int, float)) and not isinstance(config, bool):
+        return FixedDuration(config)
+    if not isinstance(config, dict):
+        raise ValueError(f"A duration is a number of seconds or a mapping with a distribution, not {config}")
+    distribution = config.get("distribution")
+    if distribution == "fixed":
+        return FixedDuration(config["seconds"])
+    if distribution == "uniform":
+        return UniformDuration(config["low"], config["high"])
+    if distribution == "normal":
+        return NormalDuration(config["mean"], config["std"], config.get("minimum", 0.0))
+    if distribution == "lognormal":
+        return LogNormalDuration(config["mean"], config["std"])
+    if distribution == "empirical":
+        if "samples" in config:
+            return EmpiricalDuration(config["samples"])
+        if not allow_logs:
+            raise ValueError("Empirical durations must list their samples, log files cannot be read here")
+        return EmpiricalDuration(logged_durations(Path(base_dir or ".") / config["log"], operator_id))
+    raise ValueError(f"Unknown duration distribution {distribution}")
@@ -0,0 +1,50 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from scheduler import Adjacency, CycleError
+
+
+def execute_dag(
+        tasks: Dict[Hashable, Callable[[], object]],
+        edges: Iterable[Tuple[Hashable, Hashable]] | Adjacency,
+        max_workers: int,
+        order: List[Hashable] | None = None
+):
+    """
+    Run every task as soon as all of its predecessors have completed
+    :param tasks: node -> callable executed for that node
+    :param edges: (from, to) pairs or the Adjacency of the graph, edges to nodes that are not keys of tasks are ignored
+    :param max_workers: upper bound of tasks running at the same time
+    :param order: optional preferred dispatch order among ready tasks (e.g. create_plan)
+    """
+    graph = Adjacency.of(edges, tasks)
+    indegree = {node: sum(1 for parent in graph.predecessors(node) if parent in tasks) for node in tasks}
+    rank = {node: index for index, node in enumerate(order or [])}
+
+    ready = [node for node, degree in indegree.items() if degree == 0]
+    running = {}
+    finished = 0
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while ready or running:
+            # 優先順位の高いものから空いているworkerに割り当てる
+            ready.sort(key=lambda node: rank.get(node, len(rank)), reverse=True)
+            while ready and len(running) < max_workers:
+                node = ready.pop()
+                running[pool.submit(tasks[node])] = node
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                future.result()
+                finished += 1
+                for child in graph.successors(node):
+                    if child not in indegree:
+                        continue
+                    indegree[child] -= 1
+                    if indegree[child] == 0:
+                        ready.append(child)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    if finished != len(tasks):
+        remaining = [node for node, degree in indegree.items() if degree > 0]
+        raise CycleError(remaining, remaining)
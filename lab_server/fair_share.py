@@ -0,0 +1,96 @@
+from typing import Dict, Generic, Hashable, List, Tuple, TypeVar
+from collections import deque
+from itertools import count
+from threading import Lock
+import heapq
+
+T = TypeVar("T")
+
+
+class FairQueue(Generic[T]):
+    """
+    Start-time fair queuing of items submitted by several tenants.
+    Items with a higher priority are taken first. Within a priority, every tenant gets a share of what is taken
+    proportional to its weight, measured in the `cost` of its items: a tenant that submits a long backlog
+    cannot delay the next item of another tenant by more than one item of its own.
+    Not thread safe, callers hold their own lock.
+    """
+    weights: Dict[Hashable, float]
+    default_weight: float
+
+    def __init__(self, weights: Dict[Hashable, float] | None = None, default_weight=1.0):
+        self.weights = dict(weights or {})
+        self.default_weight = default_weight
+        self._heap: List[Tuple[int, float, int, Hashable, T]] = []
+        self._sequence = count()
+        # 仮想時刻: 最後に取り出した要素の開始タグ
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[Hashable, float] = {}
+        self._depths: Dict[Hashable, int] = {}
+
+    def weight(self, tenant: Hashable) -> float:
+        return self.weights.get(tenant, self.default_weight)
+
+    def push(self, item: T, tenant: Hashable, priority=0, cost=1.0):
+        # 待ちのなかったテナントは現在の仮想時刻から始めるので、過去の空き時間を貯め込めない
+        start = max(self._virtual_time, self._finish_tags.get(tenant, 0.0))
+        self._finish_tags[tenant] = start + cost / self.weight(tenant)
+        heapq.heappush(self._heap, (-priority, start, next(self._sequence), tenant, item))
+        self._depths[tenant] = self._depths.get(tenant, 0) + 1
+
+    def peek(self) -> Tuple[T, Hashable]:
+        _, _, _, tenant, item = self._heap[0]
+        return item, tenant
+
+    def pop(self) -> Tuple[T, Hashable]:
+        """:return: the next item and its tenant, IndexError when empty"""
+        _, start, _, tenant, item = heapq.heappop(self._heap)
+        self._virtual_time = max(self._virtual_time, start)
+        self._depths[tenant] -= 1
+        if not self._depths[tenant]:
+            del self._depths[tenant]
+        return item, tenant
+
+    def depth(self, tenant: Hashable) -> int:
+        return self._depths.get(tenant, 0)
+
+    def depths(self) -> Dict[Hashable, int]:
+        return dict(self._depths)
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class WaitStats:
+    """Recent wait times per tenant, for queue depth and tail latency reporting"""
+    max_samples: int
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self._lock = Lock()
+        self._waits: Dict[Hashable, deque] = {}
+        self._counts: Dict[Hashable, int] = {}
+
+    def observe(self, tenant: Hashable, seconds: float):
+        with self._lock:
+            self._waits.setdefault(tenant, deque(maxlen=self.max_samples)).append(seconds)
+            self._counts[tenant] = self._counts.get(tenant, 0) + 1
+
+    def stats(self) -> Dict[Hashable, Dict]:
+        with self._lock:
+            return {tenant: summarize(waits, self._counts[tenant]) for tenant, waits in self._waits.items()}
+
+
+def summarize(waits, total: int) -> Dict:
+    ordered = sorted(waits)
+    return {
+        "count": total,
+        "mean_wait_seconds": sum(ordered) / len(ordered),
+        "p50_wait_seconds": percentile(ordered, 0.5),
+        "p95_wait_seconds": percentile(ordered, 0.95),
+        "max_wait_seconds": ordered[-1],
+    }
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
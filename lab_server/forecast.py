@@ -0,0 +1,184 @@
+from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
+import numpy as np
+from durations import DurationModel
+from simulation import EventScheduler, VirtualClock, simulate_dag
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Workload:
+    """
+    Runs simulated together in every replica of a forecast, with their machines assigned.
+    Nodes of all the runs are numbered one after the other, the nodes of run i start at run_offsets[i].
+    Sent to the worker processes, so only plain lists and arrays.
+    """
+    machine_ids: List[str]
+    capacities: np.ndarray
+    machine_of: List[int]
+    models: List[DurationModel]
+    model_of: List[int]
+    setup: List[float]
+    teardown: List[float]
+    edges: List[Tuple[int, int]]
+    order: List[int]
+    run_offsets: np.ndarray
+
+    def __init__(self, machine_ids: List[str], capacities: List[int]):
+        self.machine_ids = machine_ids
+        self.capacities = np.asarray(capacities, dtype=np.float64)
+        self._machine_index = {machine_id: index for index, machine_id in enumerate(machine_ids)}
+        self.machine_of = []
+        # 所要時間の分布はノードごとではなく分布ごとにまとめて引く
+        self.models = []
+        self.model_of = []
+        self.setup = []
+        self.teardown = []
+        self.edges = []
+        self.order = []
+        self.run_offsets = np.zeros(0, dtype=np.int64)
+
+    @property
+    def nodes(self) -> int:
+        return len(self.machine_of)
+
+    @property
+    def runs(self) -> int:
+        return len(self.run_offsets)
+
+    def add_run(self, operation_list: List, edges: List[Tuple[int, int]], order: List[int]):
+        """
+        :param order: dispatch priority of the nodes of the run, runs added first keep the priority as in a sweep
+        """
+        offset = self.nodes
+        self.run_offsets = np.append(self.run_offsets, offset)
+        self.machine_of += [
+            -1 if operation.machine_id is None else self._machine_index[operation.machine_id] for operation in operation_list
+        ]
+        for operation in operation_list:
+            model = operation.machine.duration if operation.machine is not None else operation.duration
+            index = next((index for index, known in enumerate(self.models) if known is model), None)
+            if index is None:
+                index = len(self.models)
+                self.models.append(model)
+            self.model_of.append(index)
+            self.setup.append(operation.machine.setup_seconds if operation.machine is not None else 0.0)
+            self.teardown.append(operation.teardown_seconds)
+        self.edges += [(offset + source, offset + destination) for source, destination in edges]
+        self.order += [offset + node for node in order]
+
+    def sample_durations(self, rng: np.random.Generator) -> np.ndarray:
+        """Setup and running time of every node, as Operation.sample_seconds"""
+        durations = np.array(self.setup, dtype=np.float64)
+        model_of = np.asarray(self.model_of)
+        for index, model in enumerate(self.models):
+            nodes = np.flatnonzero(model_of == index)
+            durations[nodes] += model.sample(rng, len(nodes))
+        return durations
+
+    def machine_matrix(self) -> np.ndarray:
+        """nodes x machines indicator, durations @ matrix sums the durations per machine"""
+        matrix = np.zeros((self.nodes, len(self.machine_ids)))
+        machine_of = np.asarray(self.machine_of)
+        on_machine = machine_of >= 0
+        matrix[np.flatnonzero(on_machine), machine_of[on_machine]] = 1.0
+        return matrix
+
+
+def simulate_replicas(workload: Workload, entropy: int, first: int, last: int) -> Dict[str, np.ndarray]:
+    """
+    Simulate replicas first..last-1, replica i draws its durations from SeedSequence(entropy, spawn_key=(i,))
+    so that the results do not depend on how the replicas are split between processes
+    :return: per replica arrays, rows are replicas
+    """
+    replicas = last - first
+    durations = np.empty((replicas, workload.nodes))
+    starts = np.empty((replicas, workload.nodes))
+    machine_of = workload.machine_of
+    machine = lambda node: None if machine_of[node] < 0 else machine_of[node]  # noqa: E731
+    capacities = workload.capacities
+    teardown = np.asarray(workload.teardown, dtype=np.float64)
+    for row, replica in enumerate(range(first, last)):
+        rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(replica,)))
+        durations[row] = workload.sample_durations(rng)
+        scheduler = EventScheduler(VirtualClock(0.0))
+        times = simulate_dag(
+            nodes=range(workload.nodes),
+            edges=workload.edges,
+            duration=durations[row].item,
+            scheduler=scheduler,
+            machine=machine,
+            order=workload.order,
+            capacity=capacities.__getitem__,
+            teardown=workload.teardown.__getitem__
+        )
+        scheduler.run()
+        starts[row] = [times[node][0] for node in range(workload.nodes)]
+    finishes = starts + durations
+    # 先行ノードがすべて終わった時刻から開始までが装置待ち
+    ready = np.zeros((workload.nodes, replicas))
+    if workload.edges:
+        sources, destinations = np.asarray(workload.edges).T
+        np.maximum.at(ready, destinations, finishes.T[sources])
+    waits = starts - ready.T
+    matrix = workload.machine_matrix()
+    return {
+        "makespan": finishes.max(axis=1),
+        "run_finish": np.maximum.reduceat(finishes, workload.run_offsets, axis=1),
+        # 片付けの間も装置は使用中
+        "busy": (durations + teardown) @ matrix,
+        "machine_wait": waits @ matrix,
+    }
+
+
+def forecast(workload: Workload, replicas: int, seed: int | None = None, max_workers: int | None = None, chunk_size=1000) -> Dict:
+    """
+    Simulate independent replicas of the workload on worker processes and summarize them
+    :param seed: same seed, same forecast. A random one is drawn and reported when omitted
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    bounds = [(first, min(first + chunk_size, replicas)) for first in range(0, replicas, chunk_size)]
+    if len(bounds) <= 1:
+        chunks = [simulate_replicas(workload, entropy, first, last) for first, last in bounds]
+    else:
+        # サーバのスレッドを引き継がないようにforkではなくspawnで起動する
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as executor:
+            chunks = list(executor.map(
+                simulate_replicas, repeat(workload), repeat(entropy), *zip(*bounds)
+            ))
+    results = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+    return {"replicas": replicas, "seed": entropy, **summarize(workload, results)}
+
+
+def summarize(workload: Workload, results: Dict[str, np.ndarray]) -> Dict:
+    makespan = results["makespan"]
+    # 稼働率は装置のスロット数あたり
+    utilization = results["busy"] / makespan[:, None] / workload.capacities
+    operations = np.bincount([index for index in workload.machine_of if index >= 0], minlength=len(workload.machine_ids))
+    mean_wait = results["machine_wait"] / np.maximum(operations, 1)
+    throughput = workload.runs / makespan * 3600
+    return {
+        "runs": workload.runs,
+        "makespan_seconds": distribution(makespan),
+        "run_finish_seconds": distribution(results["run_finish"].ravel()),
+        "throughput_runs_per_hour": distribution(throughput),
+        "machines": {
+            machine_id: {
+                "operations_per_replica": int(operations[index]),
+                "utilization": distribution(utilization[:, index]),
+                "queue_wait_seconds": distribution(mean_wait[:, index]),
+            } for index, machine_id in enumerate(workload.machine_ids) if operations[index]
+        },
+    }
+
+
+def distribution(values: np.ndarray) -> Dict:
+    percentiles = np.percentile(values, PERCENTILES)
+    return {
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        **{f"p{percentile}": float(value) for percentile, value in zip(PERCENTILES, percentiles)},
+        "max": float(values.max()),
+    }
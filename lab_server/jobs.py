@@ -0,0 +1,210 @@
+from typing import Callable, Dict, Hashable, List
+from datetime import datetime
+from collections import OrderedDict
+from threading import Condition, Thread
+import logging
+from fair_share import FairQueue, WaitStats
+from metrics import RUN_STAGE_SECONDS, TENANT_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    def __init__(self, tenant, queued_runs, max_queued_runs):
+        super().__init__(f"{tenant} already has {queued_runs} queued runs, at most {max_queued_runs} are admitted")
+        self.tenant = tenant
+
+
+class Job:
+    run_id: int
+    status: str
+    submitted_at: str
+    started_at: str | None
+    finished_at: str | None
+    error: str | None
+    result: object
+    tenant: Hashable
+    priority: int
+    runs: int
+    metadata: Dict
+
+    def __init__(self, run_id, target: Callable[[], object], metadata=None, tenant=None, priority=0, runs=1):
+        self.run_id = run_id
+        self.target = target
+        self.tenant = tenant
+        self.priority = priority
+        self.runs = runs
+        self.status = "queued"
+        self.submitted_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        # targetの戻り値、runでは使わない
+        self.result = None
+        self.metadata = metadata or {}
+
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'tenant': self.tenant,
+            'priority': self.priority,
+            **self.metadata,
+        }
+
+
+class JobQueue:
+    """
+    Background queue executing submitted runs on a fixed number of worker threads.
+    Queued jobs are taken by priority, then fair share between tenants weighted by `weights` (see FairQueue),
+    the cost of a job being its number of runs.
+    At most max_running_runs runs execute at the same time (a batch larger than that runs alone),
+    a tenant with max_queued_runs runs waiting gets QueueFull instead of queuing more.
+    """
+    num_workers: int
+    max_finished_jobs: int
+    max_running_runs: int | None
+    max_queued_runs: int | None
+
+    def __init__(
+            self,
+            num_workers: int,
+            max_finished_jobs: int = 1000,
+            max_running_runs: int | None = None,
+            max_queued_runs: int | None = None,
+            weights: Dict[Hashable, float] | None = None
+    ):
+        self.num_workers = num_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.max_running_runs = max_running_runs
+        self.max_queued_runs = max_queued_runs
+        self._queue: FairQueue[Job] = FairQueue(weights)
+        self._jobs: Dict[int, Job] = OrderedDict()
+        self._condition = Condition()
+        self._queued_runs: Dict[Hashable, int] = {}
+        self._running_runs: Dict[Hashable, int] = {}
+        self._finished_runs: Dict[Hashable, int] = {}
+        self._stopped = False
+        self._workers: List[Thread] = []
+        self.waits = WaitStats()
+
+    def start(self):
+        self._stopped = False
+        for index in range(self.num_workers):
+            worker = Thread(target=self._work, name=f"run-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Execute the jobs already queued, then stop the workers"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def submit(self, run_id, target: Callable[[], object], tenant=None, priority=0, **metadata) -> Job:
+        return self._submit([run_id], Job(run_id, target, metadata, tenant, priority))
+
+    def submit_batch(self, run_ids: List[int], target: Callable[[], object], tenant=None, priority=0, **metadata) -> Job:
+        """One job executing several runs together, its status is reported under each of the run ids"""
+        job = Job(run_ids[0], target, {"run_ids": run_ids, **metadata}, tenant, priority, runs=len(run_ids))
+        return self._submit(run_ids, job)
+
+    def _submit(self, run_ids: List[int], job: Job) -> Job:
+        with self._condition:
+            queued_runs = self._queued_runs.get(job.tenant, 0)
+            if self.max_queued_runs is not None and queued_runs + job.runs > self.max_queued_runs:
+                raise QueueFull(job.tenant, queued_runs, self.max_queued_runs)
+            for run_id in run_ids:
+                self._jobs[run_id] = job
+            self._forget_finished_jobs()
+            self._queued_runs[job.tenant] = queued_runs + job.runs
+            self._queue.push(job, job.tenant, job.priority, cost=job.runs)
+            self._condition.notify()
+        return job
+
+    def get(self, run_id) -> Job | None:
+        with self._condition:
+            return self._jobs.get(run_id)
+
+    def list(self, statuses=("queued", "running")) -> List[Job]:
+        with self._condition:
+            # バッチのjobは複数のrun_idで登録されている
+            jobs = {id(job): job for job in self._jobs.values()}
+            return [job for job in jobs.values() if job.status in statuses]
+
+    def stats(self):
+        """Runs queued, running and completed per tenant, and how long their jobs waited to start"""
+        waits = self.waits.stats()
+        with self._condition:
+            tenants = set(self._queued_runs) | set(self._running_runs) | set(self._finished_runs) | set(waits)
+            return {
+                "running_runs": sum(self._running_runs.values()),
+                "max_running_runs": self.max_running_runs,
+                "max_queued_runs": self.max_queued_runs,
+                "tenants": {
+                    str(tenant): {
+                        "weight": self._queue.weight(tenant),
+                        "queued_jobs": self._queue.depth(tenant),
+                        "queued_runs": self._queued_runs.get(tenant, 0),
+                        "running_runs": self._running_runs.get(tenant, 0),
+                        "finished_runs": self._finished_runs.get(tenant, 0),
+                        "wait": waits.get(tenant),
+                    } for tenant in tenants
+                }
+            }
+
+    def _forget_finished_jobs(self):
+        finished = [run_id for run_id, job in self._jobs.items() if job.status in ("completed", "failed")]
+        for run_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[run_id]
+
+    def _admissible(self) -> bool:
+        """Call with the condition held"""
+        if not len(self._queue):
+            return False
+        running_runs = sum(self._running_runs.values())
+        if self.max_running_runs is None or not running_runs:
+            return True
+        job, _ = self._queue.peek()
+        return running_runs + job.runs <= self.max_running_runs
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._admissible():
+                    if self._stopped and not len(self._queue):
+                        return
+                    self._condition.wait()
+                job, tenant = self._queue.pop()
+                self._queued_runs[tenant] -= job.runs
+                if not self._queued_runs[tenant]:
+                    del self._queued_runs[tenant]
+                self._running_runs[tenant] = self._running_runs.get(tenant, 0) + job.runs
+                job.status = "running"
+                job.started_at = datetime.now().isoformat()
+            wait = (datetime.fromisoformat(job.started_at) - datetime.fromisoformat(job.submitted_at)).total_seconds()
+            RUN_STAGE_SECONDS.labels(execution_mode=job.metadata.get("execution_mode", ""), stage="job_wait").observe(wait)
+            TENANT_WAIT_SECONDS.labels(tenant=str(tenant), queue="runs").observe(wait)
+            self.waits.observe(tenant, wait)
+            try:
+                job.result = job.target()
+                job.status = "completed"
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+                logger.exception("Job %s failed", job.run_id)
+            finally:
+                job.finished_at = datetime.now().isoformat()
+                with self._condition:
+                    self._running_runs[tenant] -= job.runs
+                    if not self._running_runs[tenant]:
+                        del self._running_runs[tenant]
+                    self._finished_runs[tenant] = self._finished_runs.get(tenant, 0) + job.runs
+                    self._condition.notify_all()
@@ -0,0 +1,248 @@
+from typing import Any, Dict, List
+from pathlib import Path
+from threading import Event, Lock, Thread
+import json
+import logging
+import os
+import uuid
+from log_batch import LogWriteBuffer
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ID_PREFIX = "L-"
+
+
+def is_local_id(value) -> bool:
+    return isinstance(value, str) and value.startswith(LOCAL_ID_PREFIX)
+
+
+class LogJournal:
+    """
+    Append-only local journal of log-server writes (NDJSON segments under `directory`).
+    Records are created with client-side ids (`new_id`) so execution never waits for the log server;
+    JournalShipper replays the journal in order and maps them to log-server ids.
+    """
+    directory: Path
+    segment_bytes: int
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self._lock = Lock()
+        self._segment = 1
+        self._file = None
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = self.segments()
+        self._segment = segments[-1] if segments else 1
+        self._file = open(self.segment_path(self._segment), "ab")
+
+    @staticmethod
+    def new_id() -> str:
+        return f"{LOCAL_ID_PREFIX}{uuid.uuid4().hex}"
+
+    def segment_path(self, segment: int) -> Path:
+        return self.directory / f"journal-{segment:08d}.ndjson"
+
+    def segments(self) -> List[int]:
+        return sorted(int(path.stem.split("-")[1]) for path in self.directory.glob("journal-*.ndjson"))
+
+    @property
+    def current_segment(self) -> int:
+        return self._segment
+
+    def create(self, resource: str, records: List[Dict[str, Any]], ids: List[str]):
+        """Values of records that are local ids are replaced by the log-server ids when shipped"""
+        if records:
+            self._append({
+                "type": "create",
+                "resource": resource,
+                "records": [{"local_id": local_id, "record": record} for local_id, record in zip(ids, records)]
+            })
+
+    def update(self, resource: str, db_id, **attributes):
+        self._append({"type": "update", "resource": resource, "id": db_id, "attributes": attributes})
+
+    def _append(self, event: Dict):
+        line = json.dumps(event, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self._file.tell() >= self.segment_bytes:
+                self._file.close()
+                self._segment += 1
+                self._file = open(self.segment_path(self._segment), "ab")
+
+    def sync(self):
+        with self._lock:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._file = None
+
+
+class JournalShipper:
+    """
+    Background thread replaying the journal to the log server in order.
+    Progress (segment and byte offset) and the local-to-log-server id map are kept next to the
+    journal so shipping resumes where it stopped after a restart. Records whose local id is already
+    mapped are never created again, and every record carries its local id as `idempotency_key`.
+    """
+    journal: LogJournal
+    writer: LogWriteBuffer
+    poll_interval: float
+    max_batch_events: int
+
+    def __init__(self, journal: LogJournal, writer: LogWriteBuffer, poll_interval=0.05, max_batch_events=1000):
+        self.journal = journal
+        self.writer = writer
+        self.poll_interval = poll_interval
+        self.max_batch_events = max_batch_events
+        self.state_path = journal.directory / "shipper_state.json"
+        self.ids_path = journal.directory / "shipped_ids.ndjson"
+        self.ids: Dict[str, Any] = {}
+        self.segment = 1
+        self.offset = 0
+        self.shipped_events = 0
+        self.last_error: str | None = None
+        self._stopped = Event()
+        self._thread: Thread | None = None
+        self._ids_file = None
+
+    def _load_state(self):
+        self.segment = self.journal.segments()[0]
+        self.offset = 0
+        if self.state_path.exists():
+            state = json.loads(self.state_path.read_text())
+            self.segment, self.offset = state["segment"], state["offset"]
+        if self.ids_path.exists():
+            with open(self.ids_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        entry = json.loads(line)
+                        self.ids[entry["local_id"]] = entry["id"]
+
+    def _save_state(self):
+        temporary_path = self.state_path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps({"segment": self.segment, "offset": self.offset}))
+        os.replace(temporary_path, self.state_path)
+
+    def start(self):
+        """Call after journal.open()"""
+        self._load_state()
+        self._ids_file = open(self.ids_path, "a", encoding="utf-8")
+        self._stopped.clear()
+        self._thread = Thread(target=self._ship_periodically, name="journal-shipper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.ship()
+        except Exception:
+            logger.warning("Journal not fully shipped, will resume after restart", exc_info=True)
+        self._ids_file.close()
+
+    def resolve(self, value):
+        if is_local_id(value):
+            if value not in self.ids:
+                raise KeyError(f"{value} has not been created on the log server yet")
+            return self.ids[value]
+        return value
+
+    def _read_events(self):
+        """Complete lines from the current position, moving to the next segment when this one is done"""
+        while True:
+            path = self.journal.segment_path(self.segment)
+            events = []
+            offset = self.offset
+            if path.exists():
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n") or len(events) >= self.max_batch_events:
+                            break
+                        offset += len(line)
+                        events.append(json.loads(line))
+            if events or self.segment >= self.journal.current_segment:
+                return events, offset
+            # 送り終わったセグメントは消して次へ
+            path.unlink(missing_ok=True)
+            self.segment += 1
+            self.offset = 0
+            self._save_state()
+
+    def ship(self) -> int:
+        """Ship everything journaled so far, return the number of events shipped"""
+        shipped = 0
+        while True:
+            events, offset = self._read_events()
+            if not events:
+                return shipped
+            self._apply(events)
+            self.writer.flush()
+            self.offset = offset
+            self._save_state()
+            self.shipped_events += len(events)
+            shipped += len(events)
+
+    def _apply(self, events: List[Dict]):
+        pending_creates: List[Dict] = []
+        pending_resource = None
+        for event in events + [None]:
+            if pending_creates and (event is None or event["type"] != "create" or event["resource"] != pending_resource):
+                self._create(pending_resource, pending_creates)
+                pending_creates = []
+            if event is None:
+                break
+            if event["type"] == "create":
+                pending_resource = event["resource"]
+                pending_creates += [entry for entry in event["records"] if entry["local_id"] not in self.ids]
+            else:
+                self.writer.update(
+                    event["resource"],
+                    self.resolve(event["id"]),
+                    **{attribute: self.resolve(value) for attribute, value in event["attributes"].items()}
+                )
+
+    def _create(self, resource: str, entries: List[Dict]):
+        records = [
+            {
+                **{attribute: self.resolve(value) for attribute, value in entry["record"].items()},
+                "idempotency_key": entry["local_id"]
+            } for entry in entries
+        ]
+        db_ids = self.writer.create(resource, records)
+        for entry, db_id in zip(entries, db_ids):
+            self.ids[entry["local_id"]] = db_id
+            self._ids_file.write(json.dumps({"local_id": entry["local_id"], "id": db_id}) + "\n")
+        self._ids_file.flush()
+
+    def _ship_periodically(self):
+        backoff = self.poll_interval
+        while not self._stopped.wait(backoff):
+            try:
+                self.journal.sync()
+                self.ship()
+                self.last_error = None
+                backoff = self.poll_interval
+            except Exception as e:
+                # ログサーバーが落ちていても実行は止めずに後で再送する
+                self.last_error = f"{type(e).__name__}: {e}"
+                backoff = min(backoff * 2, 30.0)
+
+    def stats(self):
+        return {
+            "segment": self.segment,
+            "offset": self.offset,
+            "journal_segment": self.journal.current_segment,
+            "shipped_events": self.shipped_events,
+            "mapped_ids": len(self.ids),
+            "last_error": self.last_error,
+        }
@@ -1,27 +1,162 @@
-from typing import List, Dict, TypedDict
+from typing import List, Dict, Hashable, Set, Tuple, TypedDict
 from datetime import datetime
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, Request, Response, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from itertools import count, product
+from threading import Lock
 from timestamp import timestamp, timestamp_filename
 # from time import sleep
 from pathlib import Path
 # from random import uniform
 # from pathlib import Path
 from log import OperationLog, TransportLog
-from io import StringIO
-from machines import HumanPlateServer, TecanFluent480, OpentronsOT2, TecanInfinite200Pro, HumanStoreLabware
-from util import calculate_md5
+from util import load_yaml, YamlTooLargeError
 from lib_operator import Operator
-from time import sleep
-from random import uniform
+from durations import DEFAULT_DURATION, DurationModel
+from executor import execute_dag
+from jobs import JobQueue, QueueFull
+from log_client import LogServerClient
+from log_batch import LogWriteBuffer
+from log_store import create_log_store
+from journal import LogJournal, JournalShipper
+from storage import StorageWriter, sharded_path
+from dataplane import DataPlane, save_outputs
+from checkpoint import RunCheckpoint
+from labware import Route, fuse_transports
+from planner import RunPlan, plan_run
+from forecast import Workload, forecast
+from run_graph import RunGraph
+from scheduler import Adjacency, CycleError, Schedule, create_schedule
+from protocol_cache import ProtocolCache
+from protocol_template import TEMPLATE_FORMAT, CompiledProtocol, ProtocolTemplate
+from registry import MachineRegistry
+from machine_pool import MachinePool, ASSIGNMENT_POLICIES, assign_machines
+from simulation import EXECUTION_MODES, EventScheduler, VirtualClock, simulate_dag
+from metrics import (
+    OPERATION_EXECUTION_SECONDS, OPERATION_QUEUE_SECONDS, OPERATIONS, REQUEST_SECONDS, RUN_STAGE_SECONDS,
+    SUBMISSION_STAGE_SECONDS, RunTrace, timed
+)
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from time import perf_counter, sleep, time
 # from lib_operator import Operator
 # from .operator import Operator
 import yaml
-import requests
-import random
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
 
 LOG_SERVER_URL = 'http://log_server:8000'
+MAX_PARALLEL_OPERATIONS = int(os.environ.get("MAX_PARALLEL_OPERATIONS", 8))
+RUN_WORKERS = int(os.environ.get("RUN_WORKERS", 4))
+# runs executing at the same time over all workers, a sweep counts as its number of runs
+MAX_RUNNING_RUNS = int(os.environ.get("MAX_RUNNING_RUNS", 0)) or None
+MAX_QUEUED_RUNS_PER_TENANT = int(os.environ.get("MAX_QUEUED_RUNS_PER_TENANT", 0)) or None
+# project: runs and machines are shared fairly between projects, user: between users
+FAIR_SHARE_BY = os.environ.get("FAIR_SHARE_BY", "project")
+# e.g. {"project:1": 2, "user:7": 0.5}, tenants not listed have weight 1
+TENANT_WEIGHTS = json.loads(os.environ.get("TENANT_WEIGHTS", "{}"))
+# 装置が決まる前の見積もり、テンプレートのscheduleで使う
+EXPECTED_OPERATION_SECONDS = DEFAULT_DURATION.mean()
+MACHINE_ASSIGNMENT_POLICY = os.environ.get("MACHINE_ASSIGNMENT_POLICY", "critical_path")
+# realtime: operations sleep for their duration, simulated: a virtual clock is advanced instead
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "realtime")
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 16 * 1024 * 1024))
+MAX_YAML_NODES = int(os.environ.get("MAX_YAML_NODES", 1_000_000))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+MAX_SWEEP_RUNS = int(os.environ.get("MAX_SWEEP_RUNS", 1000))
+MAX_FORECAST_REPLICAS = int(os.environ.get("MAX_FORECAST_REPLICAS", 1_000_000))
+# worker processes of a forecast, every core when unset
+FORECAST_WORKERS = int(os.environ.get("FORECAST_WORKERS", 0)) or None
+# per-run trace spans are written here as <run_id>.ndjson when set, e.g. /storage/traces
+TRACE_DIR = os.environ.get("TRACE_DIR") or None
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT", "/storage")
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "/storage/checkpoints")
+LOG_SERVER_TIMEOUT = float(os.environ.get("LOG_SERVER_TIMEOUT", 10))
+LOG_SERVER_RETRIES = int(os.environ.get("LOG_SERVER_RETRIES", 3))
+# http: LOG_SERVER_URL, sqlite: embedded database at LOG_SQLITE_PATH
+LOG_BACKEND = os.environ.get("LOG_BACKEND", "http")
+LOG_SQLITE_PATH = os.environ.get("LOG_SQLITE_PATH", "/storage/log.sqlite3")
+# drop the transports of a run that do not move the labware to another machine (see fuse_transports)
+FUSE_TRANSPORTS = os.environ.get("FUSE_TRANSPORTS", "1") == "1"
+
+job_queue = JobQueue(
+    num_workers=RUN_WORKERS,
+    max_running_runs=MAX_RUNNING_RUNS,
+    max_queued_runs=MAX_QUEUED_RUNS_PER_TENANT,
+    weights=TENANT_WEIGHTS
+)
+protocol_cache = ProtocolCache(
+    max_entries=int(os.environ.get("PROTOCOL_CACHE_ENTRIES", 128)),
+    max_bytes=int(os.environ.get("PROTOCOL_CACHE_BYTES", 64 * 1024 * 1024)),
+    persist_dir=os.environ.get("PROTOCOL_CACHE_DIR") or None
+)
+# forecasts use every core, so they are executed one at a time
+forecast_queue = JobQueue(num_workers=1)
+forecast_ids = count(1)
+# 操作の所要時間を引く乱数
+duration_rng = np.random.default_rng()
+# predictions of /dry_run by protocol, policy and machines, the editor asks again for unchanged protocols
+plan_cache = ProtocolCache(
+    max_entries=int(os.environ.get("PLAN_CACHE_ENTRIES", 256)),
+    max_bytes=int(os.environ.get("PLAN_CACHE_BYTES", 16 * 1024 * 1024))
+)
+machine_pool = MachinePool(weights=TENANT_WEIGHTS)
+machine_registry = MachineRegistry(os.environ.get("MACHINES_CONFIG", Path(__file__).resolve().parent / "machines.yaml"))
+log_client = LogServerClient(
+    LOG_SERVER_URL,
+    timeout=LOG_SERVER_TIMEOUT,
+    retries=LOG_SERVER_RETRIES,
+    pool_maxsize=MAX_PARALLEL_OPERATIONS * RUN_WORKERS
+)
+log_store = create_log_store(LOG_BACKEND, log_client, LOG_SQLITE_PATH)
+log_writer = LogWriteBuffer(log_store)
+log_journal = LogJournal(os.environ.get("LOG_JOURNAL_DIR", "/storage/journal"))
+storage_writer = StorageWriter(
+    fsync=os.environ.get("STORAGE_FSYNC", "1") == "1",
+    flush_timeout=float(os.environ.get("STORAGE_FLUSH_TIMEOUT", 60.0))
+)
+journal_shipper = JournalShipper(log_journal, log_writer, poll_interval=float(os.environ.get("LOG_FLUSH_INTERVAL", 0.05)))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    machine_registry.reload()
+    log_journal.open()
+    journal_shipper.start()
+    storage_writer.start()
+    job_queue.start()
+    forecast_queue.start()
+    yield
+    forecast_queue.stop()
+    job_queue.stop()
+    storage_writer.stop()
+    journal_shipper.stop()
+    log_journal.close()
+    await log_store.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
 
-app = FastAPI()
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    started = perf_counter()
+    response = await call_next(request)
+    # 未定義のパスはまとめてラベルが増えすぎないようにする
+    route = request.scope.get("route")
+    REQUEST_SECONDS.labels(
+        endpoint=route.path if route else "unmatched",
+        method=request.method,
+        status=response.status_code
+    ).observe(perf_counter() - started)
+    return response
 
 
 class Connection(TypedDict):
@@ -48,6 +183,20 @@ class Operation:
     storage_address: str
     is_transport: bool
     is_data: bool
+    process_type: str | None
+    machine_type: str | None
+    machine_id: str | None
+    machine: Operator | None
+    reservation: Tuple[MachinePool, float] | None
+    duration: DurationModel
+    data: Dict | None
+    dataplane: DataPlane | None
+    node: int | None
+    trace: RunTrace | None
+    checkpoint: RunCheckpoint | None
+    tenant: str | None
+    priority: int
+    route: Route | None
 
     def __init__(
             self,
@@ -56,7 +205,9 @@ class Operation:
             name,
             storage_address,
             is_transport,
-            is_data
+            is_data,
+            process_type=None,
+            machine_type=None
     ):
         self.process_db_id = process_db_id
         self.process_name = process_name
@@ -67,78 +218,164 @@ class Operation:
         self.storage_address = storage_address
         self.is_transport = is_transport
         self.is_data = is_data
+        self.process_type = process_type
+        # 装置の型、装置のない組み込みの操作と搬送はNone (compile_protocolで決まる)
+        self.machine_type = machine_type
+        self.machine_id = None
+        self.machine = None
+        # assign_machinesが予約したpoolと負荷、実行を終えるか実行されずに終わったときに返す
+        self.reservation = None
+        # 装置のない操作の所要時間、装置に割り当てられた操作は装置の設定に従う
+        self.duration = DEFAULT_DURATION
+        # 出力ポートごとの値、dataplaneがあるときにcompleteで計算する
+        self.data = None
+        self.dataplane = None
+        self.node = None
+        self.trace = None
+        self.checkpoint = None
+        self.tenant = None
+        self.priority = 0
+        # 搬送の物理的な経路、fuse_transportsで決まる
+        self.route = None
 
-    def post(self):
-        response = requests.post(
-            url=f'{LOG_SERVER_URL}/operations/',
-            data={
-                "process_id": self.process_db_id,
-                "name": self.name,
-                "status": self.status,
-                "storage_address": "",
-                "is_transport": self.is_transport,
-                "is_data": self.is_data
-            }
-        )
-        self.db_id = response.json()["id"]
-        self.storage_address = f"/storage/operations/{self.db_id}"
-        requests.patch(
-            url=f'{LOG_SERVER_URL}/operations/{self.db_id}',
-            data={
-                "attribute": "storage_address",
-                "new_value": self.storage_address
-            }
-        )
+    def to_record(self):
+        return {
+            "process_id": self.process_db_id,
+            "name": self.name,
+            "status": self.status,
+            "storage_address": self.storage_address,
+            "is_transport": self.is_transport,
+            "is_data": self.is_data
+        }
+
+    def assign_db_id(self, db_id):
+        self.db_id = db_id
+        self.storage_address = str(sharded_path(STORAGE_ROOT, "operations", self.db_id))
+
+    def checkpoint_state(self) -> Dict:
+        return {
+            "db_id": self.db_id,
+            "process_db_id": self.process_db_id,
+            "process_name": self.process_name,
+            "name": self.name,
+            "storage_address": self.storage_address,
+            "is_transport": self.is_transport,
+            "is_data": self.is_data,
+            "process_type": self.process_type,
+            "machine_type": self.machine_type,
+            "machine_id": self.machine_id,
+            "machine": self.machine,
+            "duration": self.duration,
+            "route": self.route
+        }
+
+    @classmethod
+    def from_checkpoint_state(cls, state: Dict) -> "Operation":
+        state = dict(state)
+        db_id = state.pop("db_id")
+        machine_id = state.pop("machine_id")
+        route = state.pop("route", None)
+        # 再開したrunは中断前と同じ所要時間の設定で動く
+        machine = state.pop("machine", None)
+        duration = state.pop("duration", DEFAULT_DURATION)
+        operation = cls(**state)
+        operation.db_id = db_id
+        operation.machine_id = machine_id
+        operation.machine = machine
+        operation.duration = duration
+        operation.route = route
+        return operation
+
+    def bind_machine(self, machine: Operator):
+        self.machine_id = machine.id
+        self.name = machine.id
+        self.machine = machine
+
+    def sample_seconds(self, rng: np.random.Generator) -> float:
+        """Time before the successors can start, setup included"""
+        if self.machine is not None:
+            return self.machine.sample_seconds(rng)
+        return float(self.duration.sample(rng))
+
+    def expected_seconds(self) -> float:
+        if self.machine is not None:
+            return self.machine.expected_seconds()
+        return self.duration.mean()
+
+    @property
+    def teardown_seconds(self) -> float:
+        return self.machine.teardown_seconds if self.machine is not None else 0.0
+
+    def occupied_seconds(self) -> float:
+        return self.expected_seconds() + self.teardown_seconds
+
+    def release_reservation(self):
+        """Give back the load assign_machines reserved for this operation, at most once"""
+        if self.reservation is not None:
+            pool, reserved = self.reservation
+            self.reservation = None
+            pool.release(self.machine_id, reserved)
+
+    @property
+    def operation_type(self) -> str:
+        if self.is_transport:
+            return "transport"
+        return self.machine_type or self.process_type or self.process_name
 
     def run(self):
+        # 他のrunが同じ装置を使っている間は待つ
+        if self.machine_id is not None:
+            machine = machine_pool.acquire(self.machine_id, self.tenant, self.priority, self.occupied_seconds(), teardown=self.teardown_seconds)
+        else:
+            machine = nullcontext()
+        labels = {"machine_id": self.machine_id or "", "operation_type": self.operation_type}
+        status = "failed"
+        queued_at = time()
+        started_at = None
+        try:
+            with machine:
+                started_at = time()
+                OPERATION_QUEUE_SECONDS.labels(**labels).observe(started_at - queued_at)
+                self._run()
+                status = "completed"
+        finally:
+            finished_at = time()
+            OPERATIONS.labels(status=status, **labels).inc()
+            if started_at is not None:
+                OPERATION_EXECUTION_SECONDS.labels(**labels).observe(finished_at - started_at)
+            if self.trace is not None:
+                self.trace.record("queue", queued_at, started_at or finished_at, operation=self.db_id, **labels)
+                if started_at is not None:
+                    self.trace.record("operation", started_at, finished_at, operation=self.db_id, status=status, **labels)
+            self.release_reservation()
 
-        self.started_at = datetime.now().isoformat()
+    def _run(self):
+        self.start(datetime.now().isoformat())
+        sleep(self.sample_seconds(duration_rng))
+        self.complete(datetime.now().isoformat())
+
+    def start(self, started_at):
+        self.started_at = started_at
         self.status = "running"
-        storage_path = Path(self.storage_address)
-        storage_path.mkdir(parents=True, exist_ok=True)
-        requests.patch(
-            url=f'{LOG_SERVER_URL}/operations/{self.db_id}',
-            data={
-                "attribute": "started_at",
-                "new_value": self.started_at
-            }
-        )
-        requests.patch(
-            url=f'{LOG_SERVER_URL}/operations/{self.db_id}',
-            data={
-                "attribute": "status",
-                "new_value": self.status
-            }
-        )
-        running_time = uniform(1, 3)
-        sleep(running_time)
-        self.finished_at = datetime.now().isoformat()
+        log_journal.update("operations", self.db_id, started_at=self.started_at, status=self.status)
+
+    def complete(self, finished_at):
+        self.finished_at = finished_at
         self.status = "completed"
-        with open(storage_path / "log.txt", "w") as f:
-            f.write(f"Operation {self.name} completed at {self.finished_at}")
-        with open(storage_path / "log.txt", "r") as f:
-            log = f.read()
-            requests.patch(
-                url=f'{LOG_SERVER_URL}/operations/{self.db_id}',
-                data={
-                    "attribute": "log",
-                    "new_value": log
-                }
-            )
-        requests.patch(
-            url=f'{LOG_SERVER_URL}/operations/{self.db_id}',
-            data={
-                "attribute": "finished_at",
-                "new_value": self.finished_at
-            }
-        )
-        requests.patch(
-            url=f'{LOG_SERVER_URL}/operations/{self.db_id}',
-            data={
-                "attribute": "status",
-                "new_value": self.status
-            }
-        )
+        storage_path = Path(self.storage_address)
+        # ディスクへの書き込みはstorage_writerに任せ、ログは手元の内容をそのまま送る
+        log = f"Operation {self.name} completed at {self.finished_at}"
+        if self.route is not None:
+            log += f", moved {self.route}"
+        artifacts = [storage_path / "log.txt"]
+        storage_writer.write(artifacts[0], log)
+        if self.dataplane is not None:
+            self.data = self.dataplane.run(self.node, self.operation_type)
+            artifacts += save_outputs(self.data, storage_path, storage_writer)
+        log_journal.update("operations", self.db_id, log=log, finished_at=self.finished_at, status=self.status)
+        if self.checkpoint is not None:
+            # 出力がディスクに書かれるまでは完了として記録しない、落ちたら再開時に実行し直す
+            storage_writer.after_written(artifacts, partial(self.checkpoint.mark_completed, self.node, [path.name for path in artifacts]))
 
 
 class Process:
@@ -154,29 +391,21 @@ class Process:
         self.id_in_protocol = id_in_protocol
         self.storage_address = storage_address
 
-    def post(self):
-        response = requests.post(
-            url=f'{LOG_SERVER_URL}/processes/',
-            data={
-                "name": self.id_in_protocol,
-                "run_id": self.run_id,
-                "storage_address": ""
-            }
-        )
-        self.db_id = response.json()["id"]
-        self.storage_address = f"/storage/processes/{self.db_id}"
-        requests.patch(
-            url=f'{LOG_SERVER_URL}/processes/{self.db_id}',
-            data={
-                    "attribute": "storage_address",
-                    "new_value": self.storage_address
-            }
-        )
+    def to_record(self):
+        return {
+            "name": self.id_in_protocol,
+            "run_id": self.run_id,
+            "storage_address": self.storage_address
+        }
+
+    def assign_db_id(self, db_id):
+        self.db_id = db_id
+        self.storage_address = str(sharded_path(STORAGE_ROOT, "processes", self.db_id))
 
-    def operation_mapping(self, machines: List[Operator]) -> Operation:
+    def operation_mapping(self) -> Operation:
         if self.id_in_protocol in ["input", "output"]:
             operation = Operation(
-                process_db_id=self.db_id,
+                process_db_id=None,
                 process_name=self.id_in_protocol,
                 name=self.id_in_protocol,
                 storage_address='storage/operation',
@@ -184,19 +413,25 @@ class Process:
                 is_data=False
             )
             return operation
-        suit_machine = random.choice([machine for machine in machines if machine.type == self.type])
+        # 装置のある型ならcompile_protocolのassign_machinesで割り当てる、組み込みの型はcompile_templateで外す
         operation = Operation(
-            process_db_id=self.db_id,
+            process_db_id=None,
             process_name=self.id_in_protocol,
-            name=suit_machine.id,
+            name=self.type,
             storage_address='storage/operation',
             is_transport=False,
-            is_data=False
+            is_data=False,
+            process_type=self.type,
+            machine_type=self.type
         )
         return operation
 
 
 def connection_to_operation(connection_list: List[Connection], process_list: List[Process], operation_list: List[Operation]):
+    """
+    Turn protocol connections into transport operations and edges between node ids.
+    Node ids are positions in operation_list followed by the returned transport operations.
+    """
     connections = [{
         "input_source": connection['input'][0],
         "input_content": connection['input'][1],
@@ -204,37 +439,65 @@ def connection_to_operation(connection_list: List[Connection], process_list: Lis
         "output_content": connection['output'][1],
         "is_data": connection['is_data']
     } for connection in connection_list]
+    process_by_protocol_id = {process.id_in_protocol: process for process in process_list}
+    node_by_protocol_id = {}
+    for node, operation in enumerate(operation_list):
+        node_by_protocol_id.setdefault(operation.process_name, node)
     operation_list_from_connection = []
     edge_list = []
     for connection in connections:
-        source_process = [process for process in process_list if process.id_in_protocol == connection['input_source']][0]
+        node_from = node_by_protocol_id[connection['input_source']]
+        node_to = node_by_protocol_id[connection['output_source']]
+        if connection["is_data"]:
+            edge_list.append({"from": node_from, "to": node_to})
+            continue
+        source_process = process_by_protocol_id[connection['input_source']]
         operation = Operation(
-            process_db_id=source_process.db_id,
+            process_db_id=None,
             process_name=source_process.id_in_protocol,
             name=f"{connection['input_source']}_{connection['input_content']}_{connection['output_source']}_{connection['output_content']}",
             storage_address='storage/operation',
             is_transport=True,
             is_data=connection["is_data"]
         )
-        operation_name_from = [operation.name for operation in operation_list if operation.process_name == connection['input_source']][0]
-        operation_name_to = [operation.name for operation in operation_list if operation.process_name == connection['output_source']][0]
-        if connection["is_data"]:
-            edge_list.append({"from": operation_name_from, "to": operation_name_to})
-        else:
-            operation_list_from_connection.append(operation)
-            edge_list.append({"from": operation_name_from, "to": operation.name})
-            edge_list.append({"from": operation.name, "to": operation_name_to})
+        node_transport = len(operation_list) + len(operation_list_from_connection)
+        operation_list_from_connection.append(operation)
+        edge_list.append({"from": node_from, "to": node_transport})
+        edge_list.append({"from": node_transport, "to": node_to})
 
     return operation_list_from_connection, edge_list
 
 
-def create_process_and_operation_and_edge(run_id, protocol_dict, machines):
-    processes = protocol_dict["operations"]
-    connections = protocol_dict["connections"]
+def validate_protocol(protocol_dict, manipulates):
+    if not isinstance(protocol_dict, dict) or not isinstance(manipulates, list):
+        raise ValueError("protocol_yaml must be a mapping and manipulate_yaml a list")
+    manipulate_names = {manipulate.get('name') for manipulate in manipulates if isinstance(manipulate, dict)}
+    process_ids = {"input", "output"}
+    for process in protocol_dict.get("operations") or []:
+        if not isinstance(process, dict) or "id" not in process or "type" not in process:
+            raise ValueError(f"Every operation needs an id and a type: {process}")
+        if process["id"] in process_ids:
+            raise ValueError(f"Operation id {process['id']} is used more than once")
+        if process["type"] not in manipulate_names:
+            raise ValueError(f"Operation {process['id']} has type {process['type']} which is not in manipulate_yaml")
+        process_ids.add(process["id"])
+    for connection in protocol_dict.get("connections") or []:
+        try:
+            ends = [connection['input'][0], connection['input'][1], connection['output'][0], connection['output'][1]]
+            connection['is_data']
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"Malformed connection: {connection}")
+        for source in (ends[0], ends[2]):
+            if source not in process_ids:
+                raise ValueError(f"Connection refers to unknown operation {source}")
+
 
+def protocol_processes(protocol_dict) -> List[Process]:
+    """Processes of a protocol without a run, followed by the input and output processes"""
+    processes = protocol_dict.get("operations") or []
     process_list = [
         Process(
-            run_id=run_id,
+            run_id=None,
             type=process["type"],
             id_in_protocol=process["id"],
             storage_address=f'process/{process["id"]}'
@@ -242,138 +505,930 @@ def create_process_and_operation_and_edge(run_id, protocol_dict, machines):
     ]
 
     input_process = Process(
-        run_id=run_id,
+        run_id=None,
         type="input",
         id_in_protocol="input",
         storage_address=""
     )
     output_process = Process(
-        run_id=run_id,
+        run_id=None,
         type="output",
         id_in_protocol="output",
         storage_address=""
     )
 
-    process_list += [input_process, output_process]
-    [process.post() for process in process_list]
+    return process_list + [input_process, output_process]
+
+
+def builtin_operation_types(manipulates) -> Set[str]:
+    """Operation types the lab server runs itself on no machine, `ref: BuiltinOperation` in manipulate.yaml"""
+    return {
+        manipulate['name'] for manipulate in manipulates
+        if isinstance(manipulate, dict) and manipulate.get('ref') == 'BuiltinOperation' and 'name' in manipulate
+    }
+
 
-    operation_list = [process.operation_mapping(machines=machines) for process in process_list]
+def compile_template(protocol_dict, manipulates: List[Dict] | None = None) -> ProtocolTemplate:
+    """
+    :param manipulates: manipulate definitions of the protocol, those of the registry when omitted
+    """
+    if manipulates is None:
+        manipulates = list(machine_registry.snapshot.manipulates.values())
+    builtin_types = builtin_operation_types(manipulates)
+    connections = protocol_dict.get("connections") or []
+    process_list = protocol_processes(protocol_dict)
+    operation_list = [process.operation_mapping() for process in process_list]
+    for operation in operation_list:
+        if operation.machine_type in builtin_types:
+            operation.machine_type = None
+    node_by_protocol_id = {}
+    for node, operation in enumerate(operation_list):
+        node_by_protocol_id.setdefault(operation.process_name, node)
+    flows = [
+        (node_by_protocol_id[connection['input'][0]], connection['input'][1], node_by_protocol_id[connection['output'][0]], connection['output'][1])
+        for connection in connections
+    ]
     operation_list_from_connection, edge_list = connection_to_operation(connections, process_list, operation_list)
+    # connection_to_operationは搬送を接続の順に後ろへ追加する
+    transports = dict(zip(
+        range(len(operation_list), len(operation_list) + len(operation_list_from_connection)),
+        [flow for flow, connection in zip(flows, connections) if not connection['is_data']]
+    ))
     operation_list += operation_list_from_connection
-    [operation.post() for operation in operation_list]
-
-    edge_db_id_list = []
-    for edge in edge_list:
-        operation_db_id_from = [operation.db_id for operation in operation_list if operation.name == edge["from"]][0]
-        operation_db_id_to = [operation.db_id for operation in operation_list if operation.name == edge["to"]][0]
-        edge_db_id_list.append({
-            "from": operation_db_id_from,
-            "to": operation_db_id_to
-        })
-
-    for edge in edge_db_id_list:
-        response = requests.post(
-            url=f'{LOG_SERVER_URL}/edges/',
-            data={
-                "run_id": run_id,
-                "from_id": edge["from"],
-                "to_id": edge["to"]
-            }
-        )
-    return operation_list, edge_list
+    graph = Adjacency([(edge["from"], edge["to"]) for edge in edge_list], nodes=range(len(operation_list)))
+    try:
+        schedule = create_schedule(graph, durations=lambda node: EXPECTED_OPERATION_SECONDS)
+    except CycleError as e:
+        label = lambda node: operation_list[node].name if operation_list[node].is_transport else operation_list[node].process_name  # noqa: E731
+        raise CycleError([label(node) for node in e.nodes], [label(node) for node in e.cycle])
+    return ProtocolTemplate(
+        processes=[{
+            "type": process.type,
+            "id_in_protocol": process.id_in_protocol,
+            "storage_address": process.storage_address
+        } for process in process_list],
+        operations=[{
+            "process_name": operation.process_name,
+            "name": operation.name,
+            "storage_address": operation.storage_address,
+            "is_transport": operation.is_transport,
+            "is_data": operation.is_data,
+            "process_type": operation.process_type,
+            "machine_type": operation.machine_type
+        } for operation in operation_list],
+        graph=graph,
+        flows=flows,
+        transports=transports,
+        schedule=schedule
+    )
 
 
-def create_plan(connections: List[Dict[str, str]]) -> List[str]:
+def compile_uploaded_protocol(protocol, manipulates) -> CompiledProtocol:
+    validate_protocol(protocol, manipulates)
+    return CompiledProtocol(protocol, manipulates, compile_template(protocol, manipulates))
+
+
+INPUT_TYPES = {
+    "Integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "Float": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "String": lambda value: isinstance(value, str),
+    "Boolean": lambda value: isinstance(value, bool),
+}
+
+
+def check_input_type(value, input_type: str) -> bool:
+    """Types of protocol inputs, Array[...] nests and unknown types are accepted as they are"""
+    if input_type.startswith("Array[") and input_type.endswith("]"):
+        return isinstance(value, list) and all(check_input_type(item, input_type[6:-1]) for item in value)
+    return INPUT_TYPES.get(input_type, lambda value: True)(value)
+
+
+def bind_inputs(protocol_dict, bindings: Dict) -> Dict:
+    """
+    Values of the protocol inputs for one run
+    :param bindings: input id -> value, inputs left out take their default
+    """
+    if not isinstance(bindings, dict):
+        raise ValueError(f"Input bindings must be a mapping: {bindings}")
+    declared = {entry["id"]: entry for entry in protocol_dict.get("input") or []}
+    unknown = set(bindings) - set(declared)
+    if unknown:
+        raise ValueError(f"Unknown inputs: {', '.join(sorted(map(str, unknown)))}")
+    inputs = {}
+    for input_id, entry in declared.items():
+        if input_id in bindings:
+            value = bindings[input_id]
+        elif "default" in entry:
+            value = entry["default"]["value"]
+        else:
+            raise ValueError(f"Input {input_id} has no value and no default")
+        if not check_input_type(value, entry.get("type", "")):
+            raise ValueError(f"Input {input_id} must be {entry['type']}: {value}")
+        inputs[input_id] = value
+    return inputs
+
+
+def expand_sweep(sweep: Dict) -> List[Dict]:
+    """
+    Input bindings of every run of a parameter sweep
+    :param sweep: {"runs": [bindings, ...]} taken as they are, or {"grid": {input id: [values, ...]}} for every combination
+    """
+    if not isinstance(sweep, dict) or len(set(sweep) & {"runs", "grid"}) != 1:
+        raise ValueError('A sweep needs exactly one of "runs" or "grid"')
+    if "runs" in sweep:
+        if not isinstance(sweep["runs"], list):
+            raise ValueError('"runs" must be a list of input bindings')
+        return sweep["runs"]
+    grid = sweep["grid"]
+    if not isinstance(grid, dict) or not all(isinstance(values, list) for values in grid.values()):
+        raise ValueError('"grid" must map input ids to lists of values')
+    return [dict(zip(grid, values)) for values in product(*grid.values())]
+
+
+def compile_protocol(
+        run_id,
+        protocol_dict,
+        machines: List[Operator],
+        pool: MachinePool | None = None,
+        policy=MACHINE_ASSIGNMENT_POLICY,
+        template: ProtocolTemplate | None = None,
+        fuse=FUSE_TRANSPORTS,
+        durations: Dict[str, DurationModel] | None = None
+):
     """
-    Create a plan from a protocol yaml file using a topological sort
-    :param protocol_yaml_path: path to the protocol yaml file
-    :return: a list of steps in the order they should
+    Build the processes, operations and edges of a run without touching the log server
+    :param pool: machine reservations to plan against and update, a private empty pool when omitted
+    :param template: compiled template of protocol_dict, compiled here when omitted
+    :param fuse: drop the transports that do not move labware once machines are assigned (see fuse_transports)
+    :param durations: operation type -> duration of the operations on no machine, those of the registry when omitted
+    :return: process_list, operation_list and edge_list whose ends are indices into operation_list
     """
-    # make edge_list unique
-    # edge_list = list(set(connections))
-    edge_list = list(set([(connection['from'], connection['to']) for connection in connections]))
-    node_list = list(set([edge[0] for edge in edge_list] + [edge[1] for edge in edge_list]))
-    graph = {node: [] for node in node_list}
-    for edge in edge_list:
-        graph[edge[0]].append(edge[1])
+    template = template or compile_template(protocol_dict)
+    if durations is None:
+        durations = machine_registry.snapshot.durations
+    process_list = [Process(run_id=run_id, **process) for process in template.processes]
+    operation_list = [Operation(process_db_id=None, **operation) for operation in template.operations]
+    for operation in operation_list:
+        # 組み込みの型(LabwareToSpotArrayなど)はテンプレートで装置なしになっている、それ以外は装置がなければassign_machinesで失敗する
+        operation.duration = durations.get(operation.operation_type, DEFAULT_DURATION)
+    assign_machines(
+        operation_list,
+        template.graph,
+        machines,
+        pool=pool or MachinePool(),
+        policy=ASSIGNMENT_POLICIES[policy],
+        duration=Operation.expected_seconds,
+        # 優先順位は装置が決まる前のテンプレートのscheduleで決める
+        schedule=template.schedule
+    )
+    edges = template.graph.edges()
+    if fuse and template.transports:
+        operation_list, edges, _ = fuse_transports(operation_list, template.graph, template.transports, template.schedule.order)
+    edge_list = [{"from": source, "to": destination} for source, destination in edges]
+    return process_list, operation_list, edge_list
+
 
-    ret_list = []
-    seen = {node: False for node in graph.keys()}
+def post_process_and_operation_and_edge(run_id, process_list, operation_list, edge_list):
+    """Journal the records of a run, ids are assigned locally and mapped to log-server ids when shipped"""
+    [process.assign_db_id(log_journal.new_id()) for process in process_list]
+    log_journal.create("processes", [process.to_record() for process in process_list], ids=[process.db_id for process in process_list])
 
-    def dfs(graph: Dict[str, str], node: str):
-        seen[node] = True
-        for child_node in graph[node]:
-            if seen[child_node]:
-                continue
-            dfs(graph, child_node)
-        ret_list.append(node)
+    process_db_id_by_protocol_id = {process.id_in_protocol: process.db_id for process in process_list}
+    for operation in operation_list:
+        operation.process_db_id = process_db_id_by_protocol_id[operation.process_name]
+    [operation.assign_db_id(log_journal.new_id()) for operation in operation_list]
+    log_journal.create("operations", [operation.to_record() for operation in operation_list], ids=[operation.db_id for operation in operation_list])
 
-    [dfs(graph, node) for node in graph.keys() if not seen[node]]
-    ret_list.reverse()
-    return ret_list
+    log_journal.create("edges", [
+        {
+            "run_id": run_id,
+            "from_id": operation_list[edge["from"]].db_id,
+            "to_id": operation_list[edge["to"]].db_id
+        } for edge in edge_list
+    ], ids=[log_journal.new_id() for _ in edge_list])
+
+
+def create_process_and_operation_and_edge(
+        run_id,
+        protocol_dict,
+        machines,
+        template: ProtocolTemplate | None = None,
+        pool: MachinePool | None = None
+) -> RunGraph:
+    """
+    :param pool: machine reservations to plan against, the shared machine_pool of the realtime runs when omitted
+    """
+    template = template or compile_template(protocol_dict)
+    process_list, operation_list, edge_list = compile_protocol(run_id, protocol_dict, machines, pool=pool or machine_pool, template=template)
+    post_process_and_operation_and_edge(run_id, process_list, operation_list, edge_list)
+    graph = RunGraph(operation_list, [(edge["from"], edge["to"]) for edge in edge_list])
+    graph.schedule = graph_schedule(template, graph)
+    return graph
+
+
+def plan_protocol(
+        compiled: CompiledProtocol,
+        machines: List[Operator],
+        policy=MACHINE_ASSIGNMENT_POLICY,
+        durations: Dict[str, DurationModel] | None = None
+) -> RunPlan:
+    """
+    Predict the run create_process_and_operation_and_edge would create, planned on an empty machine pool.
+    Nothing is journaled, sent to the log server or written to storage.
+    """
+    template = compiled.template
+    _, operation_list, edge_list = compile_protocol(None, compiled.protocol, machines, policy=policy, template=template, durations=durations)
+    graph = RunGraph(operation_list, [(edge["from"], edge["to"]) for edge in edge_list])
+    schedule = graph_schedule(template, graph)
+    return plan_run(
+        operation_list,
+        graph,
+        duration=lambda node: operation_list[node].expected_seconds(),
+        order=schedule.priority_order(),
+        capacity={machine.id: machine.capacity for machine in machines}.__getitem__,
+        teardown=lambda node: operation_list[node].teardown_seconds
+    )
 
 
-async def read_uploaded_yaml(yaml_file: UploadFile = File(...)):
+def graph_schedule(template: ProtocolTemplate, graph: RunGraph) -> Schedule:
+    # 搬送が減らなければテンプレートのscheduleをそのまま使う
+    if len(graph) == len(template.operations):
+        return template.schedule
+    return run_schedule(graph)
+
+
+def run_schedule(graph: RunGraph) -> Schedule:
+    return create_schedule(graph, durations=lambda node: graph.operations[node].expected_seconds())
+
+
+def create_plan(connections: List[Dict[str, Hashable]]) -> List[Hashable]:
+    """
+    Create a plan from the edges of a run using a topological sort
+    :param connections: edges as {"from": node, "to": node}
+    :return: a list of steps in the order they should be run
+    """
+    return create_schedule((connection['from'], connection['to']) for connection in connections).order
+
+
+async def read_upload(yaml_file: UploadFile = File(...)) -> Tuple[str, bytes]:
+    """
+    Read an uploaded YAML file in one streaming pass, hashing it chunk by chunk
+    :return: md5 of the contents and the raw contents
+    """
     if not yaml_file.filename.endswith(('.yaml', '.yml')):
         raise HTTPException(status_code=400, detail="Uploaded file must be a YAML file")
+    md5_hash = hashlib.md5()
+    chunks = []
+    size = 0
+    while chunk := await yaml_file.read(UPLOAD_CHUNK_BYTES):
+        md5_hash.update(chunk)
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"{yaml_file.filename} is larger than {MAX_UPLOAD_BYTES} bytes")
+    # libyamlはbytesしか受け付けないので最後に一度だけつなぐ
+    return md5_hash.hexdigest(), chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+def parse_uploaded_yaml(contents: bytes):
     try:
-        # ファイルの内容を読み取る
-        contents = await yaml_file.read()
-        contents_str = contents.decode('utf-8')
-        # yamlファイルを読み取る
-        yaml_data = yaml.safe_load(StringIO(contents_str))
-        return yaml_data
+        # bytesのままlibyamlに渡す
+        return load_yaml(contents, max_nodes=MAX_YAML_NODES)
+    except YamlTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except yaml.YAMLError as e:
         raise HTTPException(status_code=400, detail=f"Invalid YAML format: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
-async def calc_md5_from_file(file: UploadFile = File(...)):
-    file_content_bytes = await file.read()  # bytesで取得
-    file_content_str = file_content_bytes.decode("utf-8")
-    md5 = calculate_md5(file_content_str)
-    await file.seek(0)
-    return md5
+def run_trace(run_id) -> RunTrace | None:
+    return RunTrace(TRACE_DIR, run_id) if TRACE_DIR else None
 
 
-@app.post("/run_experiment")
-async def run_experiment(project_id: int, protocol_name, user_id: int, protocol_yaml: UploadFile = File(...), manipulate_yaml: UploadFile = File(...)):
-    protocol_md5 = await calc_md5_from_file(protocol_yaml)
-    protocol = await read_uploaded_yaml(protocol_yaml)
-    manipulates = await read_uploaded_yaml(manipulate_yaml)
-    storage_address = "https://drive.google.com/drive/folders/18dhaS7ZKYonfebM4oV5raU79CZQdrHJK?usp=sharing"
-    machines = [
-        HumanPlateServer("human_plate_server", manipulates, storage_address),
-        TecanFluent480("tecan_fluent_480", manipulates, storage_address),
-        OpentronsOT2("opentrons_ot2", manipulates, storage_address),
-        TecanInfinite200Pro("tecan_infinite_200_pro", manipulates, storage_address),
-        HumanStoreLabware("human_store_labware", manipulates, storage_address),
-    ]
+def tenant_of(project_id, user_id) -> str:
+    return f"user:{user_id}" if FAIR_SHARE_BY == "user" else f"project:{project_id}"
 
-    response = requests.post(
-        url=f'{LOG_SERVER_URL}/runs/',
-        data={
-            "project_id": project_id,
-            "file_name": protocol_name,
-            "checksum": protocol_md5,
-            "user_id": user_id,
-            "storage_address": storage_address
-        }
+
+def attach_run_state(
+        graph: RunGraph,
+        dataplane: DataPlane,
+        trace: RunTrace | None = None,
+        checkpoint: RunCheckpoint | None = None,
+        tenant: str | None = None,
+        priority=0
+):
+    for node, operation in enumerate(graph.operations):
+        operation.node = node
+        operation.dataplane = dataplane
+        operation.trace = trace
+        operation.checkpoint = checkpoint
+        operation.tenant = tenant
+        operation.priority = priority
+
+
+def save_checkpoint(
+        checkpoint: RunCheckpoint,
+        compiled: CompiledProtocol,
+        graph: RunGraph,
+        execution_mode,
+        inputs: Dict | None = None,
+        tenant: str | None = None,
+        priority=0
+):
+    checkpoint.save({
+        "compiled": compiled,
+        "execution_mode": execution_mode,
+        "inputs": inputs,
+        "tenant": tenant,
+        "priority": priority,
+        "operations": [operation.checkpoint_state() for operation in graph.operations],
+        "edges": list(graph.edges()),
+    })
+
+
+def planning_pool(execution_mode) -> MachinePool:
+    """
+    Pool the machines of a run are reserved in: simulated runs plan on their own virtual time,
+    so they get a private pool and leave the wall-clock reservations of realtime runs alone
+    """
+    return MachinePool() if execution_mode == "simulated" else machine_pool
+
+
+def execute_run(run_id, compiled: CompiledProtocol, execution_mode="realtime", tenant: str | None = None, priority=0, inputs: Dict | None = None):
+    """
+    :param inputs: values of the protocol inputs as bind_inputs returns them, the defaults when omitted
+    """
+    machines = machine_registry.snapshot.machines
+    trace = run_trace(run_id)
+    checkpoint = RunCheckpoint(CHECKPOINT_DIR, run_id)
+    graph = None
+    try:
+        if inputs is None:
+            inputs = bind_inputs(compiled.protocol, {})
+        with timed(RUN_STAGE_SECONDS, trace, span="create_graph", execution_mode=execution_mode, stage="create_graph"):
+            graph = create_process_and_operation_and_edge(
+                run_id=run_id,
+                protocol_dict=compiled.protocol,
+                machines=machines,
+                template=compiled.template,
+                pool=planning_pool(execution_mode)
+            )
+            save_checkpoint(checkpoint, compiled, graph, execution_mode, inputs, tenant, priority)
+    except Exception:
+        if graph is not None:
+            release_reservations(graph)
+        log_journal.update("runs", run_id, status="failed")
+        log_journal.sync()
+        raise
+    attach_run_state(graph, DataPlane(compiled.template.flows, inputs, seed=run_id), trace, checkpoint, tenant, priority)
+    run_graph(run_id, compiled, graph, execution_mode, trace, checkpoint)
+
+
+def resume_run(run_id, checkpoint: RunCheckpoint, state: Dict):
+    """Continue a run from its checkpoint with the same records, skipping the operations that completed"""
+    compiled: CompiledProtocol = state["compiled"]
+    operation_list = [Operation.from_checkpoint_state(operation) for operation in state["operations"]]
+    with machine_pool.lock:
+        # サーバが再起動していても装置のスロット数で待たせる
+        for machine in {operation.machine_id: operation.machine for operation in operation_list if operation.machine is not None}.values():
+            machine_pool.register(machine)
+    graph = RunGraph(operation_list, state["edges"])
+    graph.schedule = run_schedule(graph)
+    completed = set()
+    dataplane = DataPlane(compiled.template.flows, state["inputs"], seed=run_id)
+    # 完了済みの操作の出力は保存されたものを読み戻して後続に渡す
+    storage_writer.flush()
+    for node, artifacts in checkpoint.completed().items():
+        try:
+            dataplane.restore(node, graph.operations[node].storage_address, artifacts)
+            completed.add(node)
+        except FileNotFoundError:
+            logger.warning("Outputs of operation %s of run %s are missing, running it again", node, run_id, exc_info=True)
+    trace = run_trace(run_id)
+    attach_run_state(graph, dataplane, trace, checkpoint, state.get("tenant"), state.get("priority", 0))
+    run_graph(run_id, compiled, graph, state["execution_mode"], trace, checkpoint, completed)
+
+
+def run_graph(
+        run_id,
+        compiled: CompiledProtocol,
+        graph: RunGraph,
+        execution_mode,
+        trace: RunTrace | None,
+        checkpoint: RunCheckpoint,
+        completed: Set[int] | None = None
+):
+    """
+    Execute the operations of a run that are not in completed, the graph has its run state attached (attach_run_state)
+    :param completed: nodes already completed before the run was interrupted, None for a new run
+    """
+    clock = VirtualClock() if execution_mode == "simulated" else None
+    now = clock.now if clock else datetime.now
+    schedule = graph.schedule
+    skip = completed or set()
+    try:
+        if completed is None:
+            log_journal.update("runs", run_id, started_at=now().isoformat(), status="running")
+        else:
+            log_journal.update("runs", run_id, status="running")
+        with timed(RUN_STAGE_SECONDS, trace, span="execute", execution_mode=execution_mode, stage="execute"):
+            if clock:
+                simulate_run(graph, schedule, clock, skip=skip)
+            else:
+                execute_dag(
+                    tasks={node: graph.operations[node].run for node in schedule.order if node not in skip},
+                    edges=graph,
+                    max_workers=MAX_PARALLEL_OPERATIONS,
+                    order=schedule.priority_order()
+                )
+    except Exception:
+        release_reservations(graph)
+        log_journal.update("runs", run_id, status="failed")
+        log_journal.sync()
+        checkpoint.close()
+        raise
+    run_finish_time = now().isoformat()
+    log_journal.update("runs", run_id, finished_at=run_finish_time, status="completed")
+    log_journal.sync()
+    checkpoint.remove()
+
+
+def release_reservations(graph: RunGraph):
+    """Give back the machine load reserved for the operations of a run that will not run, e.g. after a failure"""
+    for operation in graph.operations:
+        operation.release_reservation()
+
+
+def simulate_run(graph: RunGraph, schedule, clock: VirtualClock, skip: Set[int] = frozenset()):
+    """Run the operations on a discrete-event loop: durations advance the virtual clock instead of sleeping"""
+    scheduler = EventScheduler(clock)
+    times = schedule_simulated_run(graph, schedule, scheduler, skip=skip)
+    scheduler.run()
+    return times
+
+
+def schedule_simulated_run(graph: RunGraph, schedule, scheduler: EventScheduler, on_finish=lambda node: None, skip: Set[int] = frozenset()):
+    """
+    Put the operations of a run on the event loop, runs scheduled on the same scheduler share the machines
+    :param skip: nodes that already completed
+    """
+    clock = scheduler.clock
+    capacities = {operation.machine_id: operation.machine.capacity for operation in graph.operations if operation.machine is not None}
+
+    def finish(node):
+        operation = graph.operations[node]
+        operation.complete(clock.now().isoformat())
+        operation.release_reservation()
+        on_finish(node)
+
+    return simulate_dag(
+        nodes=[node for node in schedule.order if node not in skip],
+        edges=graph,
+        duration=lambda node: graph.operations[node].sample_seconds(duration_rng),
+        scheduler=scheduler,
+        machine=lambda node: graph.operations[node].machine_id,
+        on_start=lambda node: graph.operations[node].start(clock.now().isoformat()),
+        on_finish=finish,
+        order=schedule.priority_order(),
+        capacity=lambda machine_id: capacities.get(machine_id, 1),
+        teardown=lambda node: graph.operations[node].teardown_seconds
     )
-    run_id = response.json()["id"]
-    operation_list, edge_list = create_process_and_operation_and_edge(
-        run_id=run_id,
-        protocol_dict=protocol,
-        machines=machines
+
+
+def execute_sweep(
+        run_ids: List[int],
+        compiled: CompiledProtocol,
+        input_list: List[Dict],
+        execution_mode="realtime",
+        tenant: str | None = None,
+        priority=0
+):
+    """
+    Execute the runs of a parameter sweep as one DAG on the shared machine pool,
+    so that operations of a run start while the previous runs still occupy other machines.
+    A run is completed as soon as all of its own operations are.
+    """
+    machines = machine_registry.snapshot.machines
+    clock = VirtualClock() if execution_mode == "simulated" else None
+    now = clock.now if clock else datetime.now
+    # runs of a simulated sweep are planned against each other only
+    pool = planning_pool(execution_mode)
+    graphs: Dict[int, RunGraph] = {}
+    checkpoints: Dict[int, RunCheckpoint] = {}
+    remaining: Dict[int, int] = {}
+    lock = Lock()
+
+    def operation_finished(run_id):
+        with lock:
+            remaining[run_id] -= 1
+            run_completed = remaining[run_id] == 0
+        if run_completed:
+            log_journal.update("runs", run_id, finished_at=now().isoformat(), status="completed")
+            checkpoints[run_id].remove()
+
+    try:
+        for run_id, inputs in zip(run_ids, input_list):
+            trace = run_trace(run_id)
+            with timed(RUN_STAGE_SECONDS, trace, span="create_graph", execution_mode=execution_mode, stage="create_graph"):
+                graphs[run_id] = create_process_and_operation_and_edge(
+                    run_id=run_id,
+                    protocol_dict=compiled.protocol,
+                    machines=machines,
+                    template=compiled.template,
+                    pool=pool
+                )
+                checkpoints[run_id] = RunCheckpoint(CHECKPOINT_DIR, run_id)
+                save_checkpoint(checkpoints[run_id], compiled, graphs[run_id], execution_mode, inputs, tenant, priority)
+            attach_run_state(graphs[run_id], DataPlane(compiled.template.flows, inputs, seed=run_id), trace, checkpoints[run_id], tenant, priority)
+            remaining[run_id] = len(graphs[run_id])
+            log_journal.update("runs", run_id, started_at=now().isoformat(), status="running")
+        execute_started = perf_counter()
+        if clock:
+            scheduler = EventScheduler(clock)
+            for run_id, graph in graphs.items():
+                schedule_simulated_run(graph, graph.schedule, scheduler, on_finish=lambda node, run_id=run_id: operation_finished(run_id))
+            scheduler.run()
+        else:
+            def task(operation: Operation, run_id):
+                operation.run()
+                operation_finished(run_id)
+
+            execute_dag(
+                tasks={
+                    (run_id, node): partial(task, graph.operations[node], run_id)
+                    for run_id, graph in graphs.items() for node in graph.schedule.order
+                },
+                edges=[((run_id, source), (run_id, destination)) for run_id, graph in graphs.items() for source, destination in graph.edges()],
+                max_workers=MAX_PARALLEL_OPERATIONS,
+                # 前のrunの操作を優先し、後のrunは空いた装置で進める
+                order=[(run_id, node) for run_id in run_ids for node in graphs[run_id].schedule.priority_order()]
+            )
+        RUN_STAGE_SECONDS.labels(execution_mode=execution_mode, stage="execute").observe(perf_counter() - execute_started)
+    except Exception:
+        for graph in graphs.values():
+            release_reservations(graph)
+        for run_id in run_ids:
+            if remaining.get(run_id, 1) > 0:
+                log_journal.update("runs", run_id, status="failed")
+                if run_id in checkpoints:
+                    checkpoints[run_id].close()
+        log_journal.sync()
+        raise
+    log_journal.sync()
+
+
+def run_record(project_id, protocol_name, user_id, protocol_md5, storage_address):
+    return {
+        "project_id": project_id,
+        "file_name": protocol_name,
+        "checksum": protocol_md5,
+        "user_id": user_id,
+        "storage_address": storage_address
+    }
+
+
+async def post_run(project_id, protocol_name, user_id, protocol_md5, storage_address):
+    run_ids = await log_store.acreate("runs", [run_record(project_id, protocol_name, user_id, protocol_md5, storage_address)])
+    return run_ids[0]
+
+
+@app.post("/run_experiment")
+async def run_experiment(project_id: int, protocol_name, user_id: int, inputs: str = Form("{}"), protocol_yaml: UploadFile = File(...), manipulate_yaml: UploadFile = File(...), execution_mode: str = EXECUTION_MODE, priority: int = 0):
+    """
+    :param inputs: JSON input id -> value, inputs left out take their default (see bind_inputs)
+    :param priority: runs with a higher priority are started and get the machines first, whatever their tenant
+    """
+    if execution_mode not in EXECUTION_MODES:
+        raise HTTPException(status_code=400, detail=f"execution_mode must be one of {', '.join(EXECUTION_MODES)}")
+    stage = partial(timed, SUBMISSION_STAGE_SECONDS, endpoint="/run_experiment")
+    with stage(stage="upload"):
+        protocol_md5, protocol_contents = await read_upload(protocol_yaml)
+        manipulate_md5, manipulate_contents = await read_upload(manipulate_yaml)
+    with stage(stage="compile"):
+        compiled = await get_compiled_protocol(protocol_md5, manipulate_md5, protocol_contents, manipulate_contents)
+    try:
+        bound_inputs = bind_inputs(compiled.protocol, json.loads(inputs))
+    except (json.JSONDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid inputs: {str(e)}")
+    storage_address = machine_registry.snapshot.storage_address
+    with stage(stage="create_run"):
+        run_id = await post_run(project_id, protocol_name, user_id, protocol_md5, storage_address)
+    tenant = tenant_of(project_id, user_id)
+    with stage(stage="submit"):
+        try:
+            job_queue.submit(
+                run_id,
+                partial(execute_run, run_id, compiled, execution_mode, tenant, priority, bound_inputs),
+                tenant=tenant,
+                priority=priority,
+                project_id=project_id,
+                user_id=user_id,
+                protocol_name=protocol_name,
+                execution_mode=execution_mode
+            )
+        except QueueFull as e:
+            log_journal.update("runs", run_id, status="rejected")
+            raise HTTPException(status_code=429, detail=str(e))
+    return {"run_id": run_id, "status": "queued"}
+
+
+@app.post("/run_sweep")
+async def run_sweep(project_id: int, protocol_name, user_id: int, sweep: str = Form(...), protocol_yaml: UploadFile = File(...), manipulate_yaml: UploadFile = File(...), execution_mode: str = EXECUTION_MODE, priority: int = 0):
+    """
+    Launch one run per input binding of `sweep` (JSON, see expand_sweep), all of them scheduled together
+    """
+    if execution_mode not in EXECUTION_MODES:
+        raise HTTPException(status_code=400, detail=f"execution_mode must be one of {', '.join(EXECUTION_MODES)}")
+    stage = partial(timed, SUBMISSION_STAGE_SECONDS, endpoint="/run_sweep")
+    with stage(stage="upload"):
+        protocol_md5, protocol_contents = await read_upload(protocol_yaml)
+        manipulate_md5, manipulate_contents = await read_upload(manipulate_yaml)
+    with stage(stage="compile"):
+        compiled = await get_compiled_protocol(protocol_md5, manipulate_md5, protocol_contents, manipulate_contents)
+    try:
+        input_list = [bind_inputs(compiled.protocol, bindings) for bindings in expand_sweep(json.loads(sweep))]
+    except (json.JSONDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid sweep: {str(e)}")
+    if not input_list:
+        raise HTTPException(status_code=400, detail="Invalid sweep: no runs")
+    if len(input_list) > MAX_SWEEP_RUNS:
+        raise HTTPException(status_code=413, detail=f"A sweep can have at most {MAX_SWEEP_RUNS} runs, not {len(input_list)}")
+    storage_address = machine_registry.snapshot.storage_address
+    record = run_record(project_id, protocol_name, user_id, protocol_md5, storage_address)
+    with stage(stage="create_run"):
+        run_ids = await log_store.acreate("runs", [dict(record) for _ in input_list])
+    tenant = tenant_of(project_id, user_id)
+    with stage(stage="submit"):
+        try:
+            job_queue.submit_batch(
+                run_ids,
+                partial(execute_sweep, run_ids, compiled, input_list, execution_mode, tenant, priority),
+                tenant=tenant,
+                priority=priority,
+                project_id=project_id,
+                user_id=user_id,
+                protocol_name=protocol_name,
+                execution_mode=execution_mode
+            )
+        except QueueFull as e:
+            for run_id in run_ids:
+                log_journal.update("runs", run_id, status="rejected")
+            raise HTTPException(status_code=429, detail=str(e))
+    return {"run_ids": run_ids, "status": "queued"}
+
+
+@app.post("/dry_run")
+async def dry_run(protocol_yaml: UploadFile = File(...), manipulate_yaml: UploadFile = File(...), policy: str = MACHINE_ASSIGNMENT_POLICY):
+    """
+    Predicted makespan, critical path, machine utilization and parallelism of a run of the protocol on the current machines,
+    with every operation taking its expected duration. No run is created.
+    """
+    if policy not in ASSIGNMENT_POLICIES:
+        raise HTTPException(status_code=400, detail=f"policy must be one of {', '.join(ASSIGNMENT_POLICIES)}")
+    stage = partial(timed, SUBMISSION_STAGE_SECONDS, endpoint="/dry_run")
+    with stage(stage="upload"):
+        protocol_md5, protocol_contents = await read_upload(protocol_yaml)
+        manipulate_md5, manipulate_contents = await read_upload(manipulate_yaml)
+    snapshot = machine_registry.snapshot
+    machines = snapshot.machines
+    cache_key = ProtocolCache.key(protocol_md5, manipulate_md5, TEMPLATE_FORMAT, policy, machines_checksum(machines, snapshot.durations))
+    plan = plan_cache.get(cache_key)
+    if plan is None:
+        with stage(stage="compile"):
+            compiled = await get_compiled_protocol(protocol_md5, manipulate_md5, protocol_contents, manipulate_contents)
+        with stage(stage="plan"):
+            try:
+                plan = await run_in_threadpool(lambda: plan_protocol(compiled, machines, policy, snapshot.durations).to_dict())
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid protocol: {str(e)}")
+        plan_cache.put(cache_key, plan)
+    # 計画は素のJSON型なのでjsonable_encoderを通さない
+    return JSONResponse({"policy": policy, **plan})
+
+
+@app.post("/forecasts")
+async def post_forecast(
+        protocol_yaml: List[UploadFile] = File(...),
+        manipulate_yaml: UploadFile = File(...),
+        machines_yaml: UploadFile | None = File(None),
+        runs: str = Form("[]"),
+        replicas: int = 1000,
+        seed: int | None = None,
+        policy: str = MACHINE_ASSIGNMENT_POLICY
+):
+    """
+    Simulate `replicas` independent replicas of a mix of runs executed together, with operation durations drawn
+    from the duration models of the machines, and report the distributions of makespan, throughput, machine utilization and queueing delays
+    :param runs: JSON list with the number of runs of each protocol_yaml, one each when empty
+    :param machines_yaml: fleet in the format of machines.yaml, the current machines when omitted
+    """
+    if not 1 <= replicas <= MAX_FORECAST_REPLICAS:
+        raise HTTPException(status_code=400, detail=f"replicas must be between 1 and {MAX_FORECAST_REPLICAS}")
+    if policy not in ASSIGNMENT_POLICIES:
+        raise HTTPException(status_code=400, detail=f"policy must be one of {', '.join(ASSIGNMENT_POLICIES)}")
+    try:
+        run_counts = json.loads(runs) or [1] * len(protocol_yaml)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid runs: {str(e)}")
+    if not isinstance(run_counts, list) or len(run_counts) != len(protocol_yaml) or \
+            not all(isinstance(run_count, int) and run_count >= 0 for run_count in run_counts) or not sum(run_counts):
+        raise HTTPException(status_code=400, detail="runs must list a number of runs for every protocol_yaml")
+    if sum(run_counts) > MAX_SWEEP_RUNS:
+        raise HTTPException(status_code=413, detail=f"A forecast can have at most {MAX_SWEEP_RUNS} runs, not {sum(run_counts)}")
+    manipulate_md5, manipulate_contents = await read_upload(manipulate_yaml)
+    compiled_list = []
+    for upload in protocol_yaml:
+        protocol_md5, protocol_contents = await read_upload(upload)
+        compiled_list.append(await get_compiled_protocol(protocol_md5, manipulate_md5, protocol_contents, manipulate_contents))
+    snapshot = machine_registry.snapshot
+    machines = snapshot.machines
+    durations = snapshot.durations
+    if machines_yaml is not None:
+        _, machines_contents = await read_upload(machines_yaml)
+        try:
+            fleet = parse_uploaded_yaml(machines_contents)
+            # 実績ログを参照する分布はアップロードでは使えない
+            machines = MachineRegistry.build_machines(fleet, snapshot.manipulates, allow_logs=False)
+            durations = MachineRegistry.build_durations(fleet, allow_logs=False)
+        except (AttributeError, KeyError, TypeError, ValueError, OSError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid machines_yaml: {str(e)}")
+    try:
+        workload = await run_in_threadpool(build_workload, compiled_list, run_counts, machines, policy, durations)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid protocol: {str(e)}")
+    forecast_id = next(forecast_ids)
+    forecast_queue.submit(
+        forecast_id,
+        partial(forecast, workload, replicas, seed, FORECAST_WORKERS),
+        replicas=replicas,
+        runs=run_counts,
+        machines=[machine.id for machine in machines]
     )
-    plan = create_plan(edge_list)
-    run_start_time = datetime.now().isoformat()
-    requests.patch(url=f'{LOG_SERVER_URL}/runs/{run_id}', data={"attribute": "started_at", "new_value": run_start_time})
-    requests.patch(url=f'{LOG_SERVER_URL}/runs/{run_id}', data={"attribute": "status", "new_value": "running"})
-    for operation_name in plan:
-        operation = [operation for operation in operation_list if operation.name == operation_name][0]
-        operation.run()
-    run_finish_time = datetime.now().isoformat()
-    requests.patch(url=f'{LOG_SERVER_URL}/runs/{run_id}', data={"attribute": "finished_at", "new_value": run_finish_time})
-    requests.patch(url=f'{LOG_SERVER_URL}/runs/{run_id}', data={"attribute": "status", "new_value": "completed"})
+    return {"forecast_id": forecast_id, "status": "queued"}
+
+
+@app.get("/forecasts/{forecast_id}")
+async def get_forecast(forecast_id: int):
+    job = forecast_queue.get(forecast_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Forecast {forecast_id} is not known to this lab server")
+    forecast_status = job.to_dict()
+    forecast_status["forecast_id"] = forecast_status.pop("run_id")
+    return {**forecast_status, "result": job.result}
+
+
+def build_workload(
+        compiled_list: List[CompiledProtocol],
+        run_counts: List[int],
+        machines: List[Operator],
+        policy=MACHINE_ASSIGNMENT_POLICY,
+        durations: Dict[str, DurationModel] | None = None
+) -> Workload:
+    """Runs of a forecast compiled as real runs would be, planned together on a private machine pool"""
+    workload = Workload([machine.id for machine in machines], [machine.capacity for machine in machines])
+    pool = MachinePool()
+    for compiled, run_count in zip(compiled_list, run_counts):
+        for _ in range(run_count):
+            _, operation_list, edge_list = compile_protocol(
+                None, compiled.protocol, machines, pool=pool, policy=policy, template=compiled.template, durations=durations
+            )
+            graph = RunGraph(operation_list, [(edge["from"], edge["to"]) for edge in edge_list])
+            workload.add_run(operation_list, graph.edges(), graph_schedule(compiled.template, graph).priority_order())
+    return workload
+
+
+@app.get("/dry_run/stats")
+async def get_plan_cache_stats():
+    return plan_cache.stats()
+
+
+def machines_checksum(machines: List[Operator], durations: Dict[str, DurationModel] | None = None) -> str:
+    """Changes whenever the machines or durations a plan depends on do"""
+    description = json.dumps([
+        [{"id": machine.id, "type": machine.type, **machine.timing()} for machine in machines],
+        {operation_type: duration.to_dict() for operation_type, duration in (durations or {}).items()}
+    ], sort_keys=True)
+    return hashlib.md5(description.encode("utf-8")).hexdigest()
+
+
+async def get_compiled_protocol(protocol_md5, manipulate_md5, protocol_contents: bytes, manipulate_contents: bytes) -> CompiledProtocol:
+    cache_key = ProtocolCache.key(protocol_md5, manipulate_md5, TEMPLATE_FORMAT)
+    compiled = protocol_cache.get(cache_key)
+    if compiled is not None:
+        return compiled
+    compiled = await run_in_threadpool(compile_upload, protocol_contents, manipulate_contents)
+    protocol_cache.put(cache_key, compiled)
+    return compiled
+
+
+def compile_upload(protocol_contents: bytes, manipulate_contents: bytes) -> CompiledProtocol:
+    protocol = parse_uploaded_yaml(protocol_contents)
+    manipulates = parse_uploaded_yaml(manipulate_contents)
+    try:
+        compiled = compile_uploaded_protocol(protocol, manipulates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid protocol: {str(e)}")
+    return compiled
+
+
+@app.get("/machines")
+async def list_machines():
+    return [
+        {"id": machine.id, "type": machine.type, **machine.timing()}
+        for machine in machine_registry.snapshot.machines
+    ]
+
+
+@app.post("/machines/reload")
+async def reload_machines():
+    try:
+        snapshot = await run_in_threadpool(machine_registry.reload)
+    except (OSError, ValueError, KeyError, yaml.YAMLError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not reload {machine_registry.config_path}: {str(e)}")
+    return {"machines": len(snapshot.machines), "manipulates": len(snapshot.manipulates)}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/log_journal/stats")
+async def get_log_journal_stats():
+    return journal_shipper.stats()
+
+
+@app.get("/storage/stats")
+async def get_storage_stats():
+    return storage_writer.stats()
+
+
+@app.get("/protocol_cache/stats")
+async def get_protocol_cache_stats():
+    return protocol_cache.stats()
+
+
+@app.get("/runs")
+async def list_runs():
+    return {
+        "queued": [job.to_dict() for job in job_queue.list(statuses=("queued",))],
+        "running": [job.to_dict() for job in job_queue.list(statuses=("running",))]
+    }
+
+
+@app.get("/tenants/stats")
+async def get_tenant_stats():
+    """Queue depth and wait times per tenant, for the run queue and for the machines"""
+    return {
+        "fair_share_by": FAIR_SHARE_BY,
+        "runs": job_queue.stats(),
+        "machine_waits": {str(tenant): waits for tenant, waits in machine_pool.waits.stats().items()},
+    }
+
+
+@app.get("/runs/resumable")
+async def list_resumable_runs():
+    """Runs with a checkpoint that are not executing, i.e. interrupted by a restart or failed"""
+    return {"run_ids": [
+        int(run_id) for run_id in RunCheckpoint.run_ids(CHECKPOINT_DIR)
+        if run_id.isdigit() and not is_active(int(run_id))
+    ]}
+
+
+def is_active(run_id) -> bool:
+    job = job_queue.get(run_id)
+    return job is not None and job.status in ("queued", "running")
+
+
+@app.post("/runs/{run_id}/resume")
+async def post_resume_run(run_id: int):
+    if is_active(run_id):
+        raise HTTPException(status_code=409, detail=f"Run {run_id} is already {job_queue.get(run_id).status}")
+    checkpoint = RunCheckpoint(CHECKPOINT_DIR, run_id)
+    if not checkpoint.exists():
+        raise HTTPException(status_code=404, detail=f"Run {run_id} has no checkpoint, it completed or never started")
+    try:
+        state = await run_in_threadpool(checkpoint.load)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Checkpoint of run {run_id} is unreadable: {str(e)}")
+    try:
+        job_queue.submit(
+            run_id,
+            partial(resume_run, run_id, checkpoint, state),
+            tenant=state.get("tenant"),
+            priority=state.get("priority", 0),
+            execution_mode=state["execution_mode"],
+            resumed=True
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"run_id": run_id, "status": "queued"}
+
+
+@app.get("/runs/{run_id}/status")
+async def get_run_status(run_id: int):
+    job = job_queue.get(run_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} is not known to this lab server")
+    return job.to_dict()
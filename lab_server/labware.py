@@ -0,0 +1,110 @@
+from typing import Callable, Dict, List, Sequence, Tuple
+from dataplane import Flow
+from scheduler import Adjacency
+
+
+class Route:
+    """Physical route of a transport: the labware it carries from the machine it is on to the next one"""
+    labware: str
+    source: str | None
+    destination: str
+    via: List[str]
+
+    def __init__(self, labware, source, destination, via=None):
+        self.labware = labware
+        self.source = source
+        self.destination = destination
+        self.via = via or []
+
+    def to_dict(self):
+        return {"labware": self.labware, "source": self.source, "destination": self.destination, "via": self.via}
+
+    def __str__(self):
+        stops = [self.source or "?", *(f"({process})" for process in self.via), self.destination]
+        return f"{self.labware}: {' -> '.join(stops)}"
+
+
+def fuse_transports(
+        operation_list: List,
+        edges: List[Tuple[int, int]] | Adjacency,
+        transports: Dict[int, Flow],
+        order: List[int]
+) -> Tuple[List, List[Tuple[int, int]], Dict[str, str | None]]:
+    """
+    Follow every labware from machine to machine and keep only the transports that move it:
+    a transport is dropped when the labware is already on the machine of the destination,
+    or when the destination has no machine (input, output, builtin operations) and the labware stays where it is,
+    in which case the next transport of the labware starts from where it really is (the moves are fused).
+    Labware is named after the process and port that produced it and passes through the processes it goes into
+    (the first one coming in when a process takes several).
+    Machines are taken as assign_machines bound them, the assignment policy decides how often consecutive steps share one.
+    :param edges: edges between the positions in operation_list, or the Adjacency of the graph
+    :param transports: transport node -> the connection it carries, nodes not in it are processes
+    :param order: topological order of the nodes
+    :return: operation_list and edges without the dropped transports (processes keep their nodes),
+             and the machine every labware ends up on
+    """
+    graph = Adjacency.of(edges, range(len(operation_list)))
+    carried: Dict[int, str] = {}
+    locations: Dict[str, str | None] = {}
+    via: Dict[str, List[str]] = {}
+    dropped = set()
+    for node in order:
+        if node not in transports:
+            continue
+        source, source_port, destination, _ = transports[node]
+        source_operation = operation_list[source]
+        labware = carried.get(source)
+        if labware is None:
+            labware = f"{source_operation.process_name}.{source_port}"
+            locations[labware] = source_operation.machine_id
+        carried.setdefault(destination, labware)
+        origin = locations[labware]
+        target = operation_list[destination].machine_id
+        if target is None:
+            # 装置のない処理ではラボウェアは動かないので次の搬送にまとめる
+            via.setdefault(labware, []).append(operation_list[destination].process_name)
+            dropped.add(node)
+        elif origin == target:
+            via.pop(labware, None)
+            dropped.add(node)
+        else:
+            operation = operation_list[node]
+            operation.route = Route(labware, origin, target, via.pop(labware, []))
+            locations[labware] = target
+    if not dropped:
+        return operation_list, graph.edges(), locations
+
+    kept = set()
+    for source, destination in graph.edges():
+        if source in dropped or destination in dropped:
+            continue
+        kept.add((source, destination))
+    for node in dropped:
+        # 落とした搬送の前後の依存関係は残す
+        for source in _skip_dropped(node, graph.predecessors, dropped):
+            for destination in _skip_dropped(node, graph.successors, dropped):
+                kept.add((source, destination))
+    renumbered = {}
+    fused_list = []
+    for node, operation in enumerate(operation_list):
+        if node not in dropped:
+            renumbered[node] = len(fused_list)
+            fused_list.append(operation)
+    return fused_list, sorted((renumbered[source], renumbered[destination]) for source, destination in kept), locations
+
+
+def _skip_dropped(node: int, neighbors: Callable[[int], Sequence[int]], dropped) -> List[int]:
+    found = []
+    stack = list(neighbors(node))
+    seen = set()
+    while stack:
+        neighbor = stack.pop()
+        if neighbor in seen:
+            continue
+        seen.add(neighbor)
+        if neighbor in dropped:
+            stack.extend(neighbors(neighbor))
+        else:
+            found.append(neighbor)
+    return found
@@ -1,7 +1,9 @@
-from typing import List
+from typing import Dict, List
 from time import sleep
-from random import uniform
 from pathlib import Path
+import numpy as np
+from durations import DEFAULT_DURATION, DurationModel
+from storage import StorageWriter
 
 
 class Operator:
@@ -10,25 +12,64 @@ class Operator:
     task_input: List[str]
     task_output: List[str]
     storage_address: Path
+    capacity: int
+    duration: DurationModel
+    setup_seconds: float
+    teardown_seconds: float
 
-    def __init__(self, id, type, manipulate_list, storage_address):
+    def __init__(self, id, type, manipulate_list, storage_address, capacity=1, duration=None, setup=0.0, teardown=0.0):
+        """
+        :param manipulate_list: manipulate definitions, either as listed in manipulate.yaml or indexed by name
+        :param capacity: operations the machine runs at the same time
+        :param duration: distribution of the time an operation runs, uniform(1, 3) when omitted
+        :param setup: seconds before every operation, the operation is not done before
+        :param teardown: seconds after every operation during which the slot stays busy but the next operations can start
+        """
         self.id = id
         self.type = type
         self.storage_address = storage_address / Path(id)
-        # 該当するmanipulateが1つしかないことを想定している。
-        manipulate = [manipulate for manipulate in manipulate_list if manipulate['name'] == type][0]
-        if manipulate.get('input'):
-            self.task_input = [input['id'] for input in manipulate['input']]
-        if manipulate.get('output'):
-            self.task_output = [output['id'] for output in manipulate['output']]
-
-    def run(self):
-        Path(self.storage_address).mkdir(parents=True)
+        self.capacity = capacity
+        self.duration = duration or DEFAULT_DURATION
+        self.setup_seconds = setup
+        self.teardown_seconds = teardown
+        manipulates: Dict[str, Dict] = manipulate_list if isinstance(manipulate_list, dict) else {
+            manipulate['name']: manipulate for manipulate in manipulate_list
+        }
+        manipulate = manipulates.get(type) or {}
+        self.task_input = [input['id'] for input in manipulate.get('input') or []]
+        self.task_output = [output['id'] for output in manipulate.get('output') or []]
+
+    def sample_seconds(self, rng: np.random.Generator) -> float:
+        """Setup and running time of one operation"""
+        return self.setup_seconds + float(self.duration.sample(rng))
+
+    def expected_seconds(self) -> float:
+        return self.setup_seconds + self.duration.mean()
+
+    def occupied_seconds(self) -> float:
+        """Expected time one operation holds a slot, teardown included"""
+        return self.expected_seconds() + self.teardown_seconds
+
+    def timing(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "duration": self.duration.to_dict(),
+            "setup_seconds": self.setup_seconds,
+            "teardown_seconds": self.teardown_seconds,
+        }
+
+    def run(self, storage_writer: StorageWriter | None = None):
+        """
+        :param storage_writer: writes the metadata in the background, written before returning when omitted
+        """
         metadata_path = Path(self.storage_address) / Path('metadata.json')
-        # ランダムな時間だけ待つ
-        running_time = uniform(1, 3)
-        sleep(running_time)
+        # 所要時間の分布に従って待つ
+        sleep(self.sample_seconds(np.random.default_rng()))
         # save metadata
-        with open(metadata_path, 'w') as file:
-            file.write('{"metadata": "sample_metadata"}')
+        metadata = '{"metadata": "sample_metadata"}'
+        if storage_writer is not None:
+            storage_writer.write(metadata_path, metadata)
+        else:
+            metadata_path.parent.mkdir(parents=True, exist_ok=True)
+            metadata_path.write_text(metadata)
         return "done"
@@ -1,4 +1,15 @@
+from typing import Dict, IO, Iterable, Iterator, List, Tuple
+import json
+
+
 class Log:
+    # 監査で大量に読み戻すのでインスタンスごとの__dict__を持たせない
+    __slots__ = (
+        "start_time", "end_time", "status", "user_id", "lab_id", "protocol_id",
+        "is_transport", "operator_id", "execution_id", "storage_address"
+    )
+    FIELDS: Tuple[str, ...] = __slots__
+
     start_time: str
     end_time: str
     status: str
@@ -33,9 +44,21 @@ class Log:
         self.execution_id = execution_id
         self.storage_address = storage_address
 
+    def to_row(self) -> tuple:
+        """Values in the order of FIELDS"""
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    def to_dict(self):
+        return dict(zip(self.FIELDS, self.to_row()))
+
 
 class OperationLog(Log):
-    is_transport = False
+    __slots__ = ("task_id",)
+    FIELDS = (
+        "start_time", "end_time", "status", "user_id", "lab_id", "protocol_id", "is_transport",
+        "task_id", "operator_id", "execution_id", "storage_address"
+    )
+
     task_id: str
 
     def __init__(
@@ -51,11 +74,11 @@ class OperationLog(Log):
             storage_address
     ):
         super().__init__(
-            status,
-            start_time,
-            user_id,
-            lab_id,
-            protocol_id,
+            start_time=start_time,
+            status=status,
+            user_id=user_id,
+            lab_id=lab_id,
+            protocol_id=protocol_id,
             is_transport=False,
             operator_id=operator_id,
             execution_id=execution_id,
@@ -63,24 +86,15 @@ class OperationLog(Log):
         )
         self.task_id = task_id
 
-    def to_dict(self):
-        return {
-            'start_time': self.start_time,
-            'end_time': self.end_time,
-            'status': self.status,
-            'user_id': self.user_id,
-            'lab_id': self.lab_id,
-            'protocol_id': self.protocol_id,
-            'is_transport': self.is_transport,
-            'task_id': self.task_id,
-            'operator_id': self.operator_id,
-            'execution_id': self.execution_id,
-            'storage_address': self.storage_address,
-        }
-
 
 class TransportLog(Log):
-    is_transport = True
+    __slots__ = ("source_task_id", "source_port_id", "destination_task_id", "destination_port_id")
+    FIELDS = (
+        "start_time", "end_time", "status", "user_id", "lab_id", "protocol_id", "is_transport",
+        "source_task_id", "source_port_id", "destination_task_id", "destination_port_id",
+        "operator_id", "execution_id", "storage_address"
+    )
+
     source_task_id: str
     source_port_id: str
     destination_task_id: str
@@ -102,11 +116,11 @@ class TransportLog(Log):
             storage_address
     ):
         super().__init__(
-            status,
-            start_time,
-            user_id,
-            lab_id,
-            protocol_id,
+            start_time=start_time,
+            status=status,
+            user_id=user_id,
+            lab_id=lab_id,
+            protocol_id=protocol_id,
             is_transport=True,
             operator_id=operator_id,
             execution_id=execution_id,
@@ -117,20 +131,58 @@ class TransportLog(Log):
         self.destination_task_id = destination_task_id
         self.destination_port_id = destination_port_id
 
-    def to_dict(self):
-        return {
-            'start_time': self.start_time,
-            'end_time': self.end_time,
-            'status': self.status,
-            'user_id': self.user_id,
-            'lab_id': self.lab_id,
-            'protocol_id': self.protocol_id,
-            'is_transport': self.is_transport,
-            'source_task_id': self.source_task_id,
-            'source_port_id': self.source_port_id,
-            'destination_task_id': self.destination_task_id,
-            'destination_port_id': self.destination_port_id,
-            'operator_id': self.operator_id,
-            'execution_id': self.execution_id,
-            'storage_address': self.storage_address
-        }
+
+def export_ndjson(logs: Iterable[Log], file: IO[str]) -> int:
+    """
+    Write one JSON object per log, consuming logs lazily
+    :return: number of logs written
+    """
+    written = 0
+    for log in logs:
+        file.write(json.dumps(log.to_dict(), ensure_ascii=False))
+        file.write("\n")
+        written += 1
+    return written
+
+
+def export_columnar(logs: Iterable[Log], file: IO[str], row_group_size=65536) -> int:
+    """
+    Write logs as row groups of columns: one JSON line {"kind", "fields", "rows", "columns"} per group.
+    Each kind of log has its own open row group, so rows keep their order within a kind only.
+    At most one row group per kind is held in memory.
+    :return: number of logs written
+    """
+    written = 0
+    groups: Dict[type, List[list]] = {}
+
+    def write_group(kind):
+        columns = groups.pop(kind)
+        file.write(json.dumps({
+            "kind": kind.__name__,
+            "fields": kind.FIELDS,
+            "rows": len(columns[0]),
+            "columns": columns
+        }, ensure_ascii=False))
+        file.write("\n")
+
+    for log in logs:
+        kind = type(log)
+        columns = groups.get(kind)
+        if columns is None:
+            columns = groups[kind] = [[] for _ in kind.FIELDS]
+        for column, value in zip(columns, log.to_row()):
+            column.append(value)
+        written += 1
+        if len(columns[0]) >= row_group_size:
+            write_group(kind)
+    for kind in list(groups):
+        write_group(kind)
+    return written
+
+
+def read_columnar(file: IO[str]) -> Iterator[Dict]:
+    """Logs of a file written by export_columnar as dicts, one row group in memory at a time"""
+    for line in file:
+        group = json.loads(line)
+        for row in zip(*group["columns"]):
+            yield dict(zip(group["fields"], row))
@@ -0,0 +1,44 @@
+from typing import Any, Dict, List, Tuple
+from threading import Lock
+from log_store import BulkUpdate, LogStore
+
+
+class LogWriteBuffer:
+    """
+    Coalesces log writes: attribute updates of the same record are merged
+    and sent with the other pending updates in one bulk write to the log store on flush().
+    JournalShipper flushes after every batch of journal events it replays.
+    """
+    store: LogStore
+
+    def __init__(self, store: LogStore):
+        self.store = store
+        self._pending: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._lock = Lock()
+
+    def create(self, resource: str, records: List[Dict[str, Any]]) -> List[int]:
+        return self.store.create(resource, records)
+
+    def update(self, resource: str, db_id: int, **attributes):
+        with self._lock:
+            self._pending.setdefault((resource, db_id), {}).update(attributes)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        by_resource: Dict[str, List[BulkUpdate]] = {}
+        for (resource, db_id), attributes in pending.items():
+            by_resource.setdefault(resource, []).append({"id": db_id, "attributes": attributes})
+        unsent = list(by_resource)
+        try:
+            for resource in list(unsent):
+                self.store.update_many(resource, by_resource[resource])
+                unsent.remove(resource)
+        except Exception:
+            # 送れなかった更新は後から来た更新を優先して戻しておく
+            with self._lock:
+                for resource in unsent:
+                    for update in by_resource[resource]:
+                        newer = self._pending.get((resource, update["id"]), {})
+                        self._pending[(resource, update["id"])] = {**update["attributes"], **newer}
+            raise
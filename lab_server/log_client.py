@@ -0,0 +1,123 @@
+from typing import Dict
+import asyncio
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import LOG_SERVER_ERRORS, LOG_SERVER_SECONDS, log_server_endpoint, timed
+
+# 同じ内容で再送しても結果が変わらないメソッドだけを読み取りエラー時に再送する
+IDEMPOTENT_METHODS = frozenset(["GET", "PUT", "PATCH", "DELETE"])
+RETRY_STATUS = frozenset([502, 503, 504])
+
+
+class LogServerClient:
+    """
+    Shared client for the log server with keep-alive pooling, timeouts and bounded retries.
+    The sync methods are used from worker threads, the `a`-prefixed ones from the event loop.
+    """
+    base_url: str
+    timeout: float
+    retries: int
+    backoff_factor: float
+    pool_maxsize: int
+
+    def __init__(self, base_url, timeout=10.0, retries=3, backoff_factor=0.2, pool_maxsize=32):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_maxsize,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=IDEMPOTENT_METHODS,
+                raise_on_status=False
+            )
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._async_client: httpx.AsyncClient | None = None
+
+    def request(self, method, path, data=None, json=None, timeout=None):
+        endpoint = log_server_endpoint(path)
+        try:
+            with timed(LOG_SERVER_SECONDS, method=method, endpoint=endpoint):
+                return self._request(method, path, data=data, json=json, timeout=timeout)
+        except Exception:
+            LOG_SERVER_ERRORS.labels(method=method, endpoint=endpoint).inc()
+            raise
+
+    def _request(self, method, path, data=None, json=None, timeout=None):
+        response = self.session.request(
+            method,
+            url=f'{self.base_url}{path}',
+            data=data,
+            json=json,
+            timeout=timeout or self.timeout
+        )
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    def post(self, path, data=None, json=None, timeout=None) -> Dict:
+        return self.request('POST', path, data=data, json=json, timeout=timeout)
+
+    def patch(self, path, data=None, json=None, timeout=None):
+        return self.request('PATCH', path, data=data, json=json, timeout=timeout)
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize)
+            )
+        return self._async_client
+
+    async def arequest(self, method, path, data=None, json=None, timeout=None):
+        endpoint = log_server_endpoint(path)
+        try:
+            with timed(LOG_SERVER_SECONDS, method=method, endpoint=endpoint):
+                return await self._arequest(method, path, data=data, json=json, timeout=timeout)
+        except Exception:
+            LOG_SERVER_ERRORS.labels(method=method, endpoint=endpoint).inc()
+            raise
+
+    async def _arequest(self, method, path, data=None, json=None, timeout=None):
+        attempt = 0
+        while True:
+            try:
+                response = await self.async_client.request(method, path, data=data, json=json, timeout=timeout or self.timeout)
+                if response.status_code not in RETRY_STATUS or method not in IDEMPOTENT_METHODS or attempt >= self.retries:
+                    response.raise_for_status()
+                    return response.json() if response.content else None
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # 接続できていなければリクエストは届いていないのでPOSTでも再送してよい
+                if attempt >= self.retries:
+                    raise
+            except httpx.TransportError:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.retries:
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def apost(self, path, data=None, json=None, timeout=None) -> Dict:
+        return await self.arequest('POST', path, data=data, json=json, timeout=timeout)
+
+    async def apatch(self, path, data=None, json=None, timeout=None):
+        return await self.arequest('PATCH', path, data=data, json=json, timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
@@ -0,0 +1,225 @@
+from typing import Any, Dict, List, TypedDict
+from abc import ABC, abstractmethod
+from pathlib import Path
+from threading import Lock
+from fastapi.concurrency import run_in_threadpool
+import sqlite3
+import requests
+from log_client import LogServerClient
+
+
+# Bulk endpoint contract expected from the log server.
+# POST  /{resource}/bulk  BulkCreateRequest -> BulkCreateResponse (ids in the order of records)
+# PATCH /{resource}/bulk  BulkUpdateRequest
+# resource is one of runs, processes, operations, edges.
+class BulkCreateRequest(TypedDict):
+    records: List[Dict[str, Any]]
+
+
+class BulkCreateResponse(TypedDict):
+    ids: List[int]
+
+
+class BulkUpdate(TypedDict):
+    id: int
+    attributes: Dict[str, Any]
+
+
+class BulkUpdateRequest(TypedDict):
+    updates: List[BulkUpdate]
+
+
+class LogStore(ABC):
+    """Persistence behind the /runs, /processes, /operations and /edges calls"""
+
+    @abstractmethod
+    def create(self, resource: str, records: List[Dict[str, Any]]) -> List[int]:
+        pass
+
+    async def acreate(self, resource: str, records: List[Dict[str, Any]]) -> List[int]:
+        return await run_in_threadpool(self.create, resource, records)
+
+    @abstractmethod
+    def update_many(self, resource: str, updates: List[BulkUpdate]):
+        pass
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        self.close()
+
+
+class HttpLogStore(LogStore):
+    """
+    The log server over HTTP. Uses the bulk endpoints and falls back to the
+    one-request-per-record protocol when the log server does not provide them.
+    """
+    client: LogServerClient
+
+    def __init__(self, client: LogServerClient):
+        self.client = client
+        self.bulk_supported = True
+
+    def create(self, resource, records):
+        if not records:
+            return []
+        if self.bulk_supported:
+            try:
+                response = self.client.post(f'/{resource}/bulk', json={"records": records})
+                return response["ids"]
+            except requests.HTTPError as e:
+                if not self._is_missing_endpoint(e):
+                    raise
+                self.bulk_supported = False
+        return [self.client.post(f'/{resource}/', data=record)["id"] for record in records]
+
+    async def acreate(self, resource, records):
+        if len(records) == 1:
+            response = await self.client.apost(f'/{resource}/', data=records[0])
+            return [response["id"]]
+        return await super().acreate(resource, records)
+
+    def update_many(self, resource, updates):
+        if self.bulk_supported:
+            try:
+                self.client.patch(f'/{resource}/bulk', json={"updates": updates})
+                return
+            except requests.HTTPError as e:
+                if not self._is_missing_endpoint(e):
+                    raise
+                self.bulk_supported = False
+        for update in updates:
+            for attribute, new_value in update["attributes"].items():
+                self.client.patch(
+                    f'/{resource}/{update["id"]}',
+                    data={"attribute": attribute, "new_value": new_value}
+                )
+
+    def close(self):
+        self.client.close()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    @staticmethod
+    def _is_missing_endpoint(error: requests.HTTPError):
+        # 422など他のエラーはbulkがあってもリクエストが悪いので呼び出し元に返す
+        return error.response is not None and error.response.status_code in (404, 405)
+
+
+SQLITE_SCHEMA = {
+    "runs": ["project_id", "file_name", "checksum", "user_id", "storage_address", "started_at", "finished_at", "status"],
+    "processes": ["name", "run_id", "storage_address"],
+    "operations": ["process_id", "name", "status", "storage_address", "is_transport", "is_data", "started_at", "finished_at", "log"],
+    "edges": ["run_id", "from_id", "to_id"],
+}
+SQLITE_INDEXES = [
+    ("processes", "run_id"),
+    ("operations", "process_id"),
+    ("edges", "run_id"),
+]
+
+
+class SqliteLogStore(LogStore):
+    """
+    Embedded log store for running without the log server.
+    WAL mode, bulk inserts with executemany, idempotency keys are unique per table.
+    """
+    path: Path
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for table, columns in SQLITE_SCHEMA.items():
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, {', '.join(columns)}, idempotency_key TEXT UNIQUE)"
+            )
+        for table, column in SQLITE_INDEXES:
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+
+    @staticmethod
+    def _columns(resource, attributes):
+        if resource not in SQLITE_SCHEMA:
+            raise ValueError(f"Unknown resource {resource}")
+        unknown = set(attributes) - set(SQLITE_SCHEMA[resource]) - {"idempotency_key"}
+        if unknown:
+            raise ValueError(f"Unknown attributes for {resource}: {', '.join(sorted(unknown))}")
+        return SQLITE_SCHEMA[resource] + ["idempotency_key"]
+
+    def create(self, resource, records):
+        if not records:
+            return []
+        for record in records:
+            columns = self._columns(resource, record)
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                keys = [record.get("idempotency_key") for record in records if record.get("idempotency_key")]
+                existing = {}
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    existing.update(cursor.execute(
+                        f"SELECT idempotency_key, id FROM {resource} WHERE idempotency_key IN ({', '.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall())
+                next_id = cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {resource}").fetchone()[0]
+                ids = []
+                rows = []
+                for record in records:
+                    key = record.get("idempotency_key")
+                    if key in existing:
+                        ids.append(existing[key])
+                        continue
+                    ids.append(next_id)
+                    rows.append([next_id] + [record.get(column) for column in columns])
+                    if key:
+                        existing[key] = next_id
+                    next_id += 1
+                cursor.executemany(
+                    f"INSERT INTO {resource} (id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+                    rows
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return ids
+
+    def update_many(self, resource, updates):
+        # 同じ属性の組み合わせごとにまとめて更新する
+        groups: Dict[tuple, List[list]] = {}
+        for update in updates:
+            self._columns(resource, update["attributes"])
+            attributes = tuple(update["attributes"])
+            groups.setdefault(attributes, []).append(list(update["attributes"].values()) + [update["id"]])
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for attributes, rows in groups.items():
+                    cursor.executemany(
+                        f"UPDATE {resource} SET {', '.join(f'{attribute} = ?' for attribute in attributes)} WHERE id = ?",
+                        rows
+                    )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def create_log_store(backend: str, client: LogServerClient, sqlite_path) -> LogStore:
+    if backend == "http":
+        return HttpLogStore(client)
+    if backend == "sqlite":
+        return SqliteLogStore(sqlite_path)
+    raise ValueError(f"LOG_BACKEND must be http or sqlite, not {backend}")
@@ -0,0 +1,227 @@
+from typing import Callable, Dict, Hashable, List, Tuple
+from contextlib import contextmanager
+from threading import Event, Lock, Timer
+import heapq
+import time
+from fair_share import FairQueue, WaitStats
+from lib_operator import Operator
+from metrics import TENANT_WAIT_SECONDS
+from scheduler import Adjacency, Schedule, create_schedule
+
+
+class MachinePool:
+    """
+    Reservations of the physical machines shared by every active run.
+    `available_at` and `load` are the planning estimates the assignment policies look at,
+    `acquire` makes an operation wait while all the slots of its machine are busy (until their teardown is over),
+    waiting operations get the machine by priority then fair share between tenants (see FairQueue).
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time, weights: Dict[Hashable, float] | None = None):
+        self.clock = clock
+        self.lock = Lock()
+        self.weights = weights
+        self._available_at: Dict[str, float] = {}
+        self._load: Dict[str, float] = {}
+        self._capacity: Dict[str, int] = {}
+        self._in_use: Dict[str, int] = {}
+        self._waiting: Dict[str, FairQueue[Event]] = {}
+        self.waits = WaitStats()
+
+    def available_at(self, machine_id: str) -> float:
+        return max(self.clock(), self._available_at.get(machine_id, 0.0))
+
+    def load(self, machine_id: str) -> float:
+        return self._load.get(machine_id, 0.0)
+
+    def reserve(self, machine_id: str, start: float, duration: float):
+        """Call with `lock` held"""
+        self._available_at[machine_id] = max(self._available_at.get(machine_id, 0.0), start + duration)
+        self._load[machine_id] = self.load(machine_id) + duration
+
+    def release(self, machine_id: str, duration: float):
+        with self.lock:
+            self._load[machine_id] = max(0.0, self.load(machine_id) - duration)
+
+    def register(self, machine: Operator):
+        """Call with `lock` held"""
+        self._capacity[machine.id] = machine.capacity
+        # 容量が増えたときは待っている操作をすぐに通す
+        self._hand_over(machine.id)
+
+    def _hand_over(self, machine_id: str):
+        """Call with `lock` held"""
+        waiting = self._waiting.get(machine_id)
+        while waiting and self._in_use.get(machine_id, 0) < self._capacity.get(machine_id, 1):
+            event, _ = waiting.pop()
+            self._in_use[machine_id] = self._in_use.get(machine_id, 0) + 1
+            event.set()
+
+    @contextmanager
+    def acquire(self, machine_id: str, tenant=None, priority=0, cost=1.0, teardown=0.0):
+        """
+        Hold one slot of the machine for the duration of the block
+        :param cost: expected seconds on the machine, charged to the fair share of the tenant
+        :param teardown: seconds the slot stays held after the block, the caller goes on meanwhile
+        """
+        requested_at = self.clock()
+        with self.lock:
+            waiting = self._waiting.get(machine_id)
+            if not waiting and self._in_use.get(machine_id, 0) < self._capacity.get(machine_id, 1):
+                self._in_use[machine_id] = self._in_use.get(machine_id, 0) + 1
+                event = None
+            else:
+                if waiting is None:
+                    waiting = self._waiting[machine_id] = FairQueue(self.weights)
+                event = Event()
+                waiting.push(event, tenant, priority, cost)
+        if event is not None:
+            event.wait()
+        wait = self.clock() - requested_at
+        self.waits.observe(tenant, wait)
+        TENANT_WAIT_SECONDS.labels(tenant=str(tenant), queue="machines").observe(wait)
+        try:
+            yield
+        finally:
+            if teardown > 0:
+                timer = Timer(teardown, self._release_slot, (machine_id,))
+                timer.daemon = True
+                timer.start()
+            else:
+                self._release_slot(machine_id)
+
+    def _release_slot(self, machine_id: str):
+        with self.lock:
+            self._in_use[machine_id] -= 1
+            self._hand_over(machine_id)
+
+    def stats(self):
+        with self.lock:
+            return {
+                machine_id: {
+                    'load': self.load(machine_id),
+                    'available_at': self.available_at(machine_id),
+                    'in_use': self._in_use.get(machine_id, 0),
+                    'waiting': {str(tenant): depth for tenant, depth in self._waiting[machine_id].depths().items()} if machine_id in self._waiting else {},
+                } for machine_id in self._available_at
+            }
+
+
+class AssignmentPolicy:
+    name: str
+
+    def priority(self, schedule: Schedule, node: int):
+        """Order in which ready operations are assigned, smaller first"""
+        return schedule.level_of[node], node
+
+    def score(self, ready_at: float, duration: float, available_at: float, load: float):
+        """Machine with the smallest score is chosen"""
+        raise NotImplementedError
+
+
+class LeastLoadedPolicy(AssignmentPolicy):
+    name = "least_loaded"
+
+    def score(self, ready_at, duration, available_at, load):
+        return load, available_at
+
+
+class EarliestAvailablePolicy(AssignmentPolicy):
+    name = "earliest_available"
+
+    def score(self, ready_at, duration, available_at, load):
+        return available_at, load
+
+
+class CriticalPathPolicy(AssignmentPolicy):
+    """List scheduling: operations with the longest remaining path first, each on the machine finishing it earliest"""
+    name = "critical_path"
+
+    def priority(self, schedule, node):
+        return schedule.latest_start[node], node
+
+    def score(self, ready_at, duration, available_at, load):
+        return max(ready_at, available_at) + duration, load
+
+
+ASSIGNMENT_POLICIES: Dict[str, AssignmentPolicy] = {
+    policy.name: policy for policy in [LeastLoadedPolicy(), EarliestAvailablePolicy(), CriticalPathPolicy()]
+}
+
+
+def assign_machines(
+        operation_list: List,
+        edges: List[Tuple[int, int]] | Adjacency,
+        machines: List[Operator],
+        pool: MachinePool,
+        policy: AssignmentPolicy,
+        duration: Callable[[object], float],
+        schedule: Schedule | None = None
+) -> Dict[int, float]:
+    """
+    Bind every operation with a machine_type to one machine of that type and reserve it in the pool.
+    Bound operations take the expected duration of their machine, and hold one of its slots for teardown as well.
+    What is reserved for an operation is kept as operation.reservation = (pool, seconds) for the run to release.
+    :param edges: edges between the positions in operation_list, or the Adjacency of the graph
+    :param duration: expected duration of an operation before it is bound
+    :param schedule: schedule of the graph with these durations when already known
+    :return: expected finish time of each node
+    """
+    machines_by_type: Dict[str, List[Operator]] = {}
+    for machine in machines:
+        machines_by_type.setdefault(machine.type, []).append(machine)
+    durations = [duration(operation) for operation in operation_list]
+    graph = Adjacency.of(edges, range(len(operation_list)))
+    if schedule is None:
+        schedule = create_schedule(graph, durations=durations.__getitem__)
+
+    with pool.lock:
+        now = pool.clock()
+        available_at = {}
+        load = {}
+        # 装置の見積もりは装置ごとに一度だけ求める
+        expected = {}
+        occupied_per_slot = {}
+        finish = {}
+        waiting = {node: len(graph.predecessors(node)) for node in graph.nodes}
+        ready = [(policy.priority(schedule, node), node) for node, count in waiting.items() if count == 0]
+        heapq.heapify(ready)
+        while ready:
+            _, node = heapq.heappop(ready)
+            operation = operation_list[node]
+            ready_at = max(map(finish.__getitem__, graph.predecessors(node)), default=now)
+            start = ready_at
+            if operation.machine_type is not None:
+                candidates = machines_by_type.get(operation.machine_type)
+                if not candidates:
+                    raise ValueError(f"No machine can run operations of type {operation.machine_type}")
+                for machine in candidates:
+                    if machine.id not in available_at:
+                        pool.register(machine)
+                        available_at[machine.id] = pool.available_at(machine.id)
+                        load[machine.id] = pool.load(machine.id)
+                        expected[machine.id] = machine.expected_seconds()
+                        # スロットが複数あれば1スロットあたりの占有時間で見積もる
+                        occupied_per_slot[machine.id] = machine.occupied_seconds() / machine.capacity
+                if len(candidates) == 1:
+                    machine = candidates[0]
+                else:
+                    machine = min(candidates, key=lambda machine: policy.score(
+                        ready_at, expected[machine.id], available_at[machine.id], load[machine.id]
+                    ))
+                operation.bind_machine(machine)
+                start = max(ready_at, available_at[machine.id])
+                occupied = occupied_per_slot[machine.id]
+                available_at[machine.id] = start + occupied
+                load[machine.id] += occupied
+                pool.reserve(machine.id, start, occupied)
+                # 操作が終わるか実行されずに終わったときにrelease_reservationで返す
+                operation.reservation = (pool, occupied)
+                finish[node] = start + expected[machine.id]
+            else:
+                finish[node] = start + durations[node]
+            for child in graph.successors(node):
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    heapq.heappush(ready, (policy.priority(schedule, child), child))
+    return finish
@@ -2,34 +2,31 @@ from lib_operator import Operator
 
 
 class HumanPlateServer(Operator):
-    def __init__(self, id, manipulate_list, storage_address):
-        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, type="ServePlate96")
+    def __init__(self, id, manipulate_list, storage_address, capacity=1, **timing):
+        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, capacity=capacity, **timing, type="ServePlate96")
 
 
 class TecanFluent480(Operator):
-    def __init__(self, id, manipulate_list, storage_address):
-        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, type="DispenseLiquid96Wells")
+    def __init__(self, id, manipulate_list, storage_address, capacity=1, **timing):
+        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, capacity=capacity, **timing, type="DispenseLiquid96Wells")
 
 
 class OpentronsOT2(Operator):
-    def __init__(self, id, manipulate_list, storage_address):
-        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, type="DispenseLiquid96Wells")
+    def __init__(self, id, manipulate_list, storage_address, capacity=1, **timing):
+        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, capacity=capacity, **timing, type="DispenseLiquid96Wells")
 
 
 class TecanInfinite200Pro(Operator):
-    def __init__(self, id, manipulate_list, storage_address):
-        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, type="ReadAbsorbance3Colors")
+    def __init__(self, id, manipulate_list, storage_address, capacity=1, **timing):
+        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, capacity=capacity, **timing, type="ReadAbsorbance3Colors")
 
 
 class HumanStoreLabware(Operator):
-    def __init__(self, id, manipulate_list, storage_address):
-        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, type="StoreLabware")
+    def __init__(self, id, manipulate_list, storage_address, capacity=1, **timing):
+        super().__init__(id, manipulate_list=manipulate_list, storage_address=storage_address, capacity=capacity, **timing, type="StoreLabware")
 
 
-# machines = [
-#     HumanPlateServer("human_plate_server", manipulate_list),
-#     TecanFluent480("tecan_fluent_480", manipulate_list),
-#     OpentronsOT2("opentrons_ot2", manipulate_list),
-#     TecanInfinite200Pro("tecan_infinite_200_pro", manipulate_list),
-#     HumanStoreLabware("human_store_labware", manipulate_list),
-# ]
+MACHINE_CLASSES = {
+    machine_class.__name__: machine_class
+    for machine_class in [HumanPlateServer, TecanFluent480, OpentronsOT2, TecanInfinite200Pro, HumanStoreLabware]
+}
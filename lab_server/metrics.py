@@ -0,0 +1,83 @@
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, time
+import json
+from prometheus_client import Counter, Histogram
+
+# 装置の操作は秒から分単位なので既定より長いバケットも用意する
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+REQUEST_SECONDS = Histogram(
+    "lab_server_request_seconds", "Time to answer a request to the lab server",
+    ["endpoint", "method", "status"], buckets=SECONDS_BUCKETS
+)
+SUBMISSION_STAGE_SECONDS = Histogram(
+    "lab_server_submission_stage_seconds", "Time spent in each stage of a submission request",
+    ["endpoint", "stage"], buckets=SECONDS_BUCKETS
+)
+RUN_STAGE_SECONDS = Histogram(
+    "lab_server_run_stage_seconds", "Time spent in each stage of executing a run (job_wait, create_graph, execute)",
+    ["execution_mode", "stage"], buckets=SECONDS_BUCKETS
+)
+LOG_SERVER_SECONDS = Histogram(
+    "lab_server_log_server_request_seconds", "Round-trip time of requests to the log server, retries included",
+    ["method", "endpoint"], buckets=SECONDS_BUCKETS
+)
+LOG_SERVER_ERRORS = Counter(
+    "lab_server_log_server_errors_total", "Requests to the log server that failed after retries",
+    ["method", "endpoint"]
+)
+OPERATION_QUEUE_SECONDS = Histogram(
+    "lab_server_operation_queue_seconds", "Time a realtime operation waited for its machine",
+    ["machine_id", "operation_type"], buckets=SECONDS_BUCKETS
+)
+OPERATION_EXECUTION_SECONDS = Histogram(
+    "lab_server_operation_execution_seconds", "Time a realtime operation ran on its machine",
+    ["machine_id", "operation_type"], buckets=SECONDS_BUCKETS
+)
+TENANT_WAIT_SECONDS = Histogram(
+    "lab_server_tenant_wait_seconds", "Time runs of a tenant waited for a worker (queue=runs) or for a machine (queue=machines)",
+    ["tenant", "queue"], buckets=SECONDS_BUCKETS
+)
+OPERATIONS = Counter(
+    "lab_server_operations_total", "Realtime operations by outcome",
+    ["machine_id", "operation_type", "status"]
+)
+
+
+def log_server_endpoint(path: str) -> str:
+    """/operations/12 -> /operations/{id} so that every record does not get its own label"""
+    parts = path.strip("/").split("/")
+    if len(parts) > 1 and parts[1] != "bulk":
+        parts[1] = "{id}"
+    return "/" + "/".join(parts)
+
+
+@contextmanager
+def timed(histogram: Histogram, trace: "RunTrace | None" = None, span: str | None = None, **labels):
+    """Observe the duration of the block, and record it as `span` too when tracing"""
+    started_at = time()
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(perf_counter() - started)
+        if trace is not None and span is not None:
+            trace.record(span, started_at, time(), **labels)
+
+
+class RunTrace:
+    """Spans of one run appended as NDJSON to `<directory>/<run_id>.ndjson`"""
+    path: Path
+
+    def __init__(self, directory, run_id):
+        self.path = Path(directory) / f"{run_id}.ndjson"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+
+    def record(self, name: str, started_at: float, finished_at: float, **attributes):
+        line = json.dumps({"name": name, "start": started_at, "end": finished_at, **attributes}, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
@@ -0,0 +1,129 @@
+from typing import Callable, Dict, List, Tuple
+from scheduler import Adjacency
+from simulation import EventScheduler, VirtualClock, simulate_dag
+
+
+class RunPlan:
+    """
+    Predicted execution of a run: every operation takes its expected duration and waits for its machine,
+    as a simulated run would with those durations.
+    """
+    graph: Adjacency
+    times: Dict[int, Tuple[float, float]]
+    makespan: float
+    critical_path: List[int]
+
+    def __init__(self, operation_list: List, edges: List[Tuple[int, int]] | Adjacency, times: Dict[int, Tuple[float, float]]):
+        self.operation_list = operation_list
+        self.graph = Adjacency.of(edges, range(len(operation_list)))
+        self.times = times
+        self.makespan = max((finish for _, finish in times.values()), default=0.0)
+        self.critical_path = self._critical_path()
+
+    def _critical_path(self) -> List[int]:
+        """
+        Operations the makespan depends on, walking back from the last one to finish through whatever made
+        each one start when it did: a predecessor finishing, or the previous operation on its machine
+        """
+        if not self.times:
+            return []
+        previous_on_machine = {}
+        by_machine: Dict[str, List[int]] = {}
+        for node, operation in enumerate(self.operation_list):
+            if operation.machine_id is not None and node in self.times:
+                by_machine.setdefault(operation.machine_id, []).append(node)
+        for nodes in by_machine.values():
+            nodes.sort(key=lambda node: self.times[node][0])
+            previous_on_machine.update(zip(nodes[1:], nodes))
+        node = max(self.times, key=lambda node: self.times[node][1])
+        path = [node]
+        while True:
+            start = self.times[node][0]
+            blockers = [parent for parent in self.graph.predecessors(node) if parent in self.times]
+            if node in previous_on_machine:
+                blockers.append(previous_on_machine[node])
+            blockers = [blocker for blocker in blockers if self.times[blocker][1] <= start]
+            if not blockers:
+                break
+            node = max(blockers, key=lambda blocker: self.times[blocker][1])
+            path.append(node)
+        path.reverse()
+        return path
+
+    def machine_utilization(self) -> Dict[str, Dict]:
+        """Busy time of every machine, teardown included, utilization is per slot"""
+        machines: Dict[str, Dict] = {}
+        capacities = {}
+        for node, (start, finish) in self.times.items():
+            operation = self.operation_list[node]
+            if operation.machine_id is None:
+                continue
+            machine = machines.setdefault(operation.machine_id, {"operations": 0, "busy_seconds": 0.0})
+            machine["operations"] += 1
+            machine["busy_seconds"] += finish - start + operation.teardown_seconds
+            capacities[operation.machine_id] = operation.machine.capacity if operation.machine is not None else 1
+        for machine_id, machine in machines.items():
+            machine["utilization"] = machine["busy_seconds"] / self.makespan / capacities[machine_id] if self.makespan else 0.0
+        return machines
+
+    def max_parallelism(self) -> int:
+        """Most operations running at the same time"""
+        events = sorted(
+            [(start, 1) for start, finish in self.times.values() if finish > start]
+            + [(finish, -1) for start, finish in self.times.values() if finish > start]
+        )
+        running = peak = 0
+        for _, change in events:
+            running += change
+            peak = max(peak, running)
+        return peak
+
+    def to_dict(self):
+        label = lambda node: self.operation_list[node].name if self.operation_list[node].is_transport else self.operation_list[node].process_name  # noqa: E731
+        machines = self.machine_utilization()
+        return {
+            "operations": len(self.operation_list),
+            "transports": sum(1 for operation in self.operation_list if operation.is_transport),
+            "makespan_seconds": self.makespan,
+            "critical_path": [{
+                "operation": label(node),
+                "machine_id": self.operation_list[node].machine_id,
+                "start": self.times[node][0],
+                "finish": self.times[node][1],
+            } for node in self.critical_path],
+            "machines": machines,
+            "bottleneck": max(machines, key=lambda machine_id: machines[machine_id]["busy_seconds"], default=None),
+            "max_parallelism": self.max_parallelism(),
+        }
+
+
+def plan_run(
+        operation_list: List,
+        edges: List[Tuple[int, int]] | Adjacency,
+        duration: Callable[[int], float],
+        order: List[int] | None = None,
+        capacity: Callable[[str], int] = lambda machine_id: 1,
+        teardown: Callable[[int], float] = lambda node: 0.0
+) -> RunPlan:
+    """
+    Predict a compiled run (machines assigned) without executing anything
+    :param edges: edges between the positions in operation_list, or the Adjacency of the graph (e.g. its RunGraph)
+    :param duration: expected duration of a node
+    :param order: dispatch priority among ready nodes, as for a real run
+    :param capacity: slots of a machine
+    :param teardown: time a node keeps its slot after it finishes
+    """
+    graph = Adjacency.of(edges, range(len(operation_list)))
+    scheduler = EventScheduler(VirtualClock(0.0))
+    times = simulate_dag(
+        nodes=range(len(operation_list)),
+        edges=graph,
+        duration=duration,
+        scheduler=scheduler,
+        machine=lambda node: operation_list[node].machine_id,
+        order=order,
+        capacity=capacity,
+        teardown=teardown
+    )
+    scheduler.run()
+    return RunPlan(operation_list, graph, times)
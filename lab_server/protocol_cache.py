@@ -0,0 +1,101 @@
+from typing import Any, Dict
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+import logging
+import pickle
+
+logger = logging.getLogger(__name__)
+
+
+class ProtocolCache:
+    """
+    LRU cache of compiled protocols bounded by number of entries and by pickled size.
+    When persist_dir is given every entry is also kept there as `<key>.pickle` and reloaded on startup.
+    """
+    max_entries: int
+    max_bytes: int
+    persist_dir: Path | None
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024, persist_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 読めずに捨てた永続化エントリ
+        self.corrupt_entries = 0
+        if self.persist_dir:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            self._load_persisted()
+
+    @staticmethod
+    def key(*checksums: str) -> str:
+        return "-".join(checksums)
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._insert(key, value, len(data))
+            evicted = self._evict()
+        if self.persist_dir:
+            if key not in evicted:
+                (self.persist_dir / f"{key}.pickle").write_bytes(data)
+            for evicted_key in evicted:
+                (self.persist_dir / f"{evicted_key}.pickle").unlink(missing_ok=True)
+
+    def _insert(self, key, value, size):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._sizes[key] = size
+
+    def _evict(self):
+        evicted = []
+        while len(self._entries) > self.max_entries or sum(self._sizes.values()) > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            del self._sizes[key]
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _load_persisted(self):
+        # 古いものから読み込んで最近使ったものが残るようにする
+        for path in sorted(self.persist_dir.glob("*.pickle"), key=lambda path: path.stat().st_mtime):
+            try:
+                data = path.read_bytes()
+                self._insert(path.stem, pickle.loads(data), len(data))
+            except Exception:
+                logger.warning("Evicting unreadable protocol cache entry %s", path, exc_info=True)
+                self.corrupt_entries += 1
+                path.unlink(missing_ok=True)
+        for key in self._evict():
+            (self.persist_dir / f"{key}.pickle").unlink(missing_ok=True)
+        self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(self._sizes.values()),
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'corrupt_entries': self.corrupt_entries,
+            }
@@ -0,0 +1,43 @@
+from typing import Dict, List
+from dataplane import Flow
+from scheduler import Adjacency, Schedule
+
+# Compiled protocols are pickled by PROTOCOL_CACHE_DIR and loaded back while lab_server is being imported,
+# so their classes live here where unpickling does not depend on how far lab_server got.
+
+# bumped when ProtocolTemplate changes so that templates persisted by PROTOCOL_CACHE_DIR are compiled again
+TEMPLATE_FORMAT = "6"
+
+
+class ProtocolTemplate:
+    """
+    Machine- and run-independent compilation result of a protocol, cached per checksum.
+    Node ids of `graph`, `flows`, `transports` and `schedule` are positions in `operations`,
+    `flows` connect the ports of the operations of two processes (through the transport in between if any),
+    `transports` maps every transport to the connection it carries.
+    """
+    processes: List[Dict]
+    operations: List[Dict]
+    graph: Adjacency
+    flows: List[Flow]
+    transports: Dict[int, Flow]
+    schedule: Schedule
+
+    def __init__(self, processes, operations, graph, flows, transports, schedule):
+        self.processes = processes
+        self.operations = operations
+        self.graph = graph
+        self.flows = flows
+        self.transports = transports
+        self.schedule = schedule
+
+
+class CompiledProtocol:
+    protocol: Dict
+    manipulates: List[Dict]
+    template: ProtocolTemplate
+
+    def __init__(self, protocol, manipulates, template):
+        self.protocol = protocol
+        self.manipulates = manipulates
+        self.template = template
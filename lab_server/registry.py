@@ -0,0 +1,107 @@
+from typing import Dict, List
+from pathlib import Path
+from threading import Lock
+import yaml
+from durations import DurationModel, parse_duration
+from lib_operator import Operator
+from machines import MACHINE_CLASSES
+
+
+class RegistrySnapshot:
+    """Immutable view of the lab's machines, shared by every run that started while it was current"""
+    storage_address: str
+    machines: List[Operator]
+    manipulates: Dict[str, Dict]
+    durations: Dict[str, DurationModel]
+
+    def __init__(self, storage_address, machines, manipulates, durations=None):
+        """
+        :param durations: operation type -> duration of the operations that run on no machine (transports, input, output)
+        """
+        self.storage_address = storage_address
+        self.machines = machines
+        self.manipulates = manipulates
+        self.durations = durations or {}
+
+
+class MachineRegistry:
+    """
+    Machines built once from a config file (see machines.yaml) instead of on every request.
+    `reload` builds a new snapshot and swaps it in, runs keep the snapshot they started with.
+    """
+    config_path: Path
+
+    def __init__(self, config_path):
+        self.config_path = Path(config_path)
+        self._lock = Lock()
+        self._config: Dict = {}
+        self._snapshot: RegistrySnapshot | None = None
+
+    @property
+    def snapshot(self) -> RegistrySnapshot:
+        if self._snapshot is None:
+            self.reload()
+        return self._snapshot
+
+    def reload(self) -> RegistrySnapshot:
+        with self._lock:
+            self._config = yaml.safe_load(self.config_path.read_text()) or {}
+            manipulates = {}
+            if self._config.get('manipulate_file'):
+                manipulate_path = self.config_path.parent / self._config['manipulate_file']
+                if manipulate_path.exists():
+                    manipulates.update({
+                        manipulate['name']: manipulate for manipulate in yaml.safe_load(manipulate_path.read_text()) or []
+                    })
+            self._snapshot = self._build_snapshot(manipulates)
+            return self._snapshot
+
+    def _build_snapshot(self, manipulates) -> RegistrySnapshot:
+        storage_address = self._config.get('storage_address', '')
+        machines = self.build_machines(self._config, manipulates, self.config_path.parent)
+        return RegistrySnapshot(storage_address, machines, manipulates, self.build_durations(self._config, self.config_path.parent))
+
+    @classmethod
+    def build_machines(cls, config: Dict, manipulates, base_dir=None, allow_logs=True) -> List[Operator]:
+        """
+        Machines of a config in the format of machines.yaml, e.g. a fleet to plan for
+        :param base_dir: directory the log files of empirical durations are relative to
+        :param allow_logs: False for uploaded configs, whose durations must not read log files of the server
+        """
+        storage_address = config.get('storage_address', '')
+        classes = config.get('machine_classes') or {}
+        durations = config.get('operation_durations') or {}
+        return [
+            cls._build({**classes.get(machine.get('class') or machine.get('type'), {}), **machine}, manipulates, storage_address, durations, base_dir, allow_logs)
+            for machine in config.get('machines') or []
+        ]
+
+    @staticmethod
+    def build_durations(config: Dict, base_dir=None, allow_logs=True) -> Dict[str, DurationModel]:
+        return {
+            operation_type: parse_duration(duration, base_dir, allow_logs=allow_logs)
+            for operation_type, duration in (config.get('operation_durations') or {}).items()
+        }
+
+    @staticmethod
+    def _build(machine, manipulates, storage_address, durations, base_dir, allow_logs=True) -> Operator:
+        """
+        :param machine: settings of the machine over the ones of its class
+        :param durations: operation type -> duration config, for machines that do not set their own
+        """
+        timing = {
+            'capacity': int(machine.get('capacity', 1)),
+            'setup': float(machine.get('setup', 0.0)),
+            'teardown': float(machine.get('teardown', 0.0)),
+        }
+        if machine.get('class'):
+            if machine['class'] not in MACHINE_CLASSES:
+                raise ValueError(f"Unknown machine class {machine['class']} for {machine['id']}")
+            built = MACHINE_CLASSES[machine['class']](machine['id'], manipulates, storage_address, **timing)
+        else:
+            built = Operator(machine['id'], machine['type'], manipulates, storage_address, **timing)
+        duration = machine.get('duration', durations.get(built.type))
+        if duration is not None:
+            # 実績ログから作る分布はその装置の記録だけを使う
+            built.duration = parse_duration(duration, base_dir, operator_id=built.id, allow_logs=allow_logs)
+        return built
@@ -0,0 +1,69 @@
+from typing import Dict, Iterable, List, Tuple
+from array import array
+from scheduler import Adjacency, Schedule
+
+
+class RunGraph(Adjacency):
+    """
+    Compiled operation graph of a run.
+    Nodes are the integer positions of operations in `operations`, edges are kept as
+    CSR adjacency arrays (offsets into a flat array of node ids) in both directions.
+    The graph is its own Adjacency: scheduling, execution and simulation of the run walk these arrays.
+    """
+    operations: List
+    successor_offsets: array
+    successor_targets: array
+    predecessor_offsets: array
+    predecessor_targets: array
+    by_process_name: Dict[str, int]
+    by_name: Dict[str, List[int]]
+    by_db_id: Dict[int, int]
+    schedule: Schedule | None
+
+    def __init__(self, operations: List, edges: Iterable[Tuple[int, int]], schedule: Schedule | None = None):
+        self.operations = operations
+        self.nodes = range(len(operations))
+        self.schedule = schedule
+        edges = sorted(set(edges))
+        self.successor_offsets, self.successor_targets = self._csr(len(operations), edges)
+        self.predecessor_offsets, self.predecessor_targets = self._csr(
+            len(operations), sorted((destination, source) for source, destination in edges)
+        )
+        self.by_process_name = {}
+        self.by_name = {}
+        for node, operation in enumerate(operations):
+            if not operation.is_transport:
+                self.by_process_name.setdefault(operation.process_name, node)
+            self.by_name.setdefault(operation.name, []).append(node)
+        self.reindex_db_ids()
+
+    @staticmethod
+    def _csr(num_nodes: int, sorted_edges: List[Tuple[int, int]]) -> Tuple[array, array]:
+        offsets = array('l', [0] * (num_nodes + 1))
+        targets = array('l', [destination for _, destination in sorted_edges])
+        for source, _ in sorted_edges:
+            offsets[source + 1] += 1
+        for node in range(num_nodes):
+            offsets[node + 1] += offsets[node]
+        return offsets, targets
+
+    def reindex_db_ids(self):
+        self.by_db_id = {
+            operation.db_id: node for node, operation in enumerate(self.operations) if getattr(operation, 'db_id', None) is not None
+        }
+
+    def __len__(self):
+        return len(self.operations)
+
+    def successors(self, node: int) -> array:
+        return self.successor_targets[self.successor_offsets[node]:self.successor_offsets[node + 1]]
+
+    def predecessors(self, node: int) -> array:
+        return self.predecessor_targets[self.predecessor_offsets[node]:self.predecessor_offsets[node + 1]]
+
+    def edges(self) -> List[Tuple[int, int]]:
+        return [(node, child) for node in self.nodes for child in self.successors(node)]
+
+    def indegrees(self) -> List[int]:
+        offsets = self.predecessor_offsets
+        return [offsets[node + 1] - offsets[node] for node in self.nodes]
@@ -0,0 +1,184 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Sequence, Tuple
+from collections import deque
+from itertools import chain
+
+
+class CycleError(ValueError):
+    """
+    Raised when the operation graph is not a DAG.
+    `nodes` are the nodes lying on (or between) cycles, `cycle` is one concrete cycle among them.
+    """
+    nodes: List[Hashable]
+    cycle: List[Hashable]
+
+    def __init__(self, nodes, cycle):
+        self.nodes = nodes
+        self.cycle = cycle
+        super().__init__(f"Protocol contains a cycle: {' -> '.join(map(str, cycle))}")
+
+
+class Adjacency:
+    """
+    Successors and predecessors of every node of a graph, built once per graph and handed to whatever walks it
+    (create_schedule, assign_machines, fuse_transports, execute_dag, simulate_dag, RunPlan) instead of edges
+    """
+    nodes: Sequence[Hashable]
+
+    def __init__(self, edges: Iterable[Tuple[Hashable, Hashable]] = (), nodes: Iterable[Hashable] = ()):
+        edges = list(dict.fromkeys(edges))
+        # 辺のない指定ノード、辺に現れた順のノードの順に並べる
+        self.nodes = list(dict.fromkeys(chain(nodes, chain.from_iterable(edges))))
+        self._successors: Dict[Hashable, List[Hashable]] = {node: [] for node in self.nodes}
+        self._predecessors: Dict[Hashable, List[Hashable]] = {node: [] for node in self.nodes}
+        for source, destination in edges:
+            self._successors[source].append(destination)
+            self._predecessors[destination].append(source)
+
+    @classmethod
+    def of(cls, edges: 'Iterable[Tuple[Hashable, Hashable]] | Adjacency', nodes: Iterable[Hashable] = ()) -> 'Adjacency':
+        """The index itself when edges already is one (nodes are then ignored), else a new index of edges and nodes"""
+        if isinstance(edges, Adjacency):
+            return edges
+        return cls(edges, nodes)
+
+    def successors(self, node: Hashable) -> Sequence[Hashable]:
+        return self._successors[node]
+
+    def predecessors(self, node: Hashable) -> Sequence[Hashable]:
+        return self._predecessors[node]
+
+    def edges(self) -> List[Tuple[Hashable, Hashable]]:
+        return [(node, child) for node in self.nodes for child in self.successors(node)]
+
+
+class Schedule:
+    order: List[Hashable]
+    levels: List[List[Hashable]]
+    level_of: Dict[Hashable, int]
+    earliest_start: Dict[Hashable, float]
+    latest_start: Dict[Hashable, float]
+    slack: Dict[Hashable, float]
+    critical_path: List[Hashable]
+    makespan: float
+
+    def __init__(self, order, levels, level_of, earliest_start, latest_start, critical_path, makespan):
+        self.order = order
+        self.levels = levels
+        self.level_of = level_of
+        self.earliest_start = earliest_start
+        self.latest_start = latest_start
+        self.slack = {node: latest_start[node] - earliest_start[node] for node in order}
+        self.critical_path = critical_path
+        self.makespan = makespan
+
+    @property
+    def max_parallelism(self) -> int:
+        return max((len(level) for level in self.levels), default=0)
+
+    def priority_order(self) -> List[Hashable]:
+        """Topological order with the least slack first, used as dispatch priority among ready nodes"""
+        return sorted(self.order, key=lambda node: (self.slack[node], self.earliest_start[node]))
+
+    def to_dict(self):
+        return {
+            'order': self.order,
+            'levels': self.levels,
+            'earliest_start': self.earliest_start,
+            'slack': self.slack,
+            'critical_path': self.critical_path,
+            'makespan': self.makespan,
+            'max_parallelism': self.max_parallelism,
+        }
+
+
+def _find_cycle(successors: Callable[[Hashable], Sequence[Hashable]], remaining: set) -> List[Hashable]:
+    node = next(iter(remaining))
+    path = []
+    position = {}
+    while node not in position:
+        position[node] = len(path)
+        path.append(node)
+        node = next(child for child in successors(node) if child in remaining)
+    return path[position[node]:] + [node]
+
+
+def create_schedule(
+        edges: Iterable[Tuple[Hashable, Hashable]] | Adjacency,
+        durations: Dict[Hashable, float] | Callable[[Hashable], float] | None = None,
+        nodes: Iterable[Hashable] = ()
+) -> Schedule:
+    """
+    Non-recursive topological scheduling (Kahn's algorithm)
+    :param edges: (from, to) pairs, or the Adjacency of the graph
+    :param durations: expected duration per node, 1 for every node when omitted
+    :param nodes: additional nodes without edges, ignored when edges is an Adjacency
+    :return: Schedule with dependency levels, earliest/latest start times, slack and critical path
+    """
+    graph = Adjacency.of(edges, nodes)
+    successors = graph.successors
+    indegree = {node: len(graph.predecessors(node)) for node in graph.nodes}
+    if durations is None:
+        duration_of = lambda node: 1.0  # noqa: E731
+    elif callable(durations):
+        duration_of = durations
+    else:
+        duration_of = durations.__getitem__
+
+    # 所要時間はノードごとに一度だけ求める
+    duration = {node: duration_of(node) for node in graph.nodes}
+    remaining_indegree = dict(indegree)
+    queue = deque(node for node, degree in indegree.items() if degree == 0)
+    order = []
+    level_of = {node: 0 for node in queue}
+    earliest_start = {node: 0.0 for node in queue}
+    finish_of = {}
+    critical_parent = {}
+    while queue:
+        node = queue.popleft()
+        order.append(node)
+        finish = finish_of[node] = earliest_start[node] + duration[node]
+        level = level_of[node] + 1
+        for child in successors(node):
+            if level > level_of.get(child, 0):
+                level_of[child] = level
+            if finish >= earliest_start.get(child, 0.0):
+                earliest_start[child] = finish
+                critical_parent[child] = node
+            remaining_indegree[child] -= 1
+            if remaining_indegree[child] == 0:
+                queue.append(child)
+
+    if len(order) != len(indegree):
+        remaining = {node for node, degree in remaining_indegree.items() if degree > 0}
+        # 閉路の下流にあるだけのノードを取り除く
+        changed = True
+        while changed:
+            changed = False
+            for node in list(remaining):
+                if not any(child in remaining for child in successors(node)):
+                    remaining.discard(node)
+                    changed = True
+        raise CycleError(sorted(remaining, key=str), _find_cycle(successors, remaining))
+
+    makespan = max(finish_of.values(), default=0.0)
+    latest_start = {}
+    for node in reversed(order):
+        latest_finish = makespan
+        for child in successors(node):
+            if latest_start[child] < latest_finish:
+                latest_finish = latest_start[child]
+        latest_start[node] = latest_finish - duration[node]
+
+    levels = [[] for _ in range(max(level_of.values(), default=-1) + 1)]
+    for node in order:
+        levels[level_of[node]].append(node)
+
+    critical_path = []
+    if order:
+        node = max(order, key=finish_of.__getitem__)
+        while node is not None:
+            critical_path.append(node)
+            node = critical_parent.get(node)
+        critical_path.reverse()
+
+    return Schedule(order, levels, level_of, earliest_start, latest_start, critical_path, makespan)
@@ -0,0 +1,126 @@
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+from datetime import datetime
+from itertools import count
+import heapq
+import time
+from scheduler import Adjacency, CycleError
+
+EXECUTION_MODES = ("realtime", "simulated")
+
+
+class VirtualClock:
+    """Simulated time in epoch seconds, only moved forward by the EventScheduler"""
+
+    def __init__(self, start: float | None = None):
+        self._now = time.time() if start is None else start
+
+    def time(self) -> float:
+        return self._now
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self._now)
+
+    def advance_to(self, timestamp: float):
+        if timestamp < self._now:
+            raise ValueError("A virtual clock cannot go backwards")
+        self._now = timestamp
+
+
+class EventScheduler:
+    """Discrete-event loop: callbacks run in timestamp order and the clock jumps between them"""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self._events = []
+        self._sequence = count()
+        # 同じschedulerで動くDAGの間で共有される装置の状態、使用中のスロット数
+        self.busy_machines: Dict[str, int] = {}
+        self.machine_queues: Dict[str, List] = {}
+
+    def at(self, timestamp: float, callback: Callable[[], None]):
+        heapq.heappush(self._events, (timestamp, self.next_sequence(), callback))
+
+    def next_sequence(self) -> int:
+        return next(self._sequence)
+
+    def after(self, delay: float, callback: Callable[[], None]):
+        self.at(self.clock.time() + delay, callback)
+
+    def run(self):
+        while self._events:
+            timestamp, _, callback = heapq.heappop(self._events)
+            self.clock.advance_to(timestamp)
+            callback()
+
+
+def simulate_dag(
+        nodes: Iterable[Hashable],
+        edges: Iterable[Tuple[Hashable, Hashable]] | Adjacency,
+        duration: Callable[[Hashable], float],
+        scheduler: EventScheduler,
+        machine: Callable[[Hashable], str | None] = lambda node: None,
+        on_start: Callable[[Hashable], None] = lambda node: None,
+        on_finish: Callable[[Hashable], None] = lambda node: None,
+        order: List[Hashable] | None = None,
+        capacity: Callable[[str], int] = lambda machine_id: 1,
+        teardown: Callable[[Hashable], float] = lambda node: 0.0
+) -> Dict[Hashable, Tuple[float, float]]:
+    """
+    Schedule every node on the event loop as soon as its predecessors have finished and a slot of its machine is free.
+    Call scheduler.run() afterwards (several DAGs can share one scheduler and contend for the same machines).
+    :param edges: (from, to) pairs or the Adjacency of the graph, edges to nodes that are not in nodes are ignored
+    :param capacity: slots of a machine, operations it runs at the same time
+    :param teardown: time the slot stays busy after the node finishes, successors do not wait for it
+    :return: node -> (start, finish) in virtual time, filled while the scheduler runs
+    """
+    nodes = list(nodes)
+    rank = {node: index for index, node in enumerate(order or [])}
+    graph = Adjacency.of(edges, nodes)
+    waiting = {node: 0 for node in nodes}
+    for node in nodes:
+        waiting[node] = sum(1 for parent in graph.predecessors(node) if parent in waiting)
+    busy_machines = scheduler.busy_machines
+    machine_queues = scheduler.machine_queues
+    times = {}
+
+    def start(node):
+        machine_id = machine(node)
+        if machine_id is not None:
+            if busy_machines.get(machine_id, 0) >= capacity(machine_id):
+                heapq.heappush(machine_queues.setdefault(machine_id, []), (rank.get(node, len(rank)), scheduler.next_sequence(), node, start))
+                return
+            busy_machines[machine_id] = busy_machines.get(machine_id, 0) + 1
+        started = scheduler.clock.time()
+        on_start(node)
+        scheduler.after(duration(node), lambda: finish(node, started))
+
+    def release(machine_id):
+        busy_machines[machine_id] -= 1
+        queue = machine_queues.get(machine_id)
+        if queue:
+            _, _, next_node, next_start = heapq.heappop(queue)
+            next_start(next_node)
+
+    def finish(node, started):
+        times[node] = (started, scheduler.clock.time())
+        on_finish(node)
+        machine_id = machine(node)
+        if machine_id is not None:
+            cleanup = teardown(node)
+            if cleanup > 0:
+                scheduler.after(cleanup, lambda: release(machine_id))
+            else:
+                release(machine_id)
+        for child in graph.successors(node):
+            if child not in waiting:
+                continue
+            waiting[child] -= 1
+            if waiting[child] == 0:
+                start(child)
+
+    ready = sorted((node for node in nodes if waiting[node] == 0), key=lambda node: rank.get(node, len(rank)))
+    if not ready and nodes:
+        raise CycleError(nodes, nodes)
+    for node in ready:
+        scheduler.after(0, lambda node=node: start(node))
+    return times
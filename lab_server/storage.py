@@ -0,0 +1,229 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+from itertools import islice
+from pathlib import Path
+from threading import Condition, Thread
+import logging
+import os
+import time
+from journal import LOCAL_ID_PREFIX
+
+logger = logging.getLogger(__name__)
+
+
+def sharded_path(root, kind: str, db_id, levels=2, width=2) -> Path:
+    """
+    Directory of a record sharded by the first characters of its id so that no directory grows too large,
+    e.g. /storage/operations/3f/a2/L-3fa2...
+    """
+    key = str(db_id).removeprefix(LOCAL_ID_PREFIX).rjust(levels * width, "0")
+    shards = [key[level * width:(level + 1) * width] for level in range(levels)]
+    return Path(root, kind, *shards, str(db_id))
+
+
+class StorageError(OSError):
+    """Artifacts could not be written: the last batch failed or the writer thread is gone"""
+
+
+class StorageWriter:
+    """
+    Writes artifacts to disk on a background thread.
+    `write` only keeps the content in memory: the caller goes on with the content it already has,
+    `read` serves artifacts that are not on disk yet from memory.
+    Queued artifacts are written in batches of up to max_batch_files and fsynced together,
+    `after_written` runs a callback once a set of artifacts is on disk.
+    """
+    max_pending_bytes: int
+    max_batch_files: int
+    fsync: bool
+    flush_timeout: float
+
+    def __init__(self, max_pending_bytes=256 * 1024 * 1024, max_batch_files=256, fsync=True, flush_timeout=60.0):
+        """
+        :param flush_timeout: seconds flush and stop wait for the writer thread before giving up
+        """
+        self.max_pending_bytes = max_pending_bytes
+        self.max_batch_files = max_batch_files
+        self.fsync = fsync
+        self.flush_timeout = flush_timeout
+        self._pending: Dict[Path, bytes] = {}
+        self._pending_bytes = 0
+        # 書き込み待ちのパスごとに、そのパスを待っている[残りのパス数, callback]
+        self._waiters: Dict[Path, List[list]] = {}
+        self._writing = False
+        self._condition = Condition()
+        self._stopped = True
+        self._thread: Thread | None = None
+        self.written_files = 0
+        self.written_bytes = 0
+        self.batches = 0
+        self.last_error: str | None = None
+
+    def start(self):
+        self._stopped = False
+        self._thread = Thread(target=self._write_continuously, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            # 残りはスレッドが書いてから終わる、fsyncなどで止まっていれば待ちきらない
+            self._thread.join(self.flush_timeout)
+            if self._thread.is_alive():
+                logger.error("Storage writer did not stop within %s s, %s artifacts are not written", self.flush_timeout, len(self._pending))
+                return
+            self._thread = None
+        else:
+            while self._pending and self._write_batch():
+                pass
+        if self._pending:
+            logger.error("%s artifacts could not be written: %s", len(self._pending), self.last_error)
+
+    def write(self, path, content: str | bytes):
+        data = content.encode("utf-8") if isinstance(content, str) else bytes(content)
+        path = Path(path)
+        with self._condition:
+            # 書き込みが追いつかないときは呼び出し側を待たせてメモリを抑える
+            while self._pending_bytes + len(data) > self.max_pending_bytes and self._pending and not self._stopped:
+                self._condition.wait()
+            self._pending_bytes += len(data) - len(self._pending.get(path, b""))
+            self._pending[path] = data
+            self._condition.notify_all()
+
+    def after_written(self, paths: Iterable, callback: Callable[[], None]):
+        """
+        Call callback once all of paths are on disk: right away when none of them is pending,
+        otherwise on the thread that writes the last of them
+        """
+        with self._condition:
+            waiting = {Path(path) for path in paths} & self._pending.keys()
+            if waiting:
+                waiter = [len(waiting), callback]
+                for path in waiting:
+                    self._waiters.setdefault(path, []).append(waiter)
+                return
+        callback()
+
+    def pending(self, path) -> bytes | None:
+        """Content of path while it is waiting to be written"""
+        with self._condition:
+            return self._pending.get(Path(path))
+
+    def read(self, path) -> bytes:
+        data = self.pending(path)
+        return Path(path).read_bytes() if data is None else data
+
+    def flush(self, timeout: float | None = None):
+        """
+        Block until everything written so far is on disk
+        :param timeout: seconds to wait, flush_timeout when omitted; TimeoutError once they have passed
+        :raise StorageError: when a batch fails to be written or the writer thread has died
+        """
+        thread = self._thread
+        if thread is None:
+            while self._pending:
+                if not self._write_batch():
+                    raise StorageError(f"{len(self._pending)} artifacts could not be written: {self.last_error}")
+            return
+        timeout = self.flush_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._writing:
+                if self.last_error is not None and not self._writing:
+                    raise StorageError(f"{len(self._pending)} artifacts could not be written: {self.last_error}")
+                if not thread.is_alive():
+                    raise StorageError(f"Storage writer thread died with {len(self._pending)} artifacts not written")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"{len(self._pending)} artifacts were not written within {timeout} s")
+                # スレッドが落ちても通知は来ないので時々確かめる
+                self._condition.wait(min(remaining, 1.0))
+
+    def _write_continuously(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped and not self._pending:
+                    return
+            if not self._write_batch():
+                if self._stopped:
+                    return
+                with self._condition:
+                    self._condition.wait(1.0)
+
+    def _write_batch(self) -> bool:
+        """:return: False when the batch could not be written and stays pending"""
+        with self._condition:
+            batch: List[Tuple[Path, bytes]] = list(islice(self._pending.items(), self.max_batch_files))
+            self._writing = True
+        written = set()
+        ready: List[Callable[[], None]] = []
+        try:
+            directories = set()
+            files = []
+            try:
+                for path, data in batch:
+                    if path.parent not in directories:
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        directories.add(path.parent)
+                    file = open(path, "wb")
+                    files.append(file)
+                    file.write(data)
+                    file.flush()
+                    written.add(path)
+                if self.fsync:
+                    for file in files:
+                        os.fsync(file.fileno())
+            finally:
+                for file in files:
+                    file.close()
+            if self.fsync:
+                for directory in directories:
+                    descriptor = os.open(directory, os.O_RDONLY)
+                    try:
+                        os.fsync(descriptor)
+                    finally:
+                        os.close(descriptor)
+            self.last_error = None
+        except OSError as e:
+            # 書けなかったものはメモリに残して次のバッチで再試行する
+            self.last_error = f"{type(e).__name__}: {e}"
+            written = set()
+        finally:
+            with self._condition:
+                for path, data in batch:
+                    if path in written and self._pending.get(path) is data:
+                        del self._pending[path]
+                        self._pending_bytes -= len(data)
+                        self.written_files += 1
+                        self.written_bytes += len(data)
+                        for waiter in self._waiters.pop(path, []):
+                            waiter[0] -= 1
+                            if waiter[0] == 0:
+                                ready.append(waiter[1])
+                if written:
+                    self.batches += 1
+                self._condition.notify_all()
+            for callback in ready:
+                try:
+                    callback()
+                except Exception:
+                    logger.exception("Callback after writing %s failed", callback)
+            # flushはcallbackが終わるまで待つ
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+        return self.last_error is None
+
+    def stats(self):
+        with self._condition:
+            return {
+                "pending_files": len(self._pending),
+                "pending_bytes": self._pending_bytes,
+                "written_files": self.written_files,
+                "written_bytes": self.written_bytes,
+                "batches": self.batches,
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+from itertools import count
+from pathlib import Path
+import pytest
+
+# モジュールはlab_server/からそのままimportされる
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# lab_serverをimportするテストがディスクやlog serverに触れないようにする
+_root = tempfile.mkdtemp(prefix="lab_server_tests_")
+os.environ.setdefault("STORAGE_ROOT", os.path.join(_root, "storage"))
+os.environ.setdefault("CHECKPOINT_DIR", os.path.join(_root, "checkpoints"))
+os.environ.setdefault("LOG_BACKEND", "sqlite")
+os.environ.setdefault("LOG_SQLITE_PATH", os.path.join(_root, "log.sqlite3"))
+os.environ.setdefault("LOG_JOURNAL_DIR", os.path.join(_root, "journal"))
+os.environ.setdefault("STORAGE_FSYNC", "0")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+@pytest.fixture(scope="session")
+def lab():
+    """The lab_server module with its background workers started (the app's lifespan)"""
+    import lab_server
+    from fastapi.testclient import TestClient
+    with TestClient(lab_server.app):
+        yield lab_server
+
+
+@pytest.fixture(scope="session")
+def compiled(lab):
+    """The protocol of the repository, compiled as an upload would be"""
+    return lab.compile_upload((REPO_ROOT / "protocol.yaml").read_bytes(), (REPO_ROOT / "manipulate.yaml").read_bytes())
+
+
+@pytest.fixture(scope="session")
+def inputs(lab, compiled):
+    """Values of the inputs of the protocol of the repository for one run"""
+    return lab.bind_inputs(compiled.protocol, {"volume": [10.0]})
+
+
+@pytest.fixture(scope="session")
+def run_ids():
+    """Run ids not used by any other test"""
+    return count(100_000)
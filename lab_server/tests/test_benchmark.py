@@ -0,0 +1,25 @@
+import pytest
+from benchmark.generator import SHAPES, dump, generate, manipulates
+from benchmark.harness import run_case
+
+
+@pytest.mark.parametrize("shape", sorted(SHAPES))
+def test_generated_protocols_compile(lab, shape):
+    compiled = lab.compile_upload(dump(generate(shape, 50)), dump(manipulates()))
+    assert len([process for process in compiled.template.processes if process["id_in_protocol"].startswith("step")]) == 50
+
+
+class JournalAlreadyShipped:
+    """The app's own shipper ships lab_server.log_journal in these tests"""
+
+    def ship(self):
+        return 0
+
+
+def test_every_phase_is_timed(lab):
+    result = run_case(lab, JournalAlreadyShipped(), "random", 100, max_workers=4)
+    assert set(result["seconds"]) == {
+        "yaml_parse", "connection_to_operation", "compile_template", "create_process_and_operation_and_edge",
+        "log_shipping", "create_plan", "dispatch"
+    }
+    assert result["operations"] == 100 and result["nodes"] >= 100
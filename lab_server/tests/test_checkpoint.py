@@ -0,0 +1,91 @@
+from pathlib import Path
+import numpy as np
+import pytest
+from checkpoint import RunCheckpoint
+from dataplane import DataPlane, save_outputs
+from storage import StorageWriter
+
+
+def test_operations_are_marked_completed_once_their_outputs_are_on_disk(tmp_path):
+    writer = StorageWriter(fsync=False)
+    checkpoint = RunCheckpoint(tmp_path / "checkpoints", 1)
+    checkpoint.save({})
+    paths = save_outputs({"value": np.arange(3.0), "label": "a"}, tmp_path / "operation", writer)
+    writer.after_written(paths, lambda: checkpoint.mark_completed(0, [path.name for path in paths]))
+    assert checkpoint.completed() == {}
+    writer.flush()
+    assert checkpoint.completed() == {0: ["value.npy", "data.json"]}
+    dataplane = DataPlane([])
+    dataplane.restore(0, tmp_path / "operation", ["value.npy", "data.json"])
+    assert dataplane.outputs[0]["label"] == "a"
+    np.testing.assert_array_equal(dataplane.outputs[0]["value"], np.arange(3.0))
+
+
+def test_restoring_missing_outputs_fails(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        DataPlane([]).restore(0, tmp_path, ["value.npy"])
+
+
+def test_completions_after_the_run_finished_are_ignored(tmp_path):
+    checkpoint = RunCheckpoint(tmp_path, 1)
+    checkpoint.save({})
+    checkpoint.remove()
+    checkpoint.mark_completed(0, ["log.txt"])
+    assert not checkpoint.directory.exists()
+
+
+def crash_after(lab, monkeypatch, completions):
+    complete = lab.Operation.complete
+    completed = []
+
+    def crash(operation, finished_at):
+        if len(completed) == completions:
+            raise RuntimeError("server crashed")
+        complete(operation, finished_at)
+        completed.append(operation.node)
+
+    monkeypatch.setattr(lab.Operation, "complete", crash)
+    return completed
+
+
+def test_crash_between_write_and_flush(lab, compiled, inputs, run_ids, monkeypatch):
+    run_id = next(run_ids)
+    # 落ちるまで一度もディスクに書けなかったstorage_writer
+    monkeypatch.setattr(lab, "storage_writer", StorageWriter(fsync=False))
+    with monkeypatch.context() as crashing:
+        crash_after(lab, crashing, 3)
+        with pytest.raises(RuntimeError, match="server crashed"):
+            lab.execute_run(run_id, compiled, "simulated", inputs=inputs)
+    checkpoint = RunCheckpoint(lab.CHECKPOINT_DIR, run_id)
+    assert checkpoint.completed() == {}
+
+    # 再起動後のstorage_writer、書き込み待ちだった出力は失われている
+    writer = StorageWriter(fsync=False)
+    monkeypatch.setattr(lab, "storage_writer", writer)
+    state = checkpoint.load()
+    lab.resume_run(run_id, checkpoint, state)
+    writer.flush()
+    assert not checkpoint.exists()
+    for operation in state["operations"]:
+        assert (Path(operation["storage_address"]) / "log.txt").exists()
+
+
+def test_operations_whose_outputs_are_missing_run_again(lab, compiled, inputs, run_ids, monkeypatch):
+    run_id = next(run_ids)
+    writer = StorageWriter(fsync=False)
+    monkeypatch.setattr(lab, "storage_writer", writer)
+    with monkeypatch.context() as crashing:
+        completed = crash_after(lab, crashing, 3)
+        with pytest.raises(RuntimeError, match="server crashed"):
+            lab.execute_run(run_id, compiled, "simulated", inputs=inputs)
+    writer.flush()
+    checkpoint = RunCheckpoint(lab.CHECKPOINT_DIR, run_id)
+    assert sorted(checkpoint.completed()) == sorted(completed)
+    state = checkpoint.load()
+    lost = completed[-1]
+    (Path(state["operations"][lost]["storage_address"]) / "log.txt").unlink()
+    skipped = []
+    monkeypatch.setattr(lab, "run_graph", lambda *args: skipped.append(args[-1]))
+    lab.resume_run(run_id, checkpoint, state)
+    assert skipped == [set(completed) - {lost}]
+    checkpoint.remove()
@@ -0,0 +1,78 @@
+from pathlib import Path
+import json
+import numpy as np
+import pytest
+from dataplane import PLATE_WELLS, DataPlane, as_buffer, load_array, save_outputs
+from storage import StorageWriter
+
+# input -> dispense(1) -> read(2) -> output(3), the plate comes from serve(4)
+FLOWS = [
+    (0, "volume", 1, "volume"),
+    (4, "value", 1, "in1"),
+    (1, "out1", 2, "in1"),
+    (2, "value", 3, "data"),
+]
+
+
+def run(dataplane):
+    for node, operation_type in [(0, "input"), (4, "ServePlate96"), (1, "DispenseLiquid96Wells"), (2, "ReadAbsorbance3Colors"), (3, "output")]:
+        dataplane.run(node, operation_type)
+
+
+def test_values_flow_along_the_connections_by_reference():
+    dataplane = DataPlane(FLOWS, {"volume": [10, 20]}, seed=1)
+    run(dataplane)
+    plate = dataplane.outputs[1]["out1"]
+    assert plate.dtype == np.float64 and plate.shape == (PLATE_WELLS,)
+    assert plate[:4].tolist() == [10, 20, 10, 20]
+    assert dataplane.inputs_of(2)["in1"] is plate
+    assert dataplane.outputs[3]["data"] is dataplane.outputs[2]["value"]
+    assert dataplane.outputs[3]["data"].shape == (PLATE_WELLS, 3)
+
+
+def test_runs_with_the_same_seed_measure_the_same():
+    first, second = DataPlane(FLOWS, {"volume": [10]}, seed=3), DataPlane(FLOWS, {"volume": [10]}, seed=3)
+    run(first)
+    run(second)
+    np.testing.assert_array_equal(first.outputs[3]["data"], second.outputs[3]["data"])
+
+
+def test_only_numeric_lists_become_arrays():
+    assert as_buffer([1, 2.5]).dtype == np.float64
+    assert as_buffer([True, 1]) == [True, 1]
+    assert as_buffer("plate") == "plate"
+
+
+def test_saved_arrays_are_read_back_read_only(tmp_path):
+    writer = StorageWriter(fsync=False)
+    value = np.arange(6.0).reshape(2, 3)
+    (path,) = save_outputs({"value": value}, tmp_path, writer)
+    np.testing.assert_array_equal(load_array(path, writer), value)
+    writer.flush()
+    loaded = load_array(path)
+    np.testing.assert_array_equal(loaded, value)
+    with pytest.raises(ValueError):
+        loaded[0, 0] = 1.0
+
+
+def test_a_run_saves_the_values_of_its_inputs_and_what_they_produce(lab, compiled, run_ids, monkeypatch):
+    graphs = []
+    run_graph = lab.run_graph
+
+    def recording_run_graph(run_id, compiled, graph, *args):
+        graphs.append(graph)
+        return run_graph(run_id, compiled, graph, *args)
+
+    monkeypatch.setattr(lab, "run_graph", recording_run_graph)
+    lab.execute_run(next(run_ids), compiled, "simulated", inputs=lab.bind_inputs(compiled.protocol, {"volume": [10.0, 20.0]}))
+    lab.storage_writer.flush()
+    (graph,) = graphs
+    directory = lambda process_name: Path(graph.operations[graph.by_process_name[process_name]].storage_address)  # noqa: E731
+    np.testing.assert_array_equal(load_array(directory("input") / "volume.npy"), [10.0, 20.0])
+    assert json.loads((directory("input") / "data.json").read_text()) == {"channel": 0}
+    assert load_array(directory("output") / "data.npy")[:2, 0].tolist() == pytest.approx([0.12, 0.24], abs=0.05)
+
+
+def test_a_run_without_a_value_for_an_input_fails(lab, compiled, run_ids):
+    with pytest.raises(ValueError, match="Input volume has no value"):
+        lab.execute_run(next(run_ids), compiled, "simulated")
@@ -0,0 +1,28 @@
+from fastapi.testclient import TestClient
+from conftest import REPO_ROOT
+
+
+def dry_run(client, protocol: bytes, policy="critical_path"):
+    response = client.post("/dry_run", params={"policy": policy}, files={
+        "protocol_yaml": ("protocol.yaml", protocol),
+        "manipulate_yaml": ("manipulate.yaml", (REPO_ROOT / "manipulate.yaml").read_bytes()),
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_repeated_dry_runs_are_answered_from_the_plan_cache(lab, monkeypatch):
+    client = TestClient(lab.app)
+    # 他のテストと重ならないprotocol
+    protocol = (REPO_ROOT / "protocol.yaml").read_bytes() + b"\n# test_dry_run\n"
+    plans = []
+    plan_protocol = lab.plan_protocol
+    monkeypatch.setattr(lab, "plan_protocol", lambda *args: plans.append(args) or plan_protocol(*args))
+    first = dry_run(client, protocol)
+    hits = lab.plan_cache.stats()["hits"]
+    assert dry_run(client, protocol) == first
+    assert lab.plan_cache.stats()["hits"] == hits + 1
+    assert len(plans) == 1
+    assert first["makespan_seconds"] > 0
+    dry_run(client, protocol, policy="least_loaded")
+    assert len(plans) == 2
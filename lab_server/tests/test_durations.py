@@ -0,0 +1,62 @@
+import json
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from conftest import REPO_ROOT
+from durations import LogNormalDuration, parse_duration
+from registry import MachineRegistry
+
+
+def test_lognormal_durations_have_the_configured_mean():
+    duration = LogNormalDuration(2.0, 0.5)
+    samples = duration.sample(np.random.default_rng(0), 200_000)
+    assert samples.mean() == pytest.approx(2.0, rel=0.01)
+    assert samples.std() == pytest.approx(0.5, rel=0.02)
+
+
+def test_empirical_durations_use_the_logs_of_their_machine(tmp_path):
+    logs = [
+        {"operator_id": "a", "status": "completed", "start_time": "2024-01-01T00:00:00", "end_time": "2024-01-01T00:00:02"},
+        {"operator_id": "a", "status": "failed", "start_time": "2024-01-01T00:00:00", "end_time": "2024-01-01T00:00:09"},
+        {"operator_id": "b", "status": "completed", "start_time": "2024-01-01T00:00:00", "end_time": "2024-01-01T00:00:05"},
+    ]
+    (tmp_path / "logs.ndjson").write_text("".join(json.dumps(log) + "\n" for log in logs))
+    duration = parse_duration({"distribution": "empirical", "log": "logs.ndjson"}, tmp_path, operator_id="a")
+    assert duration.samples.tolist() == [2.0]
+
+
+def test_uploaded_fleets_cannot_read_log_files(tmp_path):
+    fleet = {"machines": [{"id": "a", "type": "A", "duration": {"distribution": "empirical", "log": str(tmp_path / "logs.ndjson")}}]}
+    with pytest.raises(ValueError, match="log files cannot be read"):
+        MachineRegistry.build_machines(fleet, {}, allow_logs=False)
+    with pytest.raises(ValueError, match="log files cannot be read"):
+        MachineRegistry.build_durations({"operation_durations": {"transport": {"distribution": "empirical", "log": "/etc/passwd"}}}, allow_logs=False)
+    assert MachineRegistry.build_durations({"operation_durations": {"transport": {"distribution": "empirical", "samples": [1, 2]}}}, allow_logs=False)
+
+
+def test_forecasts_reject_fleets_reading_log_files(lab):
+    fleet = "machines:\n  - id: a\n    class: TecanFluent480\n    duration: {distribution: empirical, log: /etc/passwd}\n"
+    response = TestClient(lab.app).post("/forecasts", data={"runs": "[1]"}, files=[
+        ("protocol_yaml", ("protocol.yaml", (REPO_ROOT / "protocol.yaml").read_bytes())),
+        ("manipulate_yaml", ("manipulate.yaml", (REPO_ROOT / "manipulate.yaml").read_bytes())),
+        ("machines_yaml", ("machines.yaml", fleet.encode())),
+    ])
+    assert response.status_code == 400
+    assert "log files cannot be read" in response.json()["detail"]
+
+
+def test_machine_settings_override_their_class_and_operation_type(tmp_path):
+    fleet = {
+        "operation_durations": {"ServePlate96": 5, "transport": {"distribution": "uniform", "low": 1, "high": 3}},
+        "machine_classes": {"TecanFluent480": {"duration": {"distribution": "fixed", "seconds": 2}, "setup": 0.5, "teardown": 1.0}},
+        "machines": [
+            {"id": "fluent", "class": "TecanFluent480"},
+            {"id": "fast_fluent", "class": "TecanFluent480", "duration": 1, "capacity": 2},
+            {"id": "server", "class": "HumanPlateServer"},
+        ],
+    }
+    fluent, fast_fluent, server = MachineRegistry.build_machines(fleet, {})
+    assert (fluent.expected_seconds(), fluent.occupied_seconds(), fluent.capacity) == (2.5, 3.5, 1)
+    assert (fast_fluent.expected_seconds(), fast_fluent.capacity) == (1.5, 2)
+    assert server.expected_seconds() == 5.0
+    assert MachineRegistry.build_durations(fleet)["transport"].mean() == 2.0
@@ -0,0 +1,51 @@
+from threading import Lock
+from time import sleep
+import pytest
+from executor import execute_dag
+from scheduler import CycleError
+
+
+def test_tasks_run_after_their_predecessors_and_in_parallel():
+    lock = Lock()
+    events = []
+    running = [0, 0]
+
+    def task(node):
+        def run():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+                events.append(("start", node))
+            sleep(0.02)
+            with lock:
+                running[0] -= 1
+                events.append(("end", node))
+        return run
+
+    edges = [(0, 1), (0, 2), (0, 3), (1, 4), (2, 4), (3, 4)]
+    execute_dag({node: task(node) for node in range(5)}, edges, max_workers=3)
+    for source, destination in edges:
+        assert events.index(("end", source)) < events.index(("start", destination))
+    assert running[1] == 3
+
+
+def test_ready_tasks_are_dispatched_in_the_given_order():
+    started = []
+    execute_dag({node: lambda node=node: started.append(node) for node in range(4)}, [], max_workers=1, order=[2, 0, 3, 1])
+    assert started == [2, 0, 3, 1]
+
+
+def test_a_failing_task_stops_the_run():
+    started = []
+
+    def fail():
+        raise RuntimeError("jammed")
+
+    with pytest.raises(RuntimeError, match="jammed"):
+        execute_dag({0: fail, 1: lambda: started.append(1)}, [(0, 1)], max_workers=2)
+    assert started == []
+
+
+def test_cycles_are_reported():
+    with pytest.raises(CycleError):
+        execute_dag({0: lambda: None, 1: lambda: None, 2: lambda: None}, [(0, 1), (1, 2), (2, 1)], max_workers=2)
@@ -0,0 +1,48 @@
+from fair_share import FairQueue, WaitStats
+
+
+def drain(queue):
+    taken = []
+    while len(queue):
+        taken.append(queue.pop())
+    return taken
+
+
+def test_a_backlog_does_not_delay_other_tenants():
+    queue = FairQueue()
+    for index in range(5):
+        queue.push(f"a{index}", "a")
+    queue.push("b0", "b")
+    queue.push("b1", "b")
+    assert [item for item, _ in drain(queue)] == ["a0", "b0", "a1", "b1", "a2", "a3", "a4"]
+
+
+def test_shares_follow_weights_and_costs():
+    queue = FairQueue(weights={"heavy": 2})
+    for index in range(6):
+        queue.push(index, "heavy")
+        queue.push(index, "light")
+    first = [tenant for _, tenant in drain(queue)][:6]
+    assert first.count("heavy") == 4
+    queue.push("long", "a", cost=3.0)
+    queue.push("next", "a")
+    for index in range(3):
+        queue.push(index, "b")
+    assert [tenant for _, tenant in drain(queue)] == ["a", "b", "b", "b", "a"]
+
+
+def test_higher_priorities_go_first_and_depths_are_tracked():
+    queue = FairQueue()
+    queue.push("low", "a")
+    queue.push("urgent", "b", priority=1)
+    assert queue.depths() == {"a": 1, "b": 1}
+    assert queue.pop() == ("urgent", "b")
+    assert queue.depth("b") == 0 and queue.depths() == {"a": 1}
+
+
+def test_wait_stats_per_tenant():
+    stats = WaitStats(max_samples=3)
+    for seconds in [1.0, 2.0, 3.0, 4.0]:
+        stats.observe("a", seconds)
+    summary = stats.stats()["a"]
+    assert summary["count"] == 4 and summary["max_wait_seconds"] == 4.0 and summary["mean_wait_seconds"] == 3.0
@@ -0,0 +1,44 @@
+import time
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from conftest import REPO_ROOT
+from forecast import forecast, simulate_replicas
+
+
+@pytest.fixture(scope="module")
+def workload(lab, compiled):
+    machines = lab.machine_registry.snapshot.machines
+    return lab.build_workload([compiled], [3], machines, durations=lab.machine_registry.snapshot.durations)
+
+
+def test_replicas_do_not_depend_on_how_they_are_split(workload):
+    whole = simulate_replicas(workload, 42, 0, 20)
+    parts = [simulate_replicas(workload, 42, first, first + 5) for first in range(0, 20, 5)]
+    for key in whole:
+        np.testing.assert_array_equal(whole[key], np.concatenate([part[key] for part in parts]))
+
+
+def test_the_same_seed_gives_the_same_forecast_on_worker_processes(workload):
+    in_process = forecast(workload, 40, seed=7)
+    on_workers = forecast(workload, 40, seed=7, max_workers=2, chunk_size=10)
+    assert on_workers == in_process
+    assert in_process["runs"] == 3
+    makespan = in_process["makespan_seconds"]
+    assert 0 < makespan["p50"] <= makespan["p99"] <= makespan["max"]
+    assert all(0 < machine["utilization"]["mean"] <= 1 for machine in in_process["machines"].values())
+
+
+def test_forecasts_are_queued_and_reported(lab):
+    client = TestClient(lab.app)
+    response = client.post("/forecasts", params={"replicas": 50, "seed": 1}, data={"runs": "[2]"}, files=[
+        ("protocol_yaml", ("protocol.yaml", (REPO_ROOT / "protocol.yaml").read_bytes())),
+        ("manipulate_yaml", ("manipulate.yaml", (REPO_ROOT / "manipulate.yaml").read_bytes())),
+    ])
+    assert response.status_code == 200, response.text
+    forecast_id = response.json()["forecast_id"]
+    deadline = time.monotonic() + 30
+    while (report := client.get(f"/forecasts/{forecast_id}").json())["status"] not in ("completed", "failed"):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert report["status"] == "completed", report
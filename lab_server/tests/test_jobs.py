@@ -0,0 +1,47 @@
+import logging
+import time
+from jobs import JobQueue, QueueFull
+import pytest
+
+
+def wait_for(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.status not in ("completed", "failed"):
+        assert time.monotonic() < deadline, f"job {job.run_id} is still {job.status}"
+        time.sleep(0.01)
+
+
+def test_failed_job_is_logged_and_reported(caplog):
+    def fail():
+        raise RuntimeError("machine jammed")
+
+    queue = JobQueue(num_workers=1)
+    queue.start()
+    try:
+        with caplog.at_level(logging.ERROR, logger="jobs"):
+            job = queue.submit(1, fail)
+            wait_for(job)
+    finally:
+        queue.stop()
+    assert job.status == "failed"
+    assert job.error == "RuntimeError: machine jammed"
+    assert any(record.exc_info and "Job 1 failed" in record.getMessage() for record in caplog.records)
+
+
+def test_result_of_target_is_kept():
+    queue = JobQueue(num_workers=1)
+    queue.start()
+    try:
+        job = queue.submit(1, lambda: 42)
+        wait_for(job)
+    finally:
+        queue.stop()
+    assert job.status == "completed" and job.result == 42
+
+
+def test_queued_runs_are_capped_per_tenant():
+    queue = JobQueue(num_workers=1, max_queued_runs=2)
+    queue.submit_batch([1, 2], lambda: None, tenant="a")
+    with pytest.raises(QueueFull):
+        queue.submit(3, lambda: None, tenant="a")
+    queue.submit(4, lambda: None, tenant="b")
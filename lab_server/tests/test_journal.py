@@ -0,0 +1,66 @@
+import sqlite3
+import pytest
+from journal import JournalShipper, LogJournal
+from log_batch import LogWriteBuffer
+from log_store import SqliteLogStore
+
+
+class UnreachableStore:
+    def create(self, resource, records):
+        raise ConnectionError("log server is down")
+
+    def update_many(self, resource, updates):
+        raise ConnectionError("log server is down")
+
+
+def journal_a_run(journal: LogJournal):
+    run_id = journal.new_id()
+    journal.create("runs", [{"project_id": 1, "status": "queued"}], ids=[run_id])
+    process_ids = [journal.new_id() for _ in range(5)]
+    journal.create("processes", [{"name": f"process{index}", "run_id": run_id} for index in range(5)], ids=process_ids)
+    journal.update("runs", run_id, status="completed")
+    return run_id
+
+
+def rows(path, query):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(query).fetchall()
+    finally:
+        connection.close()
+
+
+def test_the_journal_is_shipped_once_across_restarts(tmp_path):
+    journal = LogJournal(tmp_path / "journal", segment_bytes=256)
+    journal.open()
+    store = SqliteLogStore(tmp_path / "log.sqlite3")
+    shipper = JournalShipper(journal, LogWriteBuffer(UnreachableStore()), poll_interval=3600)
+    shipper.start()
+    run_id = journal_a_run(journal)
+    assert len(journal.segments()) > 1
+    with pytest.raises(ConnectionError):
+        shipper.ship()
+    shipper.stop()
+
+    # 再起動: 送れていなかった分だけを送る
+    shipper = JournalShipper(journal, LogWriteBuffer(store), poll_interval=3600)
+    shipper.start()
+    assert shipper.ship() > 0
+    shipper.stop()
+    shipper = JournalShipper(journal, LogWriteBuffer(store), poll_interval=3600)
+    shipper.start()
+    assert shipper.ship() == 0
+    second_run = journal_a_run(journal)
+    shipper.stop()
+    journal.close()
+    store.close()
+
+    assert shipper.resolve(run_id) != shipper.resolve(second_run)
+    assert rows(tmp_path / "log.sqlite3", "SELECT id, status FROM runs ORDER BY id") == [
+        (shipper.resolve(run_id), "completed"), (shipper.resolve(second_run), "completed")
+    ]
+    assert rows(tmp_path / "log.sqlite3", "SELECT run_id, COUNT(*) FROM processes GROUP BY run_id") == [
+        (shipper.resolve(run_id), 5), (shipper.resolve(second_run), 5)
+    ]
+    # 送り終わったセグメントは消える
+    assert journal.segments() == [journal.current_segment]
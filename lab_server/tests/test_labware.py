@@ -0,0 +1,34 @@
+import yaml
+from conftest import REPO_ROOT
+
+
+def protocol_through_a_builtin():
+    protocol = yaml.safe_load((REPO_ROOT / "protocol.yaml").read_text())
+    protocol["operations"].insert(1, {"id": "spot_array1", "type": "LabwareToSpotArray"})
+    for connection in protocol["connections"]:
+        if connection["input"] == ["serve_plate1", "value"]:
+            connection["output"] = ["spot_array1", "in1"]
+    protocol["connections"].append({"input": ["spot_array1", "out1"], "output": ["dispense_liquid1", "in1"], "is_data": False})
+    return protocol
+
+
+def test_builtin_operations_run_without_a_machine_and_labware_moves_through_them(lab):
+    compiled = lab.compile_upload(yaml.safe_dump(protocol_through_a_builtin()).encode(), (REPO_ROOT / "manipulate.yaml").read_bytes())
+    machines = lab.machine_registry.snapshot.machines
+    _, operation_list, _ = lab.compile_protocol(None, compiled.protocol, machines, template=compiled.template)
+    spot_array = next(operation for operation in operation_list if operation.process_name == "spot_array1")
+    assert spot_array.machine_type is None and spot_array.machine_id is None
+    assert spot_array.operation_type == "LabwareToSpotArray"
+    machine_of = {operation.process_name: operation.machine_id for operation in operation_list if not operation.is_transport}
+    transports = {operation.process_name: operation.route for operation in operation_list if operation.is_transport}
+    # serve_plate1 -> spot_array1 -> dispense_liquid1 は一つの搬送になる
+    assert len(transports) == 3
+    route = transports["spot_array1"]
+    assert (route.labware, route.source, route.via, route.destination) == (
+        "serve_plate1.value", machine_of["serve_plate1"], ["spot_array1"], machine_of["dispense_liquid1"]
+    )
+
+
+def test_protocols_through_a_builtin_run(lab, inputs, run_ids):
+    compiled = lab.compile_upload(yaml.safe_dump(protocol_through_a_builtin()).encode(), (REPO_ROOT / "manipulate.yaml").read_bytes())
+    lab.execute_run(next(run_ids), compiled, "simulated", inputs=inputs)
@@ -0,0 +1,39 @@
+import io
+import json
+import pytest
+from durations import logged_durations
+from log import OperationLog, TransportLog, export_columnar, export_ndjson, read_columnar
+
+
+def logs(count):
+    for index in range(count):
+        if index % 3:
+            log = OperationLog(f"2024-01-01T00:00:0{index % 10}", "completed", "u", "lab", "p", f"task{index}", "tecan", "e", "/storage")
+        else:
+            log = TransportLog("2024-01-01T00:00:00", "completed", "u", "lab", "p", "a", "out1", "b", "in1", "arm", "e", "/storage")
+        log.end_time = "2024-01-01T00:00:10"
+        yield log
+
+
+def test_logs_have_no_instance_dict():
+    with pytest.raises(AttributeError):
+        next(logs(2)).color = "red"
+
+
+def test_columnar_export_reads_back_every_log_of_each_kind_in_order():
+    file = io.StringIO()
+    assert export_columnar(logs(10), file, row_group_size=2) == 10
+    groups = [json.loads(line) for line in file.getvalue().splitlines()]
+    assert all(group["rows"] <= 2 for group in groups)
+    file.seek(0)
+    rows = list(read_columnar(file))
+    expected = [log.to_dict() for log in logs(10)]
+    assert sorted(rows, key=json.dumps) == sorted(expected, key=json.dumps)
+    assert [row["task_id"] for row in rows if "task_id" in row] == [log["task_id"] for log in expected if "task_id" in log]
+
+
+def test_ndjson_exports_are_what_empirical_durations_read(tmp_path):
+    path = tmp_path / "logs.ndjson"
+    with open(path, "w", encoding="utf-8") as file:
+        assert export_ndjson(logs(6), file) == 6
+    assert logged_durations(path, operator_id="tecan") == [9.0, 8.0, 6.0, 5.0]
@@ -0,0 +1,40 @@
+import pytest
+from log_batch import LogWriteBuffer
+
+
+class FakeStore:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.updates = []
+
+    def update_many(self, resource, updates):
+        if resource in self.failing:
+            raise ConnectionError(resource)
+        self.updates.append((resource, updates))
+
+
+def test_updates_of_one_record_are_sent_once():
+    store = FakeStore()
+    writer = LogWriteBuffer(store)
+    writer.update("operations", 1, status="running")
+    writer.update("operations", 1, status="done", finished_at="t")
+    writer.update("operations", 2, status="running")
+    writer.flush()
+    assert store.updates == [("operations", [
+        {"id": 1, "attributes": {"status": "done", "finished_at": "t"}},
+        {"id": 2, "attributes": {"status": "running"}},
+    ])]
+    writer.flush()
+    assert len(store.updates) == 1
+
+
+def test_unsent_updates_are_kept_behind_newer_ones():
+    store = FakeStore(failing={"runs"})
+    writer = LogWriteBuffer(store)
+    writer.update("runs", 1, status="running", started_at="t")
+    with pytest.raises(ConnectionError):
+        writer.flush()
+    writer.update("runs", 1, status="done")
+    store.failing.clear()
+    writer.flush()
+    assert store.updates == [("runs", [{"id": 1, "attributes": {"status": "done", "started_at": "t"}}])]
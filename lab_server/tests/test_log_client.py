@@ -0,0 +1,63 @@
+import asyncio
+import httpx
+import pytest
+import requests
+from benchmark.mock_log_server import MockLogServer
+from log_client import LogServerClient
+
+
+class FlakyLogServer(MockLogServer):
+    """Answers 503 to the first `failures` requests"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def handle(self, method, path, body):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                return 503, {"detail": "Service Unavailable"}
+        return super().handle(method, path, body)
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(failures=0):
+        servers.append(FlakyLogServer(failures).start())
+        return servers[-1]
+
+    yield start
+    for running in servers:
+        running.stop()
+
+
+def test_updates_are_retried_but_creates_are_not(server):
+    log_server = server(failures=1)
+    client = LogServerClient(log_server.url, retries=2, backoff_factor=0)
+    client.patch("/runs/1", json={"attribute": "status", "new_value": "running"})
+    assert log_server.records["runs"][1] == {"status": "running"}
+    log_server.failures = 1
+    with pytest.raises(requests.HTTPError):
+        client.post("/runs/", json={"name": "run"})
+    assert client.post("/runs/", json={"name": "run"}) == {"id": 1}
+    client.close()
+
+
+def test_async_requests_share_one_pooled_client(server):
+    log_server = server(failures=1)
+    client = LogServerClient(log_server.url, retries=2, backoff_factor=0)
+
+    async def requests_from_the_event_loop():
+        await client.apatch("/runs/1", json={"attribute": "status", "new_value": "done"})
+        pooled = client.async_client
+        log_server.failures = 1
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.apost("/runs/", json={"name": "run"})
+        assert client.async_client is pooled
+        await client.aclose()
+
+    asyncio.run(requests_from_the_event_loop())
+    assert log_server.records["runs"][1] == {"status": "done"}
@@ -0,0 +1,86 @@
+import pytest
+import requests
+from benchmark.mock_log_server import MockLogServer
+from log_batch import LogWriteBuffer
+from log_client import LogServerClient
+from log_store import HttpLogStore, LogStore, SqliteLogStore, create_log_store
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_writes_are_batched_when_the_log_server_has_bulk_routes(bulk):
+    log_server = MockLogServer(bulk=bulk).start()
+    try:
+        store = HttpLogStore(LogServerClient(log_server.url, backoff_factor=0))
+        writer = LogWriteBuffer(store)
+        ids = writer.create("operations", [{"name": f"operation{index}"} for index in range(3)])
+        for db_id in ids:
+            writer.update("operations", db_id, status="running")
+            writer.update("operations", db_id, status="completed", finished_at="t")
+        writer.flush()
+        assert [log_server.records["operations"][db_id] for db_id in ids] == [
+            {"name": f"operation{index}", "status": "completed", "finished_at": "t"} for index in range(3)
+        ]
+        requests = log_server.stats()["requests"]
+        if bulk:
+            assert requests == {"POST /operations/bulk": 1, "PATCH /operations/bulk": 1}
+        else:
+            # bulkがなければ1レコード・1属性ずつ、まとめた後の更新だけを送る
+            assert store.bulk_supported is False
+            assert requests["POST /operations/"] == 3 and requests["PATCH /operations/"] == 6
+    finally:
+        log_server.stop()
+
+
+class RejectingLogServer(MockLogServer):
+    def handle(self, method, path, body):
+        if path.rstrip("/").endswith("/bulk"):
+            return 422, {"detail": "Unprocessable Entity"}
+        return super().handle(method, path, body)
+
+
+def test_rejected_bulk_writes_are_raised_not_sent_one_by_one():
+    log_server = RejectingLogServer().start()
+    try:
+        store = HttpLogStore(LogServerClient(log_server.url, backoff_factor=0))
+        with pytest.raises(requests.HTTPError):
+            store.create("operations", [{"name": "operation"}])
+        with pytest.raises(requests.HTTPError):
+            store.update_many("operations", [{"id": 1, "attributes": {"status": "running"}}])
+        assert store.bulk_supported is True
+        assert "POST /operations/" not in log_server.stats()["requests"]
+    finally:
+        log_server.stop()
+
+
+def test_log_stores_implement_create_and_update_many():
+    class CreateOnly(LogStore):
+        def create(self, resource, records):
+            return []
+
+    with pytest.raises(TypeError):
+        CreateOnly()
+
+
+def test_sqlite_creates_are_idempotent_and_updates_grouped(tmp_path):
+    store = SqliteLogStore(tmp_path / "log.sqlite3")
+    records = [{"name": f"operation{index}", "status": "not started", "idempotency_key": f"L-{index}"} for index in range(3)]
+    ids = store.create("operations", records)
+    assert ids == [1, 2, 3]
+    assert store.create("operations", records[1:] + [{"name": "operation3"}]) == [2, 3, 4]
+    store.update_many("operations", [
+        {"id": 1, "attributes": {"status": "completed", "finished_at": "t"}},
+        {"id": 2, "attributes": {"status": "running"}},
+    ])
+    rows = store._connection.execute("SELECT id, status, finished_at FROM operations ORDER BY id").fetchall()
+    assert rows == [(1, "completed", "t"), (2, "running", None), (3, "not started", None), (4, None, None)]
+    with pytest.raises(ValueError, match="Unknown attributes"):
+        store.update_many("operations", [{"id": 1, "attributes": {"color": "red"}}])
+    store.close()
+
+
+def test_log_backends(tmp_path):
+    store = create_log_store("sqlite", None, tmp_path / "log.sqlite3")
+    assert isinstance(store, SqliteLogStore)
+    store.close()
+    with pytest.raises(ValueError):
+        create_log_store("postgres", None, tmp_path / "log.sqlite3")
@@ -0,0 +1,83 @@
+from pathlib import Path
+import pytest
+from lib_operator import Operator
+from machine_pool import ASSIGNMENT_POLICIES, MachinePool, assign_machines
+
+
+class FakeOperation:
+    def __init__(self, machine_type):
+        self.machine_type = machine_type
+        self.machine_id = None
+        self.reservation = None
+
+    def bind_machine(self, machine):
+        self.machine_id = machine.id
+
+
+def machines():
+    return [
+        Operator("a1", "A", [], Path("/tmp")),
+        Operator("a2", "A", [], Path("/tmp")),
+        Operator("b1", "B", [], Path("/tmp"), capacity=2, teardown=1.0),
+    ]
+
+
+@pytest.mark.parametrize("policy", sorted(ASSIGNMENT_POLICIES))
+def test_every_reservation_is_recorded_on_its_operation(policy):
+    pool = MachinePool(clock=lambda: 0.0)
+    operations = [FakeOperation("A"), FakeOperation("A"), FakeOperation(None), FakeOperation("B")]
+    assign_machines(operations, [(0, 2), (1, 2), (2, 3)], machines(), pool, ASSIGNMENT_POLICIES[policy], duration=lambda operation: 2.0)
+    reserved = {}
+    for operation in operations:
+        if operation.machine_type is None:
+            assert operation.reservation is None
+            continue
+        reservation_pool, seconds = operation.reservation
+        assert reservation_pool is pool
+        reserved[operation.machine_id] = reserved.get(operation.machine_id, 0.0) + seconds
+    for machine_id, seconds in reserved.items():
+        assert pool.load(machine_id) == pytest.approx(seconds)
+    # 2 slots: (2 s + 1 s teardown) / 2
+    assert reserved["b1"] == pytest.approx(1.5)
+
+
+def test_unknown_machine_type_is_rejected():
+    with pytest.raises(ValueError, match="No machine can run operations of type C"):
+        assign_machines([FakeOperation("C")], [], machines(), MachinePool(), ASSIGNMENT_POLICIES["least_loaded"], duration=lambda operation: 2.0)
+
+
+def test_compiling_for_a_fleet_without_a_machine_of_a_type_fails(lab, compiled):
+    machines = [machine for machine in lab.machine_registry.snapshot.machines if machine.type != "ReadAbsorbance3Colors"]
+    with pytest.raises(ValueError, match="No machine can run operations of type ReadAbsorbance3Colors"):
+        lab.compile_protocol(None, compiled.protocol, machines, template=compiled.template)
+    # 組み込みの型だけは装置なしで動く
+    assert lab.builtin_operation_types(compiled.manipulates) == {"LabwareToSpotArray"}
+
+
+def test_failed_run_releases_the_load_of_operations_that_never_ran(lab, compiled, inputs, run_ids, monkeypatch):
+    def jam(operation):
+        raise RuntimeError("machine jammed")
+
+    monkeypatch.setattr(lab.Operation, "_run", jam)
+    for run_id in [next(run_ids) for _ in range(3)]:
+        with pytest.raises(RuntimeError):
+            lab.execute_run(run_id, compiled, "realtime", inputs=inputs)
+    for machine in lab.machine_registry.snapshot.machines:
+        assert lab.machine_pool.load(machine.id) == pytest.approx(0.0)
+
+
+def test_resumed_operations_do_not_release_what_they_never_reserved(lab, compiled):
+    pool = MachinePool()
+    _, operation_list, _ = lab.compile_protocol(None, compiled.protocol, lab.machine_registry.snapshot.machines, pool=pool, template=compiled.template)
+    bound = [operation for operation in operation_list if operation.machine_id is not None]
+    for operation in operation_list:
+        operation.db_id = 1
+    resumed = [lab.Operation.from_checkpoint_state(operation.checkpoint_state()) for operation in bound]
+    for operation in resumed:
+        assert operation.reservation is None
+        operation.release_reservation()
+    assert sum(pool.load(operation.machine_id) for operation in bound) > 0
+    for operation in bound:
+        operation.release_reservation()
+        operation.release_reservation()
+    assert all(pool.load(operation.machine_id) == pytest.approx(0.0) for operation in bound)
@@ -0,0 +1,30 @@
+import json
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, Histogram
+from metrics import RunTrace, log_server_endpoint, timed
+
+
+def test_record_ids_are_not_labels():
+    assert log_server_endpoint("/operations/12") == "/operations/{id}"
+    assert log_server_endpoint("/operations/bulk") == "/operations/bulk"
+    assert log_server_endpoint("/runs/") == "/runs"
+
+
+def test_timed_blocks_are_observed_and_traced(tmp_path):
+    registry = CollectorRegistry()
+    histogram = Histogram("test_stage_seconds", "test", ["stage"], registry=registry)
+    trace = RunTrace(tmp_path, 7)
+    with timed(histogram, trace, span="execute", stage="execute"):
+        pass
+    assert registry.get_sample_value("test_stage_seconds_count", {"stage": "execute"}) == 1
+    (span,) = [json.loads(line) for line in trace.path.read_text().splitlines()]
+    assert span["name"] == "execute" and span["stage"] == "execute" and span["start"] <= span["end"]
+
+
+def test_requests_are_exported_by_route(lab):
+    client = TestClient(lab.app)
+    client.get("/machines")
+    client.get("/no/such/route")
+    metrics = client.get("/metrics").text
+    assert 'lab_server_request_seconds_count{endpoint="/machines",method="GET",status="200"}' in metrics
+    assert 'endpoint="unmatched",method="GET",status="404"' in metrics
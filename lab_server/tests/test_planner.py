@@ -0,0 +1,41 @@
+import pytest
+from planner import plan_run
+
+
+class PlannedOperation:
+    def __init__(self, name, machine_id, teardown_seconds=0.0):
+        self.name = self.process_name = name
+        self.machine_id = machine_id
+        self.machine = None
+        self.is_transport = False
+        self.teardown_seconds = teardown_seconds
+
+
+def test_waits_for_a_busy_machine_are_on_the_critical_path():
+    # a と b は同じ装置、c は a の後に別の装置で短く動く
+    operations = [PlannedOperation("a", "m"), PlannedOperation("b", "m"), PlannedOperation("c", "n")]
+    durations = {0: 4.0, 1: 3.0, 2: 1.0}
+    plan = plan_run(operations, [(0, 2)], duration=durations.__getitem__, order=[0, 1, 2])
+    assert plan.times == {0: (0.0, 4.0), 1: (4.0, 7.0), 2: (4.0, 5.0)}
+    assert plan.makespan == 7.0
+    assert plan.critical_path == [0, 1]
+    report = plan.to_dict()
+    assert report["bottleneck"] == "m"
+    assert report["machines"]["m"]["utilization"] == pytest.approx(1.0)
+    assert report["max_parallelism"] == 2
+
+
+def test_teardown_keeps_the_slot_but_not_the_successors():
+    operations = [PlannedOperation("a", "m", teardown_seconds=2.0), PlannedOperation("b", "m"), PlannedOperation("c", None)]
+    plan = plan_run(
+        operations, [(0, 2)], duration=lambda node: 1.0, order=[0, 1, 2],
+        teardown=lambda node: operations[node].teardown_seconds
+    )
+    assert plan.times[2] == (1.0, 2.0)
+    assert plan.times[1] == (3.0, 4.0)
+
+
+def test_plans_of_the_repository_protocol(lab, compiled):
+    plan = lab.plan_protocol(compiled, lab.machine_registry.snapshot.machines)
+    assert plan.makespan == pytest.approx(plan.times[plan.critical_path[-1]][1])
+    assert plan.critical_path[0] in [node for node, (start, _) in plan.times.items() if start == 0.0]
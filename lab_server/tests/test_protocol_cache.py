@@ -0,0 +1,56 @@
+from pathlib import Path
+import logging
+import os
+import subprocess
+import sys
+from protocol_cache import ProtocolCache
+from conftest import REPO_ROOT
+
+LAB_SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_entries_are_evicted_least_recently_used_first():
+    cache = ProtocolCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+
+RELOAD_SCRIPT = """
+import sys
+import lab_server
+protocol, manipulate = (open(path, "rb").read() for path in sys.argv[1:3])
+key = lab_server.ProtocolCache.key("protocol", "manipulate", lab_server.TEMPLATE_FORMAT)
+if sys.argv[3] == "put":
+    lab_server.protocol_cache.put(key, lab_server.compile_upload(protocol, manipulate))
+else:
+    compiled = lab_server.protocol_cache.get(key)
+    assert lab_server.protocol_cache.stats()["corrupt_entries"] == 0
+    assert isinstance(compiled, lab_server.CompiledProtocol)
+    assert compiled.template.schedule.order == lab_server.compile_upload(protocol, manipulate).template.schedule.order
+"""
+
+
+def test_compiled_protocols_survive_a_restart(tmp_path):
+    # 再起動と同じく別プロセスでlab_serverのimport中に読み戻す
+    environment = {**os.environ, "PROTOCOL_CACHE_DIR": str(tmp_path)}
+    for step in ("put", "get"):
+        subprocess.run(
+            [sys.executable, "-c", RELOAD_SCRIPT, str(REPO_ROOT / "protocol.yaml"), str(REPO_ROOT / "manipulate.yaml"), step],
+            cwd=LAB_SERVER_DIR, env=environment, check=True
+        )
+    assert len(list(tmp_path.glob("*.pickle"))) == 1
+
+
+def test_corrupt_persisted_entry_is_logged_counted_and_evicted(tmp_path, caplog):
+    ProtocolCache(persist_dir=tmp_path).put("good", 1)
+    (tmp_path / "bad.pickle").write_bytes(b"not a pickle")
+    with caplog.at_level(logging.WARNING, logger="protocol_cache"):
+        cache = ProtocolCache(persist_dir=tmp_path)
+    assert cache.get("good") == 1
+    assert cache.stats()["corrupt_entries"] == 1
+    assert not (tmp_path / "bad.pickle").exists()
+    assert any("bad.pickle" in record.getMessage() for record in caplog.records)
@@ -0,0 +1,21 @@
+from registry import MachineRegistry
+
+
+def write_config(tmp_path):
+    (tmp_path / "manipulate.yaml").write_text("- name: ServePlate96\n  output:\n    - id: value\n")
+    (tmp_path / "machines.yaml").write_text(
+        "manipulate_file: manipulate.yaml\n"
+        "machines:\n"
+        "  - {id: server, class: HumanPlateServer}\n"
+        "  - {id: reader, type: ReadAbsorbance3Colors, capacity: 2}\n"
+    )
+    return MachineRegistry(tmp_path / "machines.yaml")
+
+
+def test_machines_are_built_from_the_config(tmp_path):
+    snapshot = write_config(tmp_path).snapshot
+    assert [(machine.id, machine.type, machine.capacity) for machine in snapshot.machines] == [
+        ("server", "ServePlate96", 1), ("reader", "ReadAbsorbance3Colors", 2)
+    ]
+    assert snapshot.machines[0].task_output == ["value"]
+
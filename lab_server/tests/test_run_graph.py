@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from executor import execute_dag
+from run_graph import RunGraph
+from scheduler import create_schedule
+
+
+def operation(name, process_name, is_transport=False, **attributes):
+    return SimpleNamespace(name=name, process_name=process_name, is_transport=is_transport, **attributes)
+
+
+def test_edges_are_deduplicated_and_sorted():
+    graph = RunGraph([operation("a", "p0"), operation("b", "p1"), operation("c", "p2")], [(1, 2), (0, 1), (1, 2), (0, 2)])
+    assert len(graph) == 3
+    assert graph.edges() == [(0, 1), (0, 2), (1, 2)]
+    assert graph.schedule is None
+
+
+def test_adjacency_arrays_in_both_directions():
+    graph = RunGraph([operation(str(node), f"p{node}") for node in range(4)], [(0, 1), (0, 2), (1, 3), (2, 3)])
+    assert list(graph.successors(0)) == [1, 2]
+    assert list(graph.successors(3)) == []
+    assert list(graph.predecessors(3)) == [1, 2]
+    assert graph.indegrees() == [0, 1, 1, 2]
+    assert create_schedule(graph).levels == [[0], [1, 2], [3]]
+
+
+def test_operations_are_indexed_by_process_name_and_db_id():
+    graph = RunGraph([
+        operation("transfer", "p0", db_id=10),
+        operation("transport", "p0", is_transport=True, db_id=11),
+        operation("transfer", "p1", db_id=12),
+    ], [(0, 1), (1, 2)])
+    assert graph.by_process_name == {"p0": 0, "p1": 2}
+    assert graph.by_name == {"transfer": [0, 2], "transport": [1]}
+    assert graph.by_db_id == {10: 0, 11: 1, 12: 2}
+    graph.operations[2].db_id = 20
+    graph.reindex_db_ids()
+    assert graph.by_db_id[20] == 2
+
+
+def test_tasks_of_a_resumed_run_walk_the_graph_without_the_completed_nodes():
+    graph = RunGraph([operation(str(node), f"p{node}") for node in range(3)], [(0, 1), (1, 2)])
+    started = []
+    execute_dag({node: lambda node=node: started.append(node) for node in (1, 2)}, graph, max_workers=2)
+    assert started == [1, 2]
@@ -0,0 +1,28 @@
+import pytest
+from scheduler import CycleError, create_schedule
+
+
+def test_levels_start_times_and_critical_path():
+    durations = {"a": 1.0, "b": 5.0, "c": 2.0, "d": 1.0, "e": 1.0}
+    schedule = create_schedule([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")], durations, nodes=["e"])
+    assert schedule.levels == [["e", "a"], ["b", "c"], ["d"]]
+    assert schedule.earliest_start == {"a": 0.0, "e": 0.0, "b": 1.0, "c": 1.0, "d": 6.0}
+    assert schedule.makespan == 7.0
+    assert schedule.critical_path == ["a", "b", "d"]
+    assert schedule.slack["c"] == 3.0 and schedule.slack["e"] == 6.0
+    assert schedule.priority_order()[:3] == ["a", "b", "d"]
+    assert schedule.max_parallelism == 2
+
+
+def test_long_chains_do_not_recurse():
+    schedule = create_schedule([(node, node + 1) for node in range(20_000)])
+    assert schedule.order == list(range(20_001))
+    assert schedule.makespan == 20_001.0
+
+
+def test_cycles_are_reported_without_the_nodes_below_them():
+    with pytest.raises(CycleError) as error:
+        create_schedule([("start", "a"), ("a", "b"), ("b", "c"), ("c", "a"), ("c", "end")])
+    assert error.value.nodes == ["a", "b", "c"]
+    cycle = error.value.cycle
+    assert cycle[0] == cycle[-1] and sorted(cycle[:-1]) == ["a", "b", "c"]
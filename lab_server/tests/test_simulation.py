@@ -0,0 +1,45 @@
+import pytest
+from simulation import EventScheduler, VirtualClock, simulate_dag
+
+
+def simulate(nodes, edges, **kwargs):
+    scheduler = EventScheduler(VirtualClock(0.0))
+    times = simulate_dag(nodes, edges, scheduler=scheduler, **kwargs)
+    scheduler.run()
+    return times
+
+
+def test_operations_on_one_machine_wait_for_each_other():
+    times = simulate(range(3), [], duration=lambda node: 10.0, machine=lambda node: "m", order=[2, 1, 0])
+    assert times == {2: (0.0, 10.0), 1: (10.0, 20.0), 0: (20.0, 30.0)}
+
+
+def test_successors_start_when_their_predecessors_finish():
+    times = simulate(range(3), [(0, 2), (1, 2)], duration=lambda node: float(node + 1))
+    assert times[2] == (2.0, 5.0)
+
+
+def test_simulated_runs_leave_the_realtime_pool_alone(lab, compiled, inputs, run_ids):
+    before = {machine.id: lab.machine_pool.available_at(machine.id) for machine in lab.machine_registry.snapshot.machines}
+    loads = {machine_id: lab.machine_pool.load(machine_id) for machine_id in before}
+    for _ in range(10):
+        lab.execute_sweep([next(run_ids), next(run_ids)], compiled, [{"volume": [1.0]}] * 2, "simulated")
+        lab.execute_run(next(run_ids), compiled, "simulated", inputs=inputs)
+    for machine_id in before:
+        # 何も予約されていなければavailable_atは現在時刻
+        assert lab.machine_pool.available_at(machine_id) == pytest.approx(before[machine_id], abs=5.0)
+        assert lab.machine_pool.load(machine_id) == pytest.approx(loads[machine_id])
+
+
+def test_machines_run_as_many_operations_as_they_have_slots():
+    times = simulate(range(3), [], duration=lambda node: 10.0, machine=lambda node: "m", order=[0, 1, 2], capacity=lambda machine: 2)
+    assert times == {0: (0.0, 10.0), 1: (0.0, 10.0), 2: (10.0, 20.0)}
+
+
+def test_teardown_holds_the_slot_while_successors_go_on():
+    times = simulate(
+        range(3), [(0, 1)], duration=lambda node: 10.0, machine=lambda node: "m" if node != 1 else None,
+        order=[0, 2, 1], teardown=lambda node: 5.0 if node == 0 else 0.0
+    )
+    assert times[1] == (10.0, 20.0)
+    assert times[2] == (15.0, 25.0)
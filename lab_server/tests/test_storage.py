@@ -0,0 +1,96 @@
+from pathlib import Path
+from threading import Event
+import time
+import pytest
+from storage import StorageError, StorageWriter, sharded_path
+
+
+def test_records_are_sharded_by_the_start_of_their_id():
+    assert sharded_path("/storage", "operations", "L-3fa2c0") == Path("/storage/operations/3f/a2/L-3fa2c0")
+    assert sharded_path("/storage", "runs", 7) == Path("/storage/runs/00/07/7")
+
+
+def test_artifacts_are_served_from_memory_until_written(tmp_path):
+    writer = StorageWriter(fsync=False)
+    path = tmp_path / "operations" / "log.txt"
+    writer.write(path, "first")
+    writer.write(path, "second")
+    assert not path.exists()
+    assert writer.read(path) == b"second"
+    writer.flush()
+    assert path.read_bytes() == b"second" and writer.pending(path) is None
+    assert writer.stats()["written_files"] == 1
+
+
+def test_the_background_thread_writes_in_batches(tmp_path):
+    writer = StorageWriter(max_batch_files=4, fsync=True)
+    writer.start()
+    try:
+        for index in range(10):
+            writer.write(tmp_path / str(index % 3) / f"{index}.txt", str(index))
+        writer.flush()
+    finally:
+        writer.stop()
+    assert sorted(int(path.stem) for path in tmp_path.glob("*/*.txt")) == list(range(10))
+    stats = writer.stats()
+    assert stats["pending_files"] == 0 and stats["written_files"] == 10 and stats["batches"] >= 3
+
+
+def test_failed_writes_stay_pending_and_are_retried(tmp_path):
+    blocker = tmp_path / "blocked"
+    blocker.write_text("a file where a directory should be")
+    writer = StorageWriter(fsync=False)
+    path = blocker / "log.txt"
+    writer.write(path, "kept")
+    assert writer._write_batch() is False
+    assert writer.stats()["last_error"] and writer.read(path) == b"kept"
+    blocker.unlink()
+    writer.flush()
+    assert path.read_text() == "kept" and writer.stats()["last_error"] is None
+
+
+def test_flush_raises_when_a_batch_fails(tmp_path):
+    blocker = tmp_path / "blocked"
+    blocker.write_text("a file where a directory should be")
+    writer = StorageWriter(fsync=False)
+    writer.write(blocker / "log.txt", "kept")
+    with pytest.raises(StorageError, match="could not be written"):
+        writer.flush()
+    writer.start()
+    try:
+        with pytest.raises(StorageError, match="could not be written"):
+            writer.flush()
+    finally:
+        writer.stop()
+    assert writer.read(blocker / "log.txt") == b"kept"
+
+
+def test_flush_and_stop_give_up_on_a_stalled_writer(tmp_path, monkeypatch):
+    stalled = Event()
+    writer = StorageWriter(fsync=False, flush_timeout=0.1)
+    # fsyncから戻らないディスク
+    monkeypatch.setattr(writer, "_write_batch", lambda: not stalled.wait())
+    writer.start()
+    try:
+        writer.write(tmp_path / "log.txt", "stalled")
+        with pytest.raises(TimeoutError):
+            writer.flush()
+        started = time.monotonic()
+        writer.stop()
+        assert time.monotonic() - started < 1.0
+    finally:
+        stalled.set()
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_flush_raises_when_the_writer_thread_died(tmp_path, monkeypatch):
+    writer = StorageWriter(fsync=False)
+
+    def crash():
+        raise MemoryError("writer thread crashed")
+
+    monkeypatch.setattr(writer, "_write_batch", crash)
+    writer.start()
+    writer.write(tmp_path / "log.txt", "lost")
+    writer._thread.join(5.0)
+    with pytest.raises(StorageError, match="died"):
+        writer.flush()
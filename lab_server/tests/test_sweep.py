@@ -0,0 +1,46 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from conftest import REPO_ROOT
+
+
+def test_grids_expand_to_every_combination(lab):
+    assert lab.expand_sweep({"grid": {"volume": [[1.0], [2.0]], "channel": [0, 1]}}) == [
+        {"volume": [1.0], "channel": 0}, {"volume": [1.0], "channel": 1},
+        {"volume": [2.0], "channel": 0}, {"volume": [2.0], "channel": 1},
+    ]
+    assert lab.expand_sweep({"runs": [{"volume": [1.0]}]}) == [{"volume": [1.0]}]
+    with pytest.raises(ValueError):
+        lab.expand_sweep({"runs": [], "grid": {}})
+
+
+def test_inputs_take_their_defaults_and_are_type_checked(lab, compiled):
+    assert lab.bind_inputs(compiled.protocol, {"volume": [1, 2.5]}) == {"volume": [1, 2.5], "channel": 0}
+    with pytest.raises(ValueError, match="has no value"):
+        lab.bind_inputs(compiled.protocol, {})
+    with pytest.raises(ValueError, match="must be Integer"):
+        lab.bind_inputs(compiled.protocol, {"volume": [1.0], "channel": 1.5})
+    with pytest.raises(ValueError, match="Unknown inputs"):
+        lab.bind_inputs(compiled.protocol, {"volume": [1.0], "colour": 1})
+
+
+def test_a_sweep_runs_once_per_binding(lab):
+    client = TestClient(lab.app)
+    response = client.post(
+        "/run_sweep",
+        params={"project_id": 1, "protocol_name": "sweep", "user_id": 1, "execution_mode": "simulated"},
+        data={"sweep": '{"grid": {"volume": [[10.0], [20.0], [30.0]]}}'},
+        files={
+            "protocol_yaml": ("protocol.yaml", (REPO_ROOT / "protocol.yaml").read_bytes()),
+            "manipulate_yaml": ("manipulate.yaml", (REPO_ROOT / "manipulate.yaml").read_bytes()),
+        },
+    )
+    assert response.status_code == 200, response.text
+    run_ids = response.json()["run_ids"]
+    assert len(run_ids) == 3
+    deadline = time.monotonic() + 10
+    while (status := client.get(f"/runs/{run_ids[0]}/status").json()["status"]) not in ("completed", "failed"):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert status == "completed"
+    assert {client.get(f"/runs/{run_id}/status").json()["status"] for run_id in run_ids} == {"completed"}
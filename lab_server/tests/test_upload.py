@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+from io import BytesIO
+import pytest
+import yaml
+from fastapi import HTTPException, UploadFile
+from util import load_yaml, YamlTooLargeError
+
+
+def upload(name, data):
+    return UploadFile(BytesIO(data), filename=name)
+
+
+def test_upload_is_hashed_and_joined_once(lab):
+    data = b"operations: []\n" + b"# padding\n" * (3 * lab.UPLOAD_CHUNK_BYTES // 10)
+    md5, contents = asyncio.run(lab.read_upload(upload("protocol.yaml", data)))
+    assert md5 == hashlib.md5(data).hexdigest()
+    assert contents == data and isinstance(contents, bytes)
+    assert lab.parse_uploaded_yaml(contents) == {"operations": []}
+
+
+def test_oversized_upload_is_rejected(lab, monkeypatch):
+    monkeypatch.setattr(lab, "MAX_UPLOAD_BYTES", 10)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(lab.read_upload(upload("protocol.yaml", b"x" * 11)))
+    assert error.value.status_code == 413
+
+
+def test_only_yaml_files_are_accepted(lab):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(lab.read_upload(upload("protocol.json", b"{}")))
+    assert error.value.status_code == 400
+
+
+def test_compiling_an_upload_leaves_the_registered_machines_alone(lab):
+    snapshot = lab.machine_registry.snapshot
+    machines = list(snapshot.machines)
+    manipulate = b"- name: ReadAbsorbance3Colors\n  input:\n    - id: in1\n"
+    lab.compile_upload(b"operations: []\nconnections: []\n", manipulate)
+    assert lab.machine_registry.snapshot is snapshot
+    assert snapshot.machines == machines
+
+
+@pytest.mark.parametrize("document", [
+    b"operations:\n- id: step0\n  type: ServePlate96\nconnections: []\n",
+    b"a: [1, 1.5, .inf, 0x1f, 1_000, true, yes, off, ~, null, '1', \"true\", 2020-01-02, 2020-01-02 03:04:05]\n",
+    b"a: {b: {c: [[], {}]}}\nd: |\n  text\n",
+    b"1: one\ntrue: two\n~: three\n",
+    b"- 1\n- '1'\n- 1\n",
+    b"",
+    b"plain\n",
+    # 以下はcomposerで読み直す
+    b"base: &base {a: 1}\nmerged:\n  <<: *base\n  b: 2\n",
+    b"a: !!str 1\nb: !!binary aGk=\n",
+    b"? b\n: [a, b]\n",
+])
+def test_yaml_is_loaded_as_safe_load_does(document):
+    assert load_yaml(document, max_nodes=1000) == yaml.safe_load(document)
+
+
+def test_yaml_that_is_too_large_or_invalid_is_rejected():
+    with pytest.raises(YamlTooLargeError):
+        load_yaml(b"- 1\n" * 11, max_nodes=10)
+    with pytest.raises(YamlTooLargeError):
+        load_yaml(b"a: &a [1, 1, 1]\nb: [*a, *a, *a, *a]\n", max_nodes=10)
+    with pytest.raises(yaml.YAMLError):
+        load_yaml(b"a: 1\n---\nb: 2\n", max_nodes=10)
+    with pytest.raises(yaml.YAMLError):
+        load_yaml(b"? [1, 2]\n: pair\n", max_nodes=10)
@@ -1,4 +1,22 @@
 import hashlib
+import yaml
+from yaml.constructor import SafeConstructor
+from yaml.events import (
+    AliasEvent, DocumentStartEvent, MappingEndEvent, MappingStartEvent, ScalarEvent, SequenceEndEvent,
+    SequenceStartEvent, StreamEndEvent
+)
+from yaml.resolver import Resolver
+
+# libyamlがあればCのローダーを使う
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class YamlTooLargeError(ValueError):
+    pass
+
+
+class _NeedsComposer(Exception):
+    """イベントから直接組み立てられない文書（アンカー、エイリアス、タグ、マージキーなど）"""
 
 
 def calculate_md5(input_string):
@@ -24,6 +42,120 @@ def calculate_md5(input_string):
     return md5_hash.hexdigest()
 
 
+def load_yaml(data, max_nodes):
+    """
+    ノード数を制限してYAMLを読み込む関数
+    ふつうの文書はパーサのイベントから直接組み立て、ノードの木は作らない
+
+    Args:
+        data (bytes | str): YAMLの内容
+        max_nodes (int): 許可するノード数の上限（エイリアスは展開後の数で数える）
+
+    Returns:
+        object: 読み込んだデータ
+
+    Raises:
+        YamlTooLargeError: ノード数が上限を超えた場合
+    """
+    try:
+        return _load_events(data, max_nodes)
+    except _NeedsComposer:
+        return _load_nodes(data, max_nodes)
+
+
+_NO_KEY = object()
+
+
+def _load_events(data, max_nodes):
+    """タグのない文書をSafeLoaderと同じ値に組み立てる、上限を超えたところで読むのをやめる"""
+    loader = YamlLoader(data)
+    resolver = Resolver()
+    constructor = SafeConstructor()
+    # 同じ文字列のスカラーは一度だけ型を決める
+    plain_scalars = {}
+    containers = []
+    keys = []
+    root = None
+    documents = 0
+    count = 0
+    try:
+        while True:
+            event = loader.get_event()
+            kind = type(event)
+            if kind is ScalarEvent or kind is MappingStartEvent or kind is SequenceStartEvent:
+                count += 1
+                if count > max_nodes:
+                    raise YamlTooLargeError(f"YAML has more than {max_nodes} nodes")
+                if event.anchor is not None or event.tag is not None:
+                    raise _NeedsComposer
+                if kind is ScalarEvent:
+                    value = event.value
+                    if event.implicit[0]:
+                        if value in plain_scalars:
+                            value = plain_scalars[value]
+                        else:
+                            tag = resolver.resolve(yaml.ScalarNode, value, event.implicit)
+                            if tag not in SafeConstructor.yaml_constructors or tag == 'tag:yaml.org,2002:merge':
+                                raise _NeedsComposer
+                            plain_scalars[value] = SafeConstructor.yaml_constructors[tag](constructor, yaml.ScalarNode(tag, value))
+                            value = plain_scalars[value]
+                else:
+                    value = {} if kind is MappingStartEvent else []
+                if not containers:
+                    root = value
+                elif type(containers[-1]) is list:
+                    containers[-1].append(value)
+                elif keys[-1] is _NO_KEY:
+                    if kind is not ScalarEvent:
+                        raise _NeedsComposer
+                    keys[-1] = value
+                else:
+                    containers[-1][keys[-1]] = value
+                    keys[-1] = _NO_KEY
+                if kind is not ScalarEvent:
+                    containers.append(value)
+                    keys.append(_NO_KEY)
+            elif kind is MappingEndEvent or kind is SequenceEndEvent:
+                containers.pop()
+                keys.pop()
+            elif kind is AliasEvent:
+                raise _NeedsComposer
+            elif kind is DocumentStartEvent:
+                documents += 1
+                if documents > 1:
+                    # 複数の文書はcomposerにエラーを出させる
+                    raise _NeedsComposer
+            elif kind is StreamEndEvent:
+                return root
+    finally:
+        loader.dispose()
+
+
+def _load_nodes(data, max_nodes):
+    loader = YamlLoader(data)
+    try:
+        root = loader.get_single_node()
+        if root is None:
+            return None
+        # 再帰を使わずにノードを数える
+        count = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            count += 1
+            if count > max_nodes:
+                raise YamlTooLargeError(f"YAML has more than {max_nodes} nodes")
+            if isinstance(node, yaml.MappingNode):
+                for key, value in node.value:
+                    stack.append(key)
+                    stack.append(value)
+            elif isinstance(node, yaml.SequenceNode):
+                stack.extend(node.value)
+        return loader.construct_document(root)
+    finally:
+        loader.dispose()
+
+
 # 使用例
 if __name__ == "__main__":
     test_string = "Hello, World!"